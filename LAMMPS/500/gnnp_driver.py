@@ -8,20 +8,94 @@ found in the LICENSE file in the root directory of this source tree.
 from ase import Atoms
 from ase.calculators.mixing import SumCalculator
 
+import atexit
+import collections
+import contextlib
+import hashlib
+import json
 import os
+import sys
+import time
+import warnings
+import numpy as np
 import torch
 
 _USING_TORCH_DFTD3 = True
 
-def gnnp_initialize(gnnp_type, model_name = None, as_path = False, dftd3 = False, gpu = True):
+# registry of backends is shared by the drivers of all temperatures, in the parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DEFAULT_SKIN = 0.0
+
+_GRAPH_TOLERANCE = 1.0e-4
+
+_PROFILE_EVERY = 1000
+
+_RESULT_CACHE_RESOLUTION = 1.0e-6
+
+_RESPA_SAMPLE_EVERY = 10
+
+_THREADS_CACHE_DIR = os.path.join("~", ".cache", "gnnp-threads")
+
+_THREADS_BENCHMARK_CALLS = 5
+
+# slot of this process among the drivers on the host, and the file holding its lock, once claimed
+_THREADS_SLOT = {}
+
+# precisions of GNNP, and precisions of model of backend for them
+_PRECISIONS = {
+    "float64":         "float64",
+    "float32-highest": "float32-highest",
+    "float32-high":    "float32-high",
+    "bf16-autocast":   "float32-highest",
+    "int8-dynamic":    "int8-dynamic"
+}
+
+_PRECISION_TOLERANCE    = 5.0e-3
+_PRECISION_CHECK_FRAMES = 3
+_PRECISION_CHECK_EVERY  = 100
+
+def gnnp_initialize(gnnp_type, model_name = None, as_path = False, dftd3 = False, gpu = True,
+                    skin = None, profile = None, server = None, compile_cache = None,
+                    result_cache = None, respa = None, threads = None, precision = None):
     """
     Initialize GNNP.
     Args:
-        gnnp_type (str): type of GNNP. -> {matgl|chgnet|mace|mace-off|orb|mattersim|fairchem|sevennet}
+        gnnp_type (str): type of GNNP. -> {matgl|chgnet|mace|mace-off|orb|orb-onnx|mattersim|fairchem|sevennet}
         model_name (str): name of model for GNNP.
         as_path (bool): if true, model_name is path of model file. this is only for chgnet/orb/fairchem.
         dftd3 (bool): to add correction of DFT-D3.
         gpu (bool): using GPU, if possible.
+        skin (float): skin of the Verlet list for graph built by the driver, in angstroms (only for orb).
+                      if None, $GNNP_SKIN is used, and if it is not set either (or <= 0), graph is built by GNNP on every call.
+                      forces on the graph of the driver are compared with the calculator of GNNP on the first call,
+                      and the graph of the driver is not used any more if RMSE exceeds $GNNP_GRAPH_TOLERANCE eV/A.
+        profile (str): path of JSON file, to write timing breakdown per phase into.
+                       if None, $GNNP_PROFILE is used, and nothing is profiled if it is not set either.
+        server (str): path of Unix socket of a model server (python gnnp_driver.py --socket ...),
+                      that evaluates GNNP instead of this process.
+                      if None, $GNNP_SERVER is used, and the model is loaded here if it is not set either.
+        compile_cache (str): directory of cache of weights and compiled model (only for orb).
+                             if None, $GNNP_COMPILE_CACHE is used, and model is not compiled if it is not set either.
+        result_cache (int): number of results to be cached, keyed by cell, atomic numbers and positions
+                            quantized by $GNNP_RESULT_CACHE_RESOLUTION angstroms (default 1e-6).
+                            if None, $GNNP_RESULT_CACHE is used, and nothing is cached if it is not set either.
+        respa (str): path of JSON file of the classical potential (classical_llzo.py) for r-RESPA.
+                     if the file exists, energy, forces and stress are returned as GNNP minus the classical potential.
+                     if not, forces of GNNP are sampled every $GNNP_RESPA_SAMPLE_EVERY calls for fitting it.
+                     if None, $GNNP_RESPA is used, and r-RESPA is not used if it is not set either (or empty).
+                     in_LLZO sets $GNNP_RESPA from its -var respa, so that the two cannot disagree.
+        threads (str): number of intra-op threads on CPU, or "auto" to benchmark numbers of threads and
+                       affinity layouts on the first call, sharing cores with the $GNNP_DRIVERS drivers on the host.
+                       the best setting is cached per host, model, number of atoms and number of drivers.
+                       if None, $GNNP_THREADS is used, and threads of torch are not changed if it is not set either.
+        precision (str): precision of GNNP (only for orb). -> {float64|float32-highest|float32-high|bf16-autocast|int8-dynamic|auto}
+                         int8-dynamic quantizes the linear layers dynamically to int8, only on CPU.
+                         forces are compared with float64 on $GNNP_PRECISION_CHECK_FRAMES calls (every 100 calls),
+                         or batches of gnnp_compute_batch and the model server (on the first system of batch),
+                         and the precision is refused if RMSE of forces exceeds $GNNP_PRECISION_TOLERANCE eV/A.
+                         "auto" starts from the fastest precision, and falls back to more precise ones if refused.
+                         if None, $GNNP_PRECISION is used, and the default of backend is used if it is not set either.
     Returns:
         cutoff (float): cutoff radius.
         with_stress (int): to calculate stress, or not.
@@ -31,10 +105,18 @@ def gnnp_initialize(gnnp_type, model_name = None, as_path = False, dftd3 = False
     gpu    = (gpu and torch.cuda.is_available())
     device = "cuda" if gpu else "cpu"
 
+    # MPI ranks on a node are spread over its GPUs
+    if gpu and torch.cuda.device_count() > 1:
+        torch.cuda.set_device(_local_rank() % torch.cuda.device_count())
+
     # Create Calculator of GNNP, that is pre-trained
     global myCalculator
+    global myGraphModel
+    global myConnection
 
     myCalculator = None
+    myGraphModel = None
+    myConnection = None
     cutoff       = -1.0
 
     if gnnp_type is None:
@@ -42,249 +124,331 @@ def gnnp_initialize(gnnp_type, model_name = None, as_path = False, dftd3 = False
 
     gnnp_type = gnnp_type.lower()
 
-    if gnnp_type == "matgl":
-        # MatGL
-        import matgl
-        from matgl.ext.ase import PESCalculator
+    # Cache of serialized and compiled model
+    global myCompileCache
 
-        torch.set_default_device(device)
+    myCompileCache = None
 
-        if model_name is not None:
-            myPotential = matgl.load_model(model_name)
-        else:
-            myPotential = matgl.load_model("M3GNet-MP-2021.2.8-PES")
+    if compile_cache is None:
+        compile_cache = os.environ.get("GNNP_COMPILE_CACHE")
 
-        myPotential.to(device)
+    # Threads on CPU, that are tuned on the first call if "auto"
+    global myThreads
 
-        myCalculator = PESCalculator(
-            potential      = myPotential,
-            compute_stress = True,
-            stress_unit    = "eV/A3",
-            stress_weight  = 1.0
-        )
+    myThreads = None
 
-        cutoff = myPotential.model.cutoff
+    # Precision of GNNP, that is checked against float64 on the first calls
+    global myPrecision
 
-    elif gnnp_type == "chgnet":
-        # CHGNet
-        from chgnet.model import CHGNet, CHGNetCalculator
+    myPrecision = None
 
-        if model_name is None:
-            myCHGNet = CHGNet.load(use_device = device)
-        elif not as_path:
-            myCHGNet = CHGNet.load(use_device = device, model_name = model_name)
-        else:
-            myCHGNet = CHGNet.from_file(model_name)
+    if precision is None:
+        precision = os.environ.get("GNNP_PRECISION")
 
-        myCalculator = CHGNetCalculator(
-            model      = myCHGNet,
-            use_device = device
-        )
+    if threads is None:
+        threads = os.environ.get("GNNP_THREADS")
 
-        ratom  = float(myCHGNet.graph_converter.atom_graph_cutoff)
-        rbond  = float(myCHGNet.graph_converter.bond_graph_cutoff)
-        cutoff = max(ratom, rbond)
-    
-    elif gnnp_type == "sevennet":
-        from sevenn.calculator import SevenNetD3Calculator
+    # Connect to model server, instead of loading model
+    if server is None:
+        server = os.environ.get("GNNP_SERVER")
 
-        if model_name is None:
-            model_name = "7net-0"
+    if server:
+        return _connect_server(server, gnnp_type, model_name, profile, result_cache, respa)
 
-        # Build args depending on model
-        calc_kwargs = {"model": model_name, "device": device}
+    # inter-op threads can be set only before the model runs
+    if threads and not gpu:
+        myThreads = _initialize_threads(threads, gnnp_type, model_name)
 
-        if model_name == "7net-mf-ompa":
-            # This model requires modal argument
-            calc_kwargs["modal"] = "mpa"  # or "omat24", depending on what you want
+    # Load backend of GNNP, importing only its dependencies
+    global myLoadArgs
 
-        myCalculator = SevenNetD3Calculator(**calc_kwargs)
+    myLoadArgs = {
+        "gnnp_type":     gnnp_type,
+        "model_name":    model_name,
+        "as_path":       as_path,
+        "dftd3":         dftd3,
+        "gpu":           gpu,
+        "device":        device,
+        "compile_cache": compile_cache
+    }
 
-        cutoff = myCalculator.cutoff if hasattr(myCalculator, "cutoff") else 4.0
+    candidates = _precision_candidates(precision, gpu)
 
+    backend = _load_backend(candidates[0])
 
-    elif gnnp_type == "mace":
-        # MACE
-        from mace.calculators import mace_mp
+    cutoff = backend.cutoff
+    dftd3  = backend.dftd3
 
-        if model_name is None:
-            model = None
+    if backend.with_stress:
+        with_stress = 1
+    else:
+        with_stress = 0
+
+    # Add DFT-D3 to calculator without three-body term
+    global dftd3Calculator
 
-        elif model_name.startswith("mace-osaka24"):
-            base_path  = os.path.dirname (os.path.abspath(__file__))
-            model_dir  = os.path.normpath(os.path.join(base_path, "mace-osaka24"))
-            model_path = os.path.normpath(os.path.join(model_dir, model_name))
+    dftd3Calculator = None
 
-            if not model_path.endswith(".model"):
-                model_path += ".model"
+    if dftd3:
+        if _USING_TORCH_DFTD3:
+            from torch_dftd.torch_dftd3_calculator import TorchDFTD3Calculator
 
-            model = model_path
+            dftd3Calculator = TorchDFTD3Calculator(
+                xc      = "pbe",
+                damping = "zero",
+                abc     = False,
+                device  = device
+            )
 
         else:
-            model = model_name
-
-        myCalculator = mace_mp(
-            model         = model,
-            device        = device,
-            dispersion    = dftd3,
-            damping       = "zero",
-            dispersion_xc = "pbe"
-        )
+            from dftd3.ase import DFTD3
 
-        if dftd3:
-            dftd3 = False
+            dftd3Calculator = DFTD3(
+                method  = "PBE",
+                damping = "d3zero",
+                s9      = 0.0
+            )
 
-        if isinstance(myCalculator, SumCalculator):
-            cutoff = myCalculator.mixer.calcs[0].r_max
-        else:
-            cutoff = myCalculator.r_max
+    _use_backend(backend, candidates[0])
 
-    elif gnnp_type == "mace-off":
-        # MACE-OFF
-        from mace.calculators import mace_off
+    if candidates[0] not in (None, "float64"):
+        myPrecision = {
+            "precision":  candidates[0],
+            "fallbacks":  candidates[1:],
+            "tolerance":  float(os.environ.get("GNNP_PRECISION_TOLERANCE", _PRECISION_TOLERANCE)),
+            "frames":     int(os.environ.get("GNNP_PRECISION_CHECK_FRAMES", _PRECISION_CHECK_FRAMES)),
+            "calls":      0,
+            "passed":     0,
+            "reference":  None,
+            "checks":     []
+        }
 
-        myCalculator = mace_off(
-            model  = model_name,
-            device = device
-        )
+    _initialize_state(cutoff, skin, profile, gpu, result_cache, respa)
+
+    return (cutoff, with_stress)
 
-        cutoff = myCalculator.r_max
+def _precision_candidates(precision, gpu):
+    """
+    Get the precisions to be tried, from the fastest one.
+    Args:
+        precision (str): precision of GNNP, "auto", or None.
+        gpu (bool): GPU is used, or not.
+    Returns:
+        candidates (list): precisions, or [None] for the default of backend.
+    """
 
-    elif gnnp_type == "orb":
-        # Orbital Materials
-        from orb_models.forcefield import pretrained
-        from orb_models.forcefield.calculator import ORBCalculator
+    if not precision:
+        return [None]
 
-        if as_path:
-            # fine-tuned model is only for orb_v2
-            orbff = pretrained.orb_v2(
-                weights_path = model_name,
-                device       = device
-            )
+    precision = precision.lower()
 
+    # TF32 is only on GPU, so float32-high is the same as float32-highest on CPU,
+    # and quantized int8 of torch is only on CPU
+    if precision == "auto":
+        if gpu:
+            return ["bf16-autocast", "float32-high", "float32-highest", "float64"]
         else:
-            if model_name is not None and model_name in pretrained.ORB_PRETRAINED_MODELS:
-                model_func = pretrained.ORB_PRETRAINED_MODELS[model_name]
-            else:
-                model_func = pretrained.orb_v2
+            return ["int8-dynamic", "bf16-autocast", "float32-highest", "float64"]
 
-            if model_name is not None and "d3" in model_name:
-                if dftd3:
-                    dftd3 = False
+    if precision not in _PRECISIONS:
+        raise ValueError("precision is incorrect: " + precision)
 
-            orbff = model_func(device = device)
+    return [precision]
 
-        myCalculator = ORBCalculator(orbff, device=device)
+def _load_backend(precision, compile = True):
+    """
+    Load the backend of GNNP in a precision, with the arguments of gnnp_initialize.
+    Args:
+        precision (str): precision of GNNP, or None for the default of backend.
+        compile (bool): to compile the graph model, if cache of compile is given.
+    Returns:
+        backend (GNNPBackend): loaded backend.
+    """
 
-        cutoff = 6.0
+    from gnnp_backends import load_backend
 
-    elif gnnp_type == "mattersim":
-        # MatterSim
-        from mattersim.forcefield import MatterSimCalculator
+    args = myLoadArgs
 
-        myCalculator = MatterSimCalculator(
-            load_path      = model_name,
-            compute_stress = True,
-            device         = device
-        )
+    cache_dir = _compile_cache_dir(args["compile_cache"], args["gnnp_type"], args["model_name"],
+                                   precision or "default", args["device"])
 
-        cutoff = myCalculator.potential.model.model_args.get("cutoff", 5.0)
+    backend = load_backend(
+        args["gnnp_type"],
+        model_name = args["model_name"],
+        as_path    = args["as_path"],
+        dftd3      = args["dftd3"],
+        gpu        = args["gpu"],
+        device     = args["device"],
+        base_path  = os.path.dirname(os.path.abspath(__file__)),
+        cache_dir  = cache_dir,
+        precision  = _PRECISIONS[precision] if precision else None
+    )
 
-    elif gnnp_type == "fairchem":
-        # FAIR-Chem
-        from fairchem.core.common.relaxation.ase_utils import OCPCalculator
+    if compile and backend.graph_model is not None:
+        _compile_model(cache_dir, backend.graph_model)
 
-        if as_path:
-            myCalculator = OCPCalculator(
-                checkpoint_path = model_name,
-                cpu             = not gpu
-            )
+    return backend
 
-        else:
-            OMAT_CHECKPTS = {
-                "EquiformerV2-31M-OMat"          : "eqV2_31M_omat.pt",
-                "EquiformerV2-86M-OMat"          : "eqV2_86M_omat.pt",
-                "EquiformerV2-153M-OMat"         : "eqV2_153M_omat.pt",
-                "EquiformerV2-31M-MP"            : "eqV2_31M_mp.pt",
-                "EquiformerV2-31M-DeNS-MP"       : "eqV2_dens_31M_mp.pt",
-                "EquiformerV2-86M-DeNS-MP"       : "eqV2_dens_86M_mp.pt",
-                "EquiformerV2-153M-DeNS-MP"      : "eqV2_dens_153M_mp.pt",
-                "EquiformerV2-31M-OMat-Alex-MP"  : "eqV2_31M_omat_mp_salex.pt",
-                "EquiformerV2-86M-OMat-Alex-MP"  : "eqV2_86M_omat_mp_salex.pt",
-                "EquiformerV2-153M-OMat-Alex-MP" : "eqV2_153M_omat_mp_salex.pt",
-            }
+def _use_backend(backend, precision):
+    """
+    Use the calculator and the graph model of a backend, adding DFT-D3 if it is used.
+    Args:
+        backend (GNNPBackend): loaded backend.
+        precision (str): precision of GNNP, or None for the default of backend.
+    """
 
-            if model_name is not None:
-                checkpt_name = OMAT_CHECKPTS.get(model_name);
-            else:
-                checkpt_name = OMAT_CHECKPTS.get("EquiformerV2-31M-OMat");
+    global myCalculator
+    global myGraphModel
+    global gnnpCalculator
+    global myComponents
+    global myAutocast
+
+    gnnpCalculator = backend.calculator
+    myGraphModel   = backend.graph_model
 
-            if checkpt_name is not None:
-                base_path   = os.path.dirname (os.path.abspath(__file__))
-                checkpt_dir = os.path.normpath(os.path.join(base_path, "fairchem-omat24"))
-                model_path  = os.path.normpath(os.path.join(checkpt_dir, checkpt_name))
+    if dftd3Calculator is not None:
+        myCalculator = SumCalculator([gnnpCalculator, dftd3Calculator])
+    else:
+        myCalculator = gnnpCalculator
 
-                myCalculator = OCPCalculator(
-                    checkpoint_path = model_path,
-                    cpu             = not gpu
-                )
+    # Components of the sum, that are evaluated one by one w/o SumCalculator
+    if dftd3Calculator is not None:
+        myComponents = [gnnpCalculator, dftd3Calculator]
+    elif isinstance(gnnpCalculator, SumCalculator):
+        myComponents = list(gnnpCalculator.mixer.calcs)
+    else:
+        myComponents = None
 
-            else:
-                #base_path   = os.path.dirname (os.path.abspath(__file__))
-                base_path   = os.path.expanduser("~")
-                checkpt_dir = os.path.normpath(os.path.join(base_path, ".fairchem"))
+    myAutocast = torch.bfloat16 if precision == "bf16-autocast" else None
 
-                myCalculator = OCPCalculator(
-                    model_name  = model_name,
-                    local_cache = checkpt_dir,
-                    cpu         = not gpu
-                )
+def _precision_context():
+    """
+    Get the context to evaluate GNNP in, i.e. autocast of bf16 or nothing.
+    Returns:
+        context: context manager.
+    """
 
-        cutoff = myCalculator.config["model"].get("max_radius", 8.0)
+    if myAutocast is None:
+        return contextlib.nullcontext()
 
-    else:
-        raise ValueError("gnnp_type is incorrect: " + gnnp_type)
+    device_type = "cuda" if myLoadArgs["gpu"] else "cpu"
 
-    if "stress" in myCalculator.implemented_properties:
-        with_stress = 1
-    else:
-        with_stress = 0
+    return torch.autocast(device_type = device_type, dtype = myAutocast)
 
-    # Add DFT-D3 to calculator without three-body term
-    global gnnpCalculator
-    global dftd3Calculator
+def _initialize_state(cutoff, skin, profile, gpu, result_cache, respa):
+    """
+    Initialize the state of driver, that is kept between calls.
+    Args:
+        cutoff (float): cutoff radius.
+        skin (float): skin of the Verlet list for graph.
+        profile (str): path of JSON file of profile, or None.
+        gpu (bool): GPU is used, or not.
+        result_cache (int): number of results to be cached, or None.
+        respa (str): path of JSON file of the classical potential for r-RESPA, or None.
+    """
 
-    gnnpCalculator  = myCalculator
-    dftd3Calculator = None
+    # Atoms object of ASE, that is empty here
+    global myAtoms
+    global myGraphTemplate
+    global myCutoff
 
-    if dftd3:
-        if _USING_TORCH_DFTD3:
-            from torch_dftd.torch_dftd3_calculator import TorchDFTD3Calculator
+    myAtoms         = None
+    myGraphTemplate = None
+    myCutoff        = cutoff
 
-            dftd3Calculator = TorchDFTD3Calculator(
-                xc      = "pbe",
-                damping = "zero",
-                abc     = False,
-                device  = device
-            )
+    # Verlet list for graph, that is built with cutoff + skin
+    global mySkin
+    global myVerletList
+    global myGraphStats
+
+    if skin is None:
+        skin = float(os.environ.get("GNNP_SKIN", _DEFAULT_SKIN))
+
+    mySkin       = skin
+    myVerletList = None
+    myGraphStats = {"calls": 0, "builds": 0}
+
+    # graph of the driver is checked against the calculator of GNNP on the first call (None until then)
+    global myGraphPath
+    global myGraphCheck
+
+    myGraphPath  = None
+    myGraphCheck = None
+
+    # strain derivative is switched on, only when stress is needed
+    global myStressEnabled
+
+    myStressEnabled = None
+
+    # state of each replica of gnnp_compute_batch, that is swapped into the globals above
+    global myReplicas
+
+    myReplicas = {}
+
+    # LRU cache of results, e.g. for line searches of minimization
+    global myResultCache
+    global myCacheStats
+
+    if result_cache is None:
+        result_cache = int(os.environ.get("GNNP_RESULT_CACHE", 0))
+
+    myResultCache = None
+    myCacheStats  = {"hits": 0, "misses": 0}
+
+    if result_cache > 0:
+        myResultCache = {
+            "size":       result_cache,
+            "resolution": float(os.environ.get("GNNP_RESULT_CACHE_RESOLUTION", _RESULT_CACHE_RESOLUTION)),
+            "results":    collections.OrderedDict()
+        }
+
+    # Classical potential of r-RESPA, that is subtracted from GNNP or fitted to it
+    global myRespa
+
+    if respa is None:
+        respa = os.environ.get("GNNP_RESPA")
+
+    myRespa = None
+
+    if respa:
+        import classical_llzo
+
+        if os.path.isfile(respa):
+            myRespa = {
+                "mode":   "correct",
+                "params": classical_llzo.load_params(respa)
+            }
 
         else:
-            from dftd3.ase import DFTD3
+            myRespa = {
+                "mode":    "sample",
+                "path":    classical_llzo.samples_path(respa),
+                "every":   int(os.environ.get("GNNP_RESPA_SAMPLE_EVERY", _RESPA_SAMPLE_EVERY)),
+                "calls":   0,
+                "numbers": None
+            }
 
-            dftd3Calculator = DFTD3(
-                method  = "PBE",
-                damping = "d3zero",
-                s9      = 0.0
-            )
+    # Timing breakdown per phase, written every $GNNP_PROFILE_EVERY calls
+    global myProfile
 
-        myCalculator = SumCalculator([gnnpCalculator, dftd3Calculator])
+    if profile is None:
+        profile = os.environ.get("GNNP_PROFILE")
 
-    # Atoms object of ASE, that is empty here
-    global myAtoms
+    myProfile = None
 
-    myAtoms = None
+    if profile:
+        myProfile = {
+            "path":   profile,
+            "every":  int(os.environ.get("GNNP_PROFILE_EVERY", _PROFILE_EVERY)),
+            "sync":   gpu,
+            "calls":  0,
+            "start":  time.perf_counter(),
+            "call":   {},
+            "window": {},
+            "total":  {}
+        }
 
-    return (cutoff, with_stress)
+        atexit.register(_write_profile)
 
 def gnnp_get_energy_forces_stress(cell, atomic_numbers, positions, with_stress = True):
     """
@@ -293,62 +457,2132 @@ def gnnp_get_energy_forces_stress(cell, atomic_numbers, positions, with_stress =
         cell: lattice vectors in angstroms.
         atomic_numbers: atomic numbers for all atoms.
         positions: xyz coordinates for all atoms in angstroms.
-        with_stress: to return stress, if True.
+        with_stress: to return stress, if True. if False, the strain derivative is skipped by matgl, mattersim
+                     and orb on the graph of the driver (see _set_stress_enabled).
+                     pair_style gnnp/gpu passes the with_stress of gnnp_initialize on every step, not vflag of LAMMPS,
+                     so in_LLZO needs stress on every step until the C++ side passes (vflag != 0) here.
     Returns:
         energy:  total energy.
         forcces: atomic forces.
         stress:  stress tensor (Voigt order).
     """
 
-    # Initialize Atoms
-    global myAtoms
-    global myCalculator
+    start = _tic()
+    _update_atoms(cell, atomic_numbers, positions)
+    _toc("update", start)
 
-    if myAtoms is not None and len(myAtoms.numbers) != len(atomic_numbers):
-        myAtoms = None
+    energy, forces, stress = _compute_energy_forces_stress(with_stress)
 
-    if myAtoms is None:
-        myAtoms = Atoms(
-            numbers   = atomic_numbers,
-            positions = positions,
-            cell      = cell,
-            pbc       = [True, True, True]
-        )
+    start  = _tic()
+    forces = forces.tolist()
+    stress = stress.tolist() if with_stress else None
+    _toc("transfer", start)
 
-        myAtoms.calc = myCalculator
+    _profile_call()
 
-    else:
-        myAtoms.set_cell(cell)
-        myAtoms.set_atomic_numbers(atomic_numbers)
-        myAtoms.set_positions(positions)
+    if not with_stress:
+        return energy, forces
 
-    # Predicting energy, forces and stress
-    energy = myAtoms.get_potential_energy()
-    if not isinstance(energy, float):
-        energy = energy.item()
+    return energy, forces, stress
+
+def gnnp_compute_into(cell, atomic_numbers, positions, forces, stress = None, eflag = 1, vflag = 1):
+    """
+    Predict total energy, atomic forces and stress w/ pre-trained GNNP, through buffers.
+    Unlike gnnp_get_energy_forces_stress, no Python lists are created:
+    inputs are read as NumPy views of any object supporting the buffer protocol
+    (e.g. the arrays of lammps.numpy.extract_atom), and results are written into caller-owned arrays.
+    pair_style gnnp/gpu of in_LLZO calls gnnp_get_energy_forces_stress with Python lists, not this function,
+    so this is used only by a pair style that passes its arrays, i.e. PairGNNP::compute() of the C++ side
+    wrapping atom->x and atom->f (e.g. by PyMemoryView_FromMemory) and calling
+    gnnp_compute_into(cell, atomic_numbers, x, f, virial, eflag, vflag) instead.
+    Args:
+        cell: lattice vectors in angstroms, shape (3, 3).
+        atomic_numbers: atomic numbers for all atoms, shape (natom,).
+        positions: xyz coordinates in angstroms, shape (nmax, 3) with nmax >= natom.
+                   only the first natom rows are read, so ghost atoms may follow.
+        forces: output of atomic forces, float64 and C-contiguous, shape (nmax, 3) with nmax >= natom.
+                only the first natom rows are written.
+        stress: output of stress tensor (Voigt order), float64 with 6 elements, or None to skip stress.
+        eflag (int): eflag of LAMMPS. if 0, energy is not needed on this step.
+        vflag (int): vflag of LAMMPS. if 0, stress is not needed on this step, and is not written.
+                     the strain derivative is skipped then, as with_stress of gnnp_get_energy_forces_stress.
+    Returns:
+        energy: total energy, or 0.0 if eflag is 0.
+    """
 
-    forces = myAtoms.get_forces().tolist()
+    start = _tic()
 
-    if not with_stress:
-        return energy, forces
+    cell, atomic_numbers, positions, forces_out, stress_out = \
+        _as_buffer_arrays(cell, atomic_numbers, positions, forces, stress)
 
-    global gnnpCalculator
-    global dftd3Calculator
+    with_stress = (stress_out is not None) and bool(vflag)
 
-    if dftd3Calculator is None:
-        stress = myAtoms.get_stress().tolist()
-    else:
-        # to avoid the bug of SumCalculator
-        myAtoms.calc = gnnpCalculator
-        stress1 = myAtoms.get_stress()
+    _update_atoms(cell, atomic_numbers, positions)
 
-        myAtoms.calc = dftd3Calculator
-        stress2 = myAtoms.get_stress()
+    _toc("update", start)
 
-        stress = stress1 + stress2
-        stress = stress.tolist()
+    energy, forces_, stress_ = _compute_energy_forces_stress(with_stress)
 
-        myAtoms.calc = myCalculator
+    start = _tic()
 
-    return energy, forces, stress
+    forces_out[:] = forces_
+
+    if with_stress:
+        stress_out[:] = stress_
+
+    _toc("transfer", start)
+
+    _profile_call()
+
+    return energy if eflag else 0.0
+
+def gnnp_compute_with_neighbors(cell, atomic_numbers, positions, ilist, jlist, shifts,
+                                forces, stress = None, half_list = False, eflag = 1, vflag = 1):
+    """
+    Predict total energy, atomic forces and stress w/ pre-trained GNNP, on the neighbor list of LAMMPS.
+    The pairs are used as the edges of the graph, instead of building a radius graph on every call.
+    Pairs are given for local atoms, and ghost atoms are mapped onto their owners by the caller,
+    i.e. the vector of a pair is positions[j] + shifts @ cell - positions[i].
+    The list may be built with a skin (neighbor 2.0 bin), so pairs beyond cutoff are dropped here,
+    and only the nearest neighbors within the cap of the model (max_num_neighbors of orb) are kept.
+    If the GNNP cannot take a graph (only orb for now), the pairs are ignored.
+    As gnnp_compute_into, this is used only by a pair style that calls it, i.e. PairGNNP::compute() of the C++ side
+    requesting a full (or half, newton on) neighbor list and passing list->ilist / firstneigh as pairs,
+    with ghost atoms mapped onto their owners by atom->map(tag) and the image of each ghost as shifts.
+    pair_style gnnp/gpu of in_LLZO calls gnnp_get_energy_forces_stress, whose graph is built by the driver.
+    Args:
+        cell: lattice vectors in angstroms, shape (3, 3).
+        atomic_numbers: atomic numbers for all atoms, shape (natom,).
+        positions: xyz coordinates in angstroms, shape (nmax, 3) with nmax >= natom.
+        ilist: indexes of central atoms, shape (npair,).
+        jlist: indexes of neighbor atoms in [0, natom), shape (npair,).
+        shifts: periodic images of neighbor atoms, as integer multiples of lattice vectors, shape (npair, 3).
+        forces: output of atomic forces, float64 and C-contiguous, shape (nmax, 3) with nmax >= natom.
+        stress: output of stress tensor (Voigt order), float64 with 6 elements, or None to skip stress.
+        half_list (bool): if true, each pair is listed once (newton on), and is completed here.
+        eflag (int): eflag of LAMMPS. if 0, energy is not needed on this step.
+        vflag (int): vflag of LAMMPS. if 0, stress is not needed on this step, and is not written.
+    Returns:
+        energy: total energy, or 0.0 if eflag is 0.
+    """
+
+    start = _tic()
+
+    cell, atomic_numbers, positions, forces_out, stress_out = \
+        _as_buffer_arrays(cell, atomic_numbers, positions, forces, stress)
+
+    with_stress = (stress_out is not None) and bool(vflag)
+
+    _update_atoms(cell, atomic_numbers, positions)
+
+    _toc("update", start)
+
+    edges = None
+
+    if myGraphModel is not None:
+        start = _tic()
+
+        ilist  = np.asarray(ilist,  dtype = np.int64)
+        jlist  = np.asarray(jlist,  dtype = np.int64)
+        shifts = np.asarray(shifts, dtype = np.float64).reshape(-1, 3)
+
+        if half_list:
+            ilist, jlist = np.concatenate([ilist, jlist]), np.concatenate([jlist, ilist])
+            shifts       = np.concatenate([shifts, -shifts])
+
+        edges = _select_edges(positions, cell, ilist, jlist, shifts, _graph_cutoff(), _max_num_neighbors())
+
+        _toc("graph", start)
+
+    energy, forces_, stress_ = _compute_energy_forces_stress(with_stress, edges)
+
+    start = _tic()
+
+    forces_out[:] = forces_
+
+    if with_stress:
+        stress_out[:] = stress_
+
+    _toc("transfer", start)
+
+    _profile_call()
+
+    return energy if eflag else 0.0
+
+def gnnp_compute_domain(cell, atomic_numbers, positions, nlocal, forces, eflag = 1, comm = None):
+    """
+    Predict energy and forces of local atoms w/ pre-trained GNNP, under domain decomposition of LAMMPS.
+    Each MPI rank gives its local atoms followed by its ghost atoms, whose coordinates are of their images,
+    so the graph is built on them without periodic boundary, and only for the atoms of this rank.
+    The energy head of ORB is not a sum over atoms, but a function of the mean of node features over the whole system,
+    so node features of local atoms are summed over ranks by comm (see _predict_local).
+    Forces of local and ghost atoms are written as the gradient through node features of local atoms,
+    that needs the ghost atoms within gnnp_get_ghost_cutoff() (comm_modify cutoff of LAMMPS).
+    Forces of ghost atoms are summed onto their owners by the reverse communication of LAMMPS (newton_pair on),
+    and the energy is summed over ranks by LAMMPS.
+    Stress is not calculated, because virial of local atoms is not defined for the periodic system.
+    Only for conservative ORB, w/o DFT-D3, r-RESPA and model server.
+    On the first call, forces on the graph of the whole cluster are compared with the calculator of GNNP,
+    as those of gnnp_get_energy_forces_stress, and RuntimeError is raised if the graph of the driver is refused.
+    Args:
+        cell: lattice vectors in angstroms, shape (3, 3).
+        atomic_numbers: atomic numbers for local and ghost atoms, shape (nall,).
+        positions: xyz coordinates of local and ghost atoms in angstroms, shape (nmax, 3) with nmax >= nall.
+        nlocal (int): number of local atoms, that are the first ones.
+        forces: output of atomic forces of local and ghost atoms, float64 and C-contiguous,
+                shape (nmax, 3) with nmax >= nall.
+        eflag (int): eflag of LAMMPS. if 0, energy is not needed on this step.
+        comm: communicator of the ranks, whose allreduce(array) returns the sum over ranks (e.g. of mpi4py),
+              or None to use MPI.COMM_WORLD of mpi4py (or only this process, if mpi4py is not installed).
+    Returns:
+        energy: energy of local atoms, or 0.0 if eflag is 0.
+    """
+
+    if not hasattr(myGraphModel, "grad_forces_name") or myConnection is not None:
+        raise ValueError("domain decomposition is only for conservative ORB, w/o model server.")
+
+    if dftd3Calculator is not None or myRespa is not None:
+        raise ValueError("domain decomposition is not available with DFT-D3 or r-RESPA.")
+
+    start = _tic()
+
+    cell, atomic_numbers, positions, forces_out, _ = \
+        _as_buffer_arrays(cell, atomic_numbers, positions, forces, None)
+
+    nlocal = int(nlocal)
+
+    _update_atoms(cell, atomic_numbers, positions)
+
+    # ghost atoms are already placed at their images
+    myAtoms.pbc = False
+
+    _toc("update", start)
+
+    start = _tic()
+    edges = _verlet_edges(periodic = False)
+    _toc("graph", start)
+
+    # graph of the driver is checked on the whole cluster of local and ghost atoms, as gnnp_get_energy_forces_stress
+    if myGraphPath is None:
+        _check_graph_path(_predict_graphs([_build_graph(edges)], False)[0][1])
+
+    if not myGraphPath:
+        raise RuntimeError("domain decomposition is not available, since the graph of the driver is refused.")
+
+    start = _tic()
+    graph = _split_graph(_build_graph(edges), nlocal)
+    _toc("graph", start)
+
+    energy, forces_ = _predict_local(graph, nlocal, comm)
+
+    start = _tic()
+
+    forces_out[:] = forces_
+
+    _toc("transfer", start)
+
+    _profile_call()
+
+    return energy if eflag else 0.0
+
+def gnnp_get_ghost_cutoff():
+    """
+    Get the cutoff of ghost atoms, that is needed by gnnp_compute_domain.
+    Node features of local atoms depend on the atoms within (number of message passings) x (cutoff of graph).
+    If the neighbors of each atom are limited to the nearest ones, an edge depends on the other neighbors of its atom,
+    so one more cutoff is needed. The gradient w.r.t. ghost atoms is summed onto their owners by LAMMPS.
+    Returns:
+        cutoff (float): cutoff of ghost atoms in angstroms, for comm_modify cutoff of LAMMPS.
+    """
+
+    backbone = getattr(myGraphModel, "model", None)
+    steps    = getattr(backbone, "num_message_passing_steps", None)
+
+    if steps is None:
+        steps = int(os.environ.get("GNNP_MESSAGE_PASSING_STEPS", 5))
+
+    if _max_num_neighbors() is not None:
+        steps += 1
+
+    return steps * _graph_cutoff()
+
+def _predict_local(graph, nlocal, comm):
+    """
+    Predict the energy of local atoms w/ conservative ORB, and its forces on local and ghost atoms,
+    on the graph of _split_graph.
+    The energy head takes the mean (or sum) of node features h_i over all atoms, and the pair repulsion
+    takes the mean (or sum) of energies of atoms, so both are reduced over ranks by comm.
+    The energy of local atoms is then their share of the total energy, and forces are -dE/dx through h_i
+    of local atoms, with the coefficients dE/dh_i that are the same on all ranks.
+    Args:
+        graph (AtomGraphs): graph of two systems, local and ghost atoms.
+        nlocal (int): number of local atoms, that are the first ones.
+        comm: communicator of the ranks, or None (see gnnp_compute_domain).
+    Returns:
+        energy (float): energy of local atoms.
+        forces (ndarray): forces of local and ghost atoms.
+    """
+
+    global myGraphModel
+
+    model = myGraphModel
+    head  = model.heads[model.energy_name]
+
+    with torch.enable_grad(), _precision_context():
+        start = _tic()
+
+        graph.edge_features["vectors"], _, _ = graph.compute_differentiable_edge_vectors(
+            use_stress_displacement = False, use_rotation = False)
+
+        features = model.model(graph)["node_features"][:nlocal].sum(dim = 0)
+
+        # sum of node features and number of atoms over all ranks
+        values = np.append(features.detach().cpu().numpy().astype(np.float64), nlocal)
+        values = _allreduce(values, comm)
+
+        natom = values[-1]
+        total = torch.tensor(values[:-1], dtype = features.dtype, device = features.device, requires_grad = True)
+
+        aggregated  = total / natom if head.node_aggregation == "mean" else total
+        energy_head = head.normalizer.inverse(head.mlp(aggregated.unsqueeze(0))).reshape(())
+
+        if head.atom_avg:
+            energy_head = energy_head * natom
+
+        coefficients, = torch.autograd.grad(energy_head, total)
+
+        # per-atom reference energies are summed over local atoms
+        energy = head.reference(graph.atomic_numbers, graph.n_node)[0]
+
+        if getattr(model, "pair_repulsion", False):
+            energy_zbl = model.pair_repulsion_fn(graph)["energy"][0]
+
+            if model.pair_repulsion_fn.node_aggregation == "mean":
+                energy_zbl = energy_zbl * nlocal / natom
+
+            energy = energy + energy_zbl
+
+        _toc("forward", start)
+
+        start = _tic()
+
+        gradient, = torch.autograd.grad(energy + (features * coefficients).sum(), graph.node_features["positions"])
+
+        _toc("backward", start)
+
+    start = _tic()
+
+    energy = float(energy.detach()) + float(energy_head.detach()) * nlocal / natom
+    forces = -gradient.detach().cpu().numpy().astype(np.float64).reshape(-1, 3)
+
+    _toc("transfer", start)
+
+    return energy, forces
+
+def _allreduce(values, comm):
+    """
+    Sum values over the MPI ranks.
+    Args:
+        values (ndarray): values of this rank.
+        comm: communicator of the ranks, whose allreduce(array) returns the sum over ranks,
+              or None to use MPI.COMM_WORLD of mpi4py (or only this process, if mpi4py is not installed).
+    Returns:
+        values (ndarray): sum of values over ranks.
+    """
+
+    if comm is None:
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            return values
+
+        comm = MPI.COMM_WORLD
+
+    return np.asarray(comm.allreduce(values), dtype = np.float64)
+
+def _split_graph(graph, nlocal):
+    """
+    Split a graph of ORB into two systems of local and ghost atoms, that share the edges between them.
+    Edges are of the system of their senders, so the reference energy and the pair repulsion of local atoms
+    are given as those of the first system.
+    Args:
+        graph (AtomGraphs): graph of local and ghost atoms.
+        nlocal (int): number of local atoms, that are the first ones.
+    Returns:
+        graph (AtomGraphs): graph of two systems.
+    """
+
+    nall = int(graph.n_node.sum())
+
+    if nlocal >= nall:
+        return graph
+
+    device = graph.senders.device
+
+    # edges are sorted into the systems of their senders
+    order     = torch.argsort((graph.senders >= nlocal).to(torch.long), stable = True)
+    nedge     = int((graph.senders < nlocal).sum())
+    senders   = graph.senders  [order]
+    receivers = graph.receivers[order]
+
+    edge_features   = {name: value[order] for name, value in graph.edge_features.items()}
+    system_features = {name: torch.cat([value, value]) for name, value in graph.system_features.items()}
+
+    return graph._replace(
+        senders         = senders,
+        receivers       = receivers,
+        n_node          = torch.tensor([nlocal, nall - nlocal], dtype = torch.long, device = device),
+        n_edge          = torch.tensor([nedge, len(senders) - nedge], dtype = torch.long, device = device),
+        edge_features   = edge_features,
+        system_features = system_features
+    )
+
+def _local_rank():
+    """
+    Get the rank of this process among the MPI ranks on the same node.
+    Returns:
+        rank (int): local rank, or 0 if not launched by MPI.
+    """
+
+    for name in ("OMPI_COMM_WORLD_LOCAL_RANK", "MPI_LOCALRANKID", "MV2_COMM_WORLD_LOCAL_RANK", "SLURM_LOCALID"):
+        if name in os.environ:
+            return int(os.environ[name])
+
+    return 0
+
+def _as_buffer_arrays(cell, atomic_numbers, positions, forces, stress):
+    """
+    Get NumPy views of the buffers of gnnp_compute_into and gnnp_compute_with_neighbors.
+    Returns:
+        cell (ndarray): shape (3, 3).
+        atomic_numbers (ndarray): shape (natom,).
+        positions (ndarray): shape (natom, 3).
+        forces_out (ndarray): shape (natom, 3), sharing memory with forces.
+        stress_out (ndarray): shape (6,), sharing memory with stress, or None.
+    """
+
+    atomic_numbers = np.asarray(atomic_numbers)
+    natom          = len(atomic_numbers)
+
+    cell      = np.asarray(cell, dtype = np.float64).reshape(3, 3)
+    positions = np.asarray(positions, dtype = np.float64).reshape(-1, 3)[:natom]
+
+    forces_out = _as_output_array(forces, "forces").reshape(-1, 3)[:natom]
+
+    if stress is None:
+        stress_out = None
+    else:
+        stress_out = _as_output_array(stress, "stress").reshape(6)
+
+    return cell, atomic_numbers, positions, forces_out, stress_out
+
+def _select_edges(positions, cell, ilist, jlist, shifts, cutoff, max_neighbors = None):
+    """
+    Select the pairs within cutoff, as the edges of graph.
+    Args:
+        positions (ndarray): xyz coordinates in angstroms.
+        cell (ndarray): lattice vectors in angstroms.
+        ilist (ndarray): indexes of central atoms.
+        jlist (ndarray): indexes of neighbor atoms.
+        shifts (ndarray): periodic images of neighbor atoms.
+        cutoff (float): cutoff radius.
+        max_neighbors (int): to keep only the nearest neighbors of each atom, as GNNP does, or None.
+    Returns:
+        edges (tuple): senders, receivers and unit shifts of edges.
+    """
+
+    vectors = positions[jlist] + shifts @ cell - positions[ilist]
+    dist2   = np.einsum("ij,ij->i", vectors, vectors)
+
+    # self-images at zero distance are not edges
+    mask = (dist2 <= cutoff * cutoff) & (dist2 > 0.0)
+
+    ilist  = ilist [mask]
+    jlist  = jlist [mask]
+    shifts = shifts[mask]
+
+    if max_neighbors is not None:
+        dist2 = dist2[mask]
+        order = np.lexsort((dist2, ilist))
+
+        ilist  = ilist [order]
+        jlist  = jlist [order]
+        shifts = shifts[order]
+
+        # rank of each pair among the neighbors of its central atom
+        rank = np.arange(len(ilist)) - np.searchsorted(ilist, ilist, side = "left")
+        keep = rank < max_neighbors
+
+        ilist  = ilist [keep]
+        jlist  = jlist [keep]
+        shifts = shifts[keep]
+
+    return ilist, jlist, shifts
+
+def _max_num_neighbors():
+    """
+    Get the maximum number of neighbors of the graph model.
+    Returns:
+        max_neighbors (int): maximum number of neighbors, or None if unlimited.
+    """
+
+    system_config = getattr(myGraphModel, "system_config", None)
+
+    return getattr(system_config, "max_num_neighbors", None)
+
+def _graph_cutoff():
+    """
+    Get the cutoff radius of the graph model, that may differ from the cutoff of GNNP given to LAMMPS.
+    Returns:
+        cutoff (float): radius of the system config of the graph model, or cutoff of GNNP if not given.
+    """
+
+    system_config = getattr(myGraphModel, "system_config", None)
+
+    return getattr(system_config, "radius", None) or myCutoff
+
+def _verlet_edges(periodic = True):
+    """
+    Get the edges of graph of myAtoms, from the Verlet list built with cutoff + skin.
+    The list is rebuilt only if the cell has changed, or some atom has moved more than half of skin.
+    Args:
+        periodic (bool): if false, atoms are a cluster of local and ghost atoms of domain decomposition.
+    Returns:
+        edges (tuple): senders, receivers and unit shifts of edges.
+    """
+
+    global myAtoms
+    global myVerletList
+    global myGraphStats
+
+    positions = myAtoms.positions
+    cell      = myAtoms.cell.array
+
+    myGraphStats["calls"] += 1
+
+    rebuild = True
+
+    if myVerletList is not None:
+        ref_positions, ref_cell, ilist, jlist, shifts = myVerletList
+
+        if len(ref_positions) == len(positions) and np.array_equal(ref_cell, cell):
+            disp      = positions - ref_positions
+            max_disp2 = np.einsum("ij,ij->i", disp, disp).max()
+            rebuild   = max_disp2 > (0.5 * mySkin) ** 2
+
+    if rebuild and not periodic:
+        from ase.neighborlist import primitive_neighbor_list
+
+        # ghost atoms are already placed at their images, so a box enclosing the cluster is enough
+        origin = positions.min(axis = 0)
+
+        ilist, jlist = primitive_neighbor_list(
+            "ij",
+            pbc              = [False, False, False],
+            cell             = np.diag(positions.max(axis = 0) - origin + 1.0),
+            positions        = positions - origin,
+            cutoff           = _graph_cutoff() + mySkin,
+            self_interaction = False
+        )
+
+        shifts = np.zeros((len(ilist), 3))
+
+        myVerletList = (positions.copy(), cell.copy(), ilist, jlist, shifts)
+
+        myGraphStats["builds"] += 1
+
+    elif rebuild:
+        from ase.neighborlist import primitive_neighbor_list
+
+        # wrap atoms into the cell, and correct shifts for the wrapping afterward
+        wrap = np.floor(positions @ np.linalg.inv(cell))
+
+        ilist, jlist, shifts = primitive_neighbor_list(
+            "ijS",
+            pbc              = [True, True, True],
+            cell             = cell,
+            positions        = positions - wrap @ cell,
+            cutoff           = _graph_cutoff() + mySkin,
+            self_interaction = False
+        )
+
+        shifts = shifts + wrap[ilist] - wrap[jlist]
+
+        myVerletList = (positions.copy(), cell.copy(), ilist, jlist, shifts.astype(np.float64))
+
+        myGraphStats["builds"] += 1
+
+    return _select_edges(positions, cell, ilist, jlist, shifts, _graph_cutoff(), _max_num_neighbors())
+
+def gnnp_get_graph_stats():
+    """
+    Get the counters of the Verlet list for graph, and the check of graph against the calculator of GNNP.
+    Returns:
+        stats (dict): number of calls, number of builds, rate of rebuild, and check (None if not checked).
+    """
+
+    calls  = myGraphStats["calls"]
+    builds = myGraphStats["builds"]
+
+    return {
+        "calls":        calls,
+        "builds":       builds,
+        "rebuild_rate": (builds / calls) if calls > 0 else 0.0,
+        "check":        myGraphCheck
+    }
+
+def _as_output_array(buffer, name):
+    """
+    Get a writable NumPy view of a caller-owned output buffer.
+    Args:
+        buffer: object supporting the buffer protocol.
+        name (str): name of the output, for error messages.
+    Returns:
+        array (ndarray): view of buffer, sharing its memory.
+    """
+
+    array = np.asarray(buffer)
+
+    if array.dtype != np.float64 or not array.flags.c_contiguous or not array.flags.writeable:
+        raise ValueError(name + " must be a writable, C-contiguous float64 buffer.")
+
+    return array
+
+def _update_atoms(cell, atomic_numbers, positions):
+    """
+    Create the Atoms object, or update only the fields of it that have changed.
+    Args:
+        cell: lattice vectors in angstroms.
+        atomic_numbers: atomic numbers for all atoms.
+        positions: xyz coordinates for all atoms in angstroms.
+    """
+
+    global myAtoms
+    global myCalculator
+    global myGraphTemplate
+    global myVerletList
+
+    if myAtoms is not None and len(myAtoms.numbers) != len(atomic_numbers):
+        myAtoms = None
+
+    if myAtoms is None:
+        myGraphTemplate = None
+        myVerletList    = None
+
+        myAtoms = Atoms(
+            numbers   = atomic_numbers,
+            positions = positions,
+            cell      = cell,
+            pbc       = [True, True, True]
+        )
+
+        myAtoms.calc = myCalculator
+
+        return
+
+    # cell and atomic numbers are fixed under NVT, so they are rarely reset
+    if not np.array_equal(myAtoms.cell.array, cell):
+        myAtoms.set_cell(cell)
+
+    if not np.array_equal(myAtoms.numbers, atomic_numbers):
+        myAtoms.set_atomic_numbers(atomic_numbers)
+        myGraphTemplate = None
+
+    # overwrite positions in place, without allocating a new array
+    myAtoms.positions[:] = positions
+
+def _compute_energy_forces_stress(with_stress, edges = None):
+    """
+    Predict total energy, atomic forces and stress of myAtoms.
+    In r-RESPA, the classical potential is subtracted from them, or they are sampled to fit it.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph, or None to let GNNP build it.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    global myRespa
+
+    energy, forces, stress = _compute_cached(with_stress, edges)
+
+    if myPrecision is not None and myPrecision["passed"] < myPrecision["frames"]:
+        energy, forces, stress = _check_precision(with_stress, edges, (energy, forces, stress))
+
+    if myRespa is None:
+        return energy, forces, stress
+
+    if myRespa["mode"] == "sample":
+        _sample_for_respa(forces)
+
+        return energy, forces, stress
+
+    import classical_llzo
+
+    start = _tic()
+
+    energy_, forces_, stress_ = classical_llzo.evaluate(
+        myRespa["params"],
+        myAtoms.numbers,
+        myAtoms.cell.array,
+        myAtoms.positions,
+        with_stress = with_stress
+    )
+
+    _toc("respa", start)
+
+    energy = energy - energy_
+    forces = forces - forces_
+
+    if with_stress:
+        stress = stress - stress_
+
+    return energy, forces, stress
+
+def _check_precision(with_stress, edges, result):
+    """
+    Compare forces of GNNP with those in float64 every 100 calls, and refuse the precision if the error is large.
+    If the precision is "auto", the next precise one is used instead, and the result is calculated again.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph, or None to let GNNP build it.
+        result (tuple): energy, forces and stress in the current precision.
+    Returns:
+        result (tuple): energy, forces and stress in the precision that is accepted.
+    """
+
+    global myPrecision
+    global myProfile
+
+    state = myPrecision
+
+    state["calls"] += 1
+
+    if (state["calls"] - 1) % _PRECISION_CHECK_EVERY != 0:
+        return result
+
+    # check is not profiled
+    profile, myProfile = myProfile, None
+
+    try:
+        if state["reference"] is None:
+            state["reference"] = _load_backend("float64", compile = False).calculator
+
+        calculators = [state["reference"]]
+
+        if dftd3Calculator is not None:
+            calculators.append(dftd3Calculator)
+
+        _, forces_ref, _ = _compute_components(calculators, False)
+
+    finally:
+        myProfile = profile
+
+    while True:
+        error = np.asarray(result[1]) - forces_ref
+        rmse  = float(np.sqrt(np.mean(error ** 2)))
+
+        state["checks"].append({
+            "call":      state["calls"],
+            "precision": state["precision"],
+            "rmse":      rmse,
+            "max":       float(np.abs(error).max())
+        })
+
+        if rmse <= state["tolerance"]:
+            break
+
+        if not state["fallbacks"]:
+            raise RuntimeError("precision " + state["precision"] + " is refused: RMSE of forces is "
+                               + str(rmse) + " eV/A against float64, exceeding " + str(state["tolerance"]))
+
+        _fall_back_precision(state["fallbacks"].pop(0))
+
+        result = _compute_cached(with_stress, edges)
+
+    state["passed"] += 1
+
+    # reference is not needed any more
+    if state["passed"] >= state["frames"]:
+        state["reference"] = None
+
+    return result
+
+def _fall_back_precision(precision):
+    """
+    Use a more precise precision of GNNP, discarding the state that depends on the previous one.
+    Args:
+        precision (str): precision of GNNP.
+    """
+
+    global myAtoms
+    global myGraphTemplate
+    global myStressEnabled
+    global myPrecision
+
+    _use_backend(_load_backend(precision), precision)
+
+    myPrecision["precision"] = precision
+    myPrecision["passed"]    = 0
+
+    # float64 is the reference itself
+    if precision == "float64":
+        myPrecision["frames"] = 0
+
+    if myAtoms is not None:
+        myAtoms.calc = myCalculator
+
+    myGraphTemplate = None
+    myStressEnabled = None
+
+    for state in myReplicas.values():
+        state["myGraphTemplate"] = None
+
+    if myResultCache is not None:
+        myResultCache["results"].clear()
+
+def _sample_for_respa(forces):
+    """
+    Sample forces of GNNP to fit the classical potential of r-RESPA,
+    and append the sample to the file of samples, w/o rewriting the previous ones.
+    Args:
+        forces (ndarray): atomic forces of GNNP.
+    """
+
+    import classical_llzo
+
+    global myAtoms
+    global myRespa
+
+    myRespa["calls"] += 1
+
+    if (myRespa["calls"] - 1) % myRespa["every"] != 0:
+        return
+
+    # samples are only of the same atoms, so the file is started again for other atoms
+    if myRespa["numbers"] is None or not np.array_equal(myRespa["numbers"], myAtoms.numbers):
+        myRespa["numbers"] = myAtoms.numbers.copy()
+        classical_llzo.start_samples(myRespa["path"], myRespa["numbers"])
+
+    classical_llzo.append_sample(myRespa["path"], myAtoms.cell.array, myAtoms.positions, forces)
+
+def _compute_cached(with_stress, edges):
+    """
+    Predict total energy, atomic forces and stress of myAtoms, or get them from the cache of results.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph, or None to let GNNP build it.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    global myResultCache
+
+    if myResultCache is None:
+        return _compute_uncached(with_stress, edges)
+
+    key     = _result_key()
+    results = myResultCache["results"]
+    result  = results.get(key)
+
+    # a result w/o stress cannot be used, if stress is needed
+    if result is not None and (result[2] is not None or not with_stress):
+        results.move_to_end(key)
+        myCacheStats["hits"] += 1
+
+        return result
+
+    myCacheStats["misses"] += 1
+
+    result = _compute_uncached(with_stress, edges)
+
+    results[key] = result
+    results.move_to_end(key)
+
+    if len(results) > myResultCache["size"]:
+        results.popitem(last = False)
+
+    return result
+
+def _result_key():
+    """
+    Get the key of myAtoms for the cache of results.
+    Returns:
+        key (bytes): hash of cell, atomic numbers and quantized positions.
+    """
+
+    global myAtoms
+
+    resolution = myResultCache["resolution"]
+
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(np.round(myAtoms.cell.array / resolution).astype(np.int64).tobytes())
+    digest.update(np.ascontiguousarray(myAtoms.numbers, dtype = np.int64).tobytes())
+    digest.update(np.round(myAtoms.positions / resolution).astype(np.int64).tobytes())
+
+    return digest.digest()
+
+def gnnp_get_cache_stats():
+    """
+    Get the counters of the cache of results.
+    Returns:
+        stats (dict): number of hits, number of misses, rate of hit, and number of cached results.
+    """
+
+    hits   = myCacheStats["hits"]
+    misses = myCacheStats["misses"]
+
+    return {
+        "hits":     hits,
+        "misses":   misses,
+        "hit_rate": (hits / (hits + misses)) if (hits + misses) > 0 else 0.0,
+        "size":     len(myResultCache["results"]) if myResultCache is not None else 0
+    }
+
+def _compute_uncached(with_stress, edges):
+    """
+    Predict total energy, atomic forces and stress of myAtoms.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph, or None to let GNNP build it.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    global myAtoms
+    global myCalculator
+
+    if myConnection is not None:
+        return _compute_remote(with_stress, edges)
+
+    if myThreads is not None and not myThreads["tuned"]:
+        _autotune_threads()
+
+    _set_stress_enabled(with_stress)
+
+    if myGraphModel is not None and myGraphPath is not False:
+        if edges is None and mySkin > 0.0:
+            start = _tic()
+            edges = _verlet_edges()
+            _toc("graph", start)
+
+        if edges is not None:
+            return _compute_on_graph(with_stress, edges)
+
+    global myComponents
+
+    if myComponents is not None:
+        return _compute_components(myComponents, with_stress)
+
+    # Predicting energy, forces and stress
+    start = _tic()
+
+    with _precision_context():
+        energy = myAtoms.get_potential_energy()
+        if not isinstance(energy, float):
+            energy = energy.item()
+
+        forces = myAtoms.get_forces()
+
+    _toc("model", start)
+
+    if not with_stress:
+        return energy, forces, None
+
+    start = _tic()
+
+    with _precision_context():
+        stress = myAtoms.get_stress()
+
+    _toc("stress", start)
+
+    return energy, forces, stress
+
+def _compute_components(calculators, with_stress):
+    """
+    Predict total energy, atomic forces and stress of myAtoms, as the sum of calculators (e.g. GNNP + DFT-D3).
+    Each calculator is evaluated once for all properties, and the stress of SumCalculator is never used
+    to avoid the bug of SumCalculator.
+    Args:
+        calculators (list): calculators to be summed.
+        with_stress (bool): to calculate stress, or not.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    from ase.calculators.calculator import all_changes
+    from ase.stress import full_3x3_to_voigt_6_stress
+
+    global myAtoms
+
+    start = _tic()
+
+    properties = ["energy", "forces", "stress"] if with_stress else ["energy", "forces"]
+
+    energy = 0.0
+    forces = np.zeros((len(myAtoms), 3))
+    stress = np.zeros(6) if with_stress else None
+
+    for calculator in calculators:
+        system_changes = calculator.check_state(myAtoms)
+        if system_changes:
+            calculator.reset()
+
+        # all properties are requested in one calculation, not one by one
+        if any(name not in calculator.results for name in properties):
+            context = _precision_context() if calculator is gnnpCalculator else contextlib.nullcontext()
+
+            with context:
+                calculator.calculate(myAtoms, properties, system_changes or all_changes)
+
+        results = calculator.results
+
+        energy += float(np.sum(results["energy"]))
+        forces += np.asarray(results["forces"], dtype = np.float64).reshape(-1, 3)
+
+        if with_stress:
+            stress_ = np.asarray(results["stress"], dtype = np.float64)
+            if stress_.shape == (3, 3):
+                stress_ = full_3x3_to_voigt_6_stress(stress_)
+
+            stress += stress_.reshape(6)
+
+    _toc("model", start)
+
+    return energy, forces, stress
+
+def _set_stress_enabled(with_stress):
+    """
+    Switch the strain derivative of GNNP on or off, for the calculators that allow it.
+    matgl and mattersim skip the derivative w.r.t. strain in the backward pass, if switched off.
+    the other calculators always calculate stress, that is just not transferred then.
+    orb skips it on the graph of the driver (see _predict_conservative), but not in ORBCalculator.
+    Args:
+        with_stress (bool): stress is needed on this call, or not.
+    """
+
+    global myStressEnabled
+    global gnnpCalculator
+
+    if myStressEnabled == with_stress:
+        return
+
+    myStressEnabled = with_stress
+
+    # matgl: PESCalculator and its Potential, mattersim: MatterSimCalculator
+    if hasattr(gnnpCalculator, "compute_stress"):
+        gnnpCalculator.compute_stress = with_stress
+
+    potential = getattr(gnnpCalculator, "potential", None)
+
+    if hasattr(potential, "calc_stresses"):
+        potential.calc_stresses = with_stress
+
+def _compute_on_graph(with_stress, edges):
+    """
+    Predict total energy, atomic forces and stress of myAtoms w/ ORB, on a given graph.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    start = _tic()
+    graph = _build_graph(edges)
+    _toc("graph", start)
+
+    energy, forces, stress = _predict_graphs([graph], with_stress)[0]
+
+    if myGraphPath is None:
+        _check_graph_path(forces)
+
+    if not myGraphPath:
+        return _compute_uncached(with_stress, None)
+
+    return _add_dispersion(energy, forces, stress, with_stress)
+
+def _check_graph_path(forces):
+    """
+    Compare forces of GNNP on the graph of the driver with those of the calculator of GNNP (e.g. ORBCalculator),
+    that builds its own graph. If RMSE exceeds the tolerance, the graph of the driver is not used any more.
+    Args:
+        forces (ndarray): forces of GNNP on the graph of the driver, w/o DFT-D3.
+    """
+
+    global myGraphPath
+    global myGraphCheck
+    global myProfile
+
+    # check is not profiled
+    profile, myProfile = myProfile, None
+
+    try:
+        _, forces_ref, _ = _compute_components([gnnpCalculator], False)
+    finally:
+        myProfile = profile
+
+    rmse      = float(np.sqrt(np.mean((np.asarray(forces) - forces_ref) ** 2)))
+    tolerance = float(os.environ.get("GNNP_GRAPH_TOLERANCE", _GRAPH_TOLERANCE))
+
+    myGraphPath  = rmse <= tolerance
+    myGraphCheck = {"rmse": rmse, "tolerance": tolerance, "accepted": myGraphPath}
+
+    if not myGraphPath:
+        warnings.warn("graph of the driver is not used, since RMSE of forces is " + str(rmse)
+                      + " eV/A against the calculator of GNNP, exceeding " + str(tolerance))
+
+def _build_graph(edges):
+    """
+    Build the graph of myAtoms for ORB, on given edges.
+    The features of atoms are taken from a graph of ORB that is built only once for the Atoms object,
+    and its positions, cell and edges are replaced on every call.
+    Args:
+        edges (tuple): senders, receivers and unit shifts of graph.
+    Returns:
+        graph (AtomGraphs): graph of ORB.
+    """
+
+    global myAtoms
+    global myGraphModel
+    global myGraphTemplate
+
+    if myGraphTemplate is None:
+        from orb_models.forcefield.atomic_system import ase_atoms_to_atom_graphs
+
+        device = next(myGraphModel.parameters()).device
+
+        myGraphTemplate = ase_atoms_to_atom_graphs(
+            myAtoms,
+            system_config = myGraphModel.system_config,
+            device        = device
+        )
+
+    template = myGraphTemplate
+    device   = template.senders.device
+    dtype    = template.node_features["positions"].dtype
+
+    senders, receivers, shifts = edges
+
+    positions = torch.as_tensor(myAtoms.positions,  dtype = dtype, device = device)
+    cell      = torch.as_tensor(myAtoms.cell.array, dtype = dtype, device = device)
+    senders   = torch.as_tensor(senders,   dtype = torch.long, device = device)
+    receivers = torch.as_tensor(receivers, dtype = torch.long, device = device)
+    shifts    = torch.as_tensor(shifts,    dtype = dtype,      device = device)
+
+    vectors = positions[receivers] + shifts @ cell - positions[senders]
+
+    node_features   = dict(template.node_features)
+    system_features = dict(template.system_features)
+
+    node_features  ["positions"] = positions
+    system_features["cell"]      = cell.unsqueeze(0)
+
+    return template._replace(
+        senders         = senders,
+        receivers       = receivers,
+        n_edge          = torch.tensor([len(senders)], dtype = torch.long, device = device),
+        node_features   = node_features,
+        edge_features   = {"vectors": vectors, "unit_shifts": shifts},
+        system_features = system_features
+    )
+
+def _predict_graphs(graphs, with_stress):
+    """
+    Predict energy, forces and stress w/ ORB, on graphs that are evaluated as one batch.
+    Conservative models are differentiated w.r.t. strain only if with_stress (see _predict_conservative),
+    and direct models predict stress by a head in the same forward pass as energy and forces.
+    Args:
+        graphs (list): graphs of ORB.
+        with_stress (bool): to calculate stress, or not.
+    Returns:
+        results (list): energy, forces and stress (or None) for each graph.
+    """
+
+    global myGraphModel
+
+    if len(graphs) == 1:
+        batch = graphs[0]
+    else:
+        from orb_models.forcefield.base import batch_graphs
+
+        batch = batch_graphs(graphs)
+
+    if hasattr(myGraphModel, "grad_forces_name"):
+        energies, forces, stresses = _predict_conservative(batch, with_stress)
+
+    else:
+        start = _tic()
+
+        with _precision_context():
+            out = myGraphModel.predict(batch, split = False)
+
+        _toc("model", start)
+
+        energies = out["energy"]
+        forces   = out["forces"]
+        stresses = out["stress"] if with_stress else None
+
+    if myCompileCache is not None and not myCompileCache["saved"]:
+        _save_compile_artifacts()
+
+    start = _tic()
+
+    energies = energies.detach().cpu().numpy().astype(np.float64).reshape(-1)
+    forces   = forces.detach().cpu().numpy().astype(np.float64).reshape(-1, 3)
+
+    if with_stress:
+        stresses = stresses.detach().cpu().numpy().astype(np.float64).reshape(-1, 6)
+
+    _toc("transfer", start)
+
+    results = []
+    offset  = 0
+
+    for igraph, graph in enumerate(graphs):
+        natom = int(graph.n_node.sum())
+
+        results.append((
+            float(energies[igraph]),
+            forces[offset:offset + natom],
+            stresses[igraph] if with_stress else None
+        ))
+
+        offset += natom
+
+    return results
+
+def _predict_conservative(graph, with_stress):
+    """
+    Predict energy, forces and stress w/ conservative ORB, as ConservativeForcefieldRegressor.predict,
+    but w/o the strain displacement (and its derivative in the backward pass) if stress is not needed.
+    Args:
+        graph (AtomGraphs): graph of ORB, or batch of graphs.
+        with_stress (bool): to calculate stress, or not.
+    Returns:
+        energies (Tensor): energy of each system.
+        forces (Tensor): atomic forces.
+        stresses (Tensor): stress tensor (Voigt order) of each system, or None if not with_stress.
+    """
+
+    from orb_models.forcefield.forcefield_utils import torch_full_3x3_to_voigt_6_stress
+
+    with torch.enable_grad(), _precision_context():
+        start = _tic()
+
+        energies, displacement = _conservative_energies(graph, with_stress)
+
+        _toc("forward", start)
+
+        inputs = [graph.node_features["positions"]]
+
+        if with_stress:
+            inputs.append(displacement)
+
+        start = _tic()
+
+        gradients = torch.autograd.grad(energies, inputs, grad_outputs = torch.ones_like(energies))
+
+        _toc("backward", start)
+
+    forces   = -gradients[0]
+    stresses = None
+
+    if with_stress:
+        volumes  = torch.linalg.det(graph.system_features["cell"]).abs()
+        stresses = gradients[1] / volumes.view(-1, 1, 1)
+        stresses = torch_full_3x3_to_voigt_6_stress(torch.where(stresses.abs() < 1.0e10, stresses, 0.0))
+
+    return energies, forces, stresses
+
+def _conservative_energies(graph, with_stress):
+    """
+    Predict energy of each system w/ conservative ORB, as ConservativeForcefieldRegressor.forward,
+    keeping it differentiable w.r.t. positions, and w.r.t. strain only if with_stress.
+    The rotation generator of ORB is not applied, because its gradient is not used.
+    Args:
+        graph (AtomGraphs): graph of ORB, whose edge vectors are replaced.
+        with_stress (bool): to apply the strain displacement, or not.
+    Returns:
+        energies (Tensor): energy of each system.
+        displacement (Tensor): strain displacement of each system, or None if not with_stress.
+    """
+
+    model = myGraphModel
+
+    vectors, displacement, _ = graph.compute_differentiable_edge_vectors(
+        use_stress_displacement = with_stress, use_rotation = False)
+
+    if with_stress:
+        graph.system_features["stress_displacement"] = displacement
+
+    graph.edge_features["vectors"] = vectors
+
+    head     = model.heads[model.energy_name]
+    energies = head.denormalize(head(model.model(graph)["node_features"], graph), graph)
+
+    if getattr(model, "pair_repulsion", False):
+        energies = energies + model.pair_repulsion_fn(graph)["energy"]
+
+    return energies, displacement
+
+def _add_dispersion(energy, forces, stress, with_stress):
+    """
+    Add DFT-D3 of myAtoms to energy, forces and stress of GNNP, if DFT-D3 is used.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    global dftd3Calculator
+
+    if dftd3Calculator is None:
+        return energy, forces, stress
+
+    energy_, forces_, stress_ = _compute_components([dftd3Calculator], with_stress)
+
+    energy += energy_
+    forces  = forces + forces_
+
+    if with_stress:
+        stress = stress + stress_
+
+    return energy, forces, stress
+
+def _tic():
+    """
+    Get the start time of a phase, if profiling.
+    Returns:
+        start (float): start time in seconds.
+    """
+
+    if myProfile is None:
+        return 0.0
+
+    if myProfile["sync"]:
+        torch.cuda.synchronize()
+
+    return time.perf_counter()
+
+def _toc(phase, start):
+    """
+    Record the wall time of a phase, if profiling.
+    Args:
+        phase (str): name of phase. -> {update|graph|model|forward|backward|stress|transfer|respa}
+        start (float): start time from _tic.
+    """
+
+    if myProfile is None:
+        return
+
+    if myProfile["sync"]:
+        torch.cuda.synchronize()
+
+    elapsed = time.perf_counter() - start
+
+    myProfile["call"] [phase] = myProfile["call"] .get(phase, 0.0) + elapsed
+    myProfile["total"][phase] = myProfile["total"].get(phase, 0.0) + elapsed
+
+def _profile_call():
+    """
+    Count a call of GNNP, and write the profile periodically, if profiling.
+    """
+
+    if myProfile is None:
+        return
+
+    # phases may be entered several times per call, so times are summed per call
+    for phase, elapsed in myProfile["call"].items():
+        myProfile["window"].setdefault(phase, []).append(elapsed)
+
+    myProfile["call"]   = {}
+    myProfile["calls"] += 1
+
+    if myProfile["calls"] % myProfile["every"] == 0:
+        _write_profile()
+
+def _write_profile():
+    """
+    Write aggregated timing of phases into the JSON file of profile.
+    Percentiles are of the times per call since the last output, and totals are of the whole run.
+    On the graph of the driver, conservative ORB is timed as the forward and backward phases.
+    Otherwise, the model phase includes both, because the calculators of GNNP run them in one call.
+    """
+
+    if myProfile is None or myProfile["calls"] == 0:
+        return
+
+    elapsed = time.perf_counter() - myProfile["start"]
+
+    phases = {}
+
+    for phase, times in myProfile["window"].items():
+        times = np.asarray(times) * 1.0e3
+
+        phases[phase] = {
+            "count":   len(times),
+            "mean_ms": float(times.mean()),
+            "p50_ms":  float(np.percentile(times, 50)),
+            "p90_ms":  float(np.percentile(times, 90)),
+            "p99_ms":  float(np.percentile(times, 99)),
+            "total_s": myProfile["total"][phase]
+        }
+
+    report = {
+        "calls":        myProfile["calls"],
+        "elapsed_s":    elapsed,
+        "steps_per_s":  myProfile["calls"] / elapsed,
+        "phases":       phases,
+        "graph":        gnnp_get_graph_stats(),
+        "result_cache": gnnp_get_cache_stats(),
+        "threads":      myThreads.get("setting") if myThreads is not None else None,
+        "precision":    _precision_report()
+    }
+
+    # replace the file at once, so that it can be read while running
+    path_tmp = myProfile["path"] + ".tmp"
+
+    with open(path_tmp, "w") as f:
+        json.dump(report, f, indent = 2)
+
+    os.replace(path_tmp, myProfile["path"])
+
+    myProfile["window"] = {}
+
+def _precision_report():
+    """
+    Get the precision of GNNP and its checks against float64, for the profile.
+    Returns:
+        report (dict): precision and checks, or None if not checked.
+    """
+
+    if myPrecision is None:
+        return None
+
+    return {
+        "precision": myPrecision["precision"],
+        "tolerance": myPrecision["tolerance"],
+        "checks":    myPrecision["checks"]
+    }
+
+def _connect_server(server, gnnp_type, model_name, profile, result_cache, respa):
+    """
+    Connect to a model server, that evaluates GNNP for this process.
+    Args:
+        server (str): path of Unix socket of the server.
+        gnnp_type (str): type of GNNP, that must be served.
+        model_name (str): name of model, that must be served if not None.
+        profile (str): path of JSON file of profile, or None.
+        result_cache (int): number of results to be cached, or None.
+        respa (str): path of JSON file of the classical potential for r-RESPA, or None.
+    Returns:
+        cutoff (float): cutoff radius.
+        with_stress (int): to calculate stress, or not.
+    """
+
+    from multiprocessing.connection import Client
+
+    global myConnection
+    global gnnpCalculator
+    global dftd3Calculator
+    global myComponents
+
+    gnnpCalculator  = None
+    dftd3Calculator = None
+    myComponents    = None
+
+    myConnection = Client(server, family = "AF_UNIX")
+    myConnection.send(("init",))
+
+    served_type, served_model, cutoff, with_stress = myConnection.recv()
+
+    if gnnp_type != served_type or (model_name is not None and model_name != served_model):
+        myConnection.close()
+        myConnection = None
+        raise ValueError("model server has " + served_type + " " + str(served_model) + ", not requested one.")
+
+    atexit.register(_disconnect_server)
+
+    _initialize_state(cutoff, 0.0, profile, False, result_cache, respa)
+
+    return (cutoff, with_stress)
+
+def _disconnect_server():
+    """
+    Disconnect from the model server.
+    """
+
+    global myConnection
+
+    if myConnection is None:
+        return
+
+    try:
+        myConnection.send(("close",))
+        myConnection.close()
+    except OSError:
+        pass
+
+    myConnection = None
+
+def _compute_remote(with_stress, edges):
+    """
+    Predict total energy, atomic forces and stress of myAtoms w/ the model server.
+    Args:
+        with_stress (bool): to calculate stress, or not.
+        edges (tuple): senders, receivers and unit shifts of graph, or None.
+    Returns:
+        energy (float): total energy.
+        forces (ndarray): atomic forces.
+        stress (ndarray): stress tensor (Voigt order), or None if not with_stress.
+    """
+
+    global myAtoms
+    global myConnection
+
+    start = _tic()
+
+    myConnection.send((
+        "compute",
+        myAtoms.cell.array,
+        myAtoms.numbers,
+        myAtoms.positions,
+        with_stress,
+        edges
+    ))
+
+    status, result = myConnection.recv()
+
+    _toc("model", start)
+
+    if status != "ok":
+        raise RuntimeError("model server failed: " + result)
+
+    return result
+
+# state of each client on the model server, that is swapped into the globals of driver
+_CLIENT_STATE = ("myAtoms", "myGraphTemplate", "myVerletList")
+
+def gnnp_serve(address, gnnp_type, model_name = None, as_path = False, dftd3 = False, gpu = True,
+               skin = None, batch_window = 0.002, precision = None):
+    """
+    Serve GNNP to LAMMPS instances over a Unix socket, holding only one copy of the model.
+    Requests that arrive together are evaluated as one batch of graphs, if GNNP can take graphs (orb).
+    Args:
+        address (str): path of Unix socket.
+        gnnp_type (str): type of GNNP, as gnnp_initialize.
+        model_name (str): name of model for GNNP.
+        as_path (bool): if true, model_name is path of model file.
+        dftd3 (bool): to add correction of DFT-D3.
+        gpu (bool): using GPU, if possible.
+        skin (float): skin of the Verlet list for graph, in angstroms, as gnnp_initialize.
+                      requests are batched on the graphs of the driver even if 0, that are rebuilt on every call then.
+        batch_window (float): time in seconds to wait for other requests, after the first one arrives.
+        precision (str): precision of GNNP, as gnnp_initialize.
+    """
+
+    from multiprocessing.connection import Listener, wait
+    import threading
+
+    cutoff, with_stress = gnnp_initialize(gnnp_type, model_name, as_path, dftd3, gpu, skin, server = "",
+                                          precision = precision)
+
+    served = (gnnp_type.lower(), model_name, cutoff, with_stress)
+
+    # remove the socket left by a killed server
+    if os.path.exists(address):
+        os.remove(address)
+
+    listener = Listener(address, family = "AF_UNIX")
+
+    clients = {}
+    pending = []
+    lock    = threading.Lock()
+
+    def accept():
+        while True:
+            connection = listener.accept()
+            with lock:
+                pending.append(connection)
+
+    threading.Thread(target = accept, daemon = True).start()
+
+    print("GNNP server: " + gnnp_type + " " + str(model_name) + " on " + address, flush = True)
+
+    try:
+        while True:
+            with lock:
+                for connection in pending:
+                    clients[connection] = {name: None for name in _CLIENT_STATE}
+                pending.clear()
+
+            if not clients:
+                time.sleep(0.01)
+                continue
+
+            ready = wait(list(clients), timeout = 0.1)
+            if not ready:
+                continue
+
+            # wait a little more, to batch requests of other clients
+            deadline = time.perf_counter() + batch_window
+
+            while len(ready) < len(clients) and time.perf_counter() < deadline:
+                others = [c for c in clients if c not in ready]
+                ready += wait(others, timeout = max(deadline - time.perf_counter(), 0.0))
+
+            requests = []
+
+            for connection in ready:
+                # a client that is killed or reset is dropped, and the others are served
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    message = ("close",)
+
+                if message[0] == "init":
+                    _send_to_client(clients, connection, served)
+
+                elif message[0] == "compute":
+                    requests.append((connection, message[1:]))
+
+                else:
+                    _drop_client(clients, connection)
+
+            if requests:
+                _serve_requests(clients, requests)
+
+    finally:
+        listener.close()
+
+def _serve_requests(clients, requests):
+    """
+    Evaluate requests of clients on the model server, and send the results back.
+    Args:
+        clients (dict): state of each client, keyed by connection.
+        requests (list): connection and arguments of each request.
+    """
+
+    with_stress = any(args[3] for _, args in requests)
+
+    systems = {}
+
+    for connection, (cell, atomic_numbers, positions, _, edges) in requests:
+        systems[connection] = (cell, atomic_numbers, positions, edges)
+
+    try:
+        results = _compute_batch(clients, systems, with_stress)
+
+    except Exception as exception:
+        for connection, _ in requests:
+            _send_to_client(clients, connection, ("error", repr(exception)))
+
+        return
+
+    for connection, args in requests:
+        energy, forces, stress = results[connection]
+        _send_to_client(clients, connection, ("ok", (energy, forces, stress if args[3] else None)))
+
+def _send_to_client(clients, connection, message):
+    """
+    Send a message to a client of the model server, dropping the client if its connection is broken.
+    Args:
+        clients (dict): state of each client, keyed by connection.
+        connection (Connection): connection of the client.
+        message (tuple): message.
+    """
+
+    try:
+        connection.send(message)
+    except OSError:
+        _drop_client(clients, connection)
+
+def _drop_client(clients, connection):
+    """
+    Close the connection of a client of the model server, and forget its state.
+    Args:
+        clients (dict): state of each client, keyed by connection.
+        connection (Connection): connection of the client.
+    """
+
+    try:
+        connection.close()
+    except OSError:
+        pass
+
+    clients.pop(connection, None)
+
+def gnnp_compute_batch(cells, atomic_numbers, positions, with_stress = False):
+    """
+    Predict total energy, atomic forces and stress of independent replicas w/ pre-trained GNNP,
+    as one batch of graphs if GNNP can take graphs (orb), or one by one otherwise.
+    Each replica keeps its own Atoms object and Verlet list, as a client of the model server does.
+    Args:
+        cells: lattice vectors in angstroms of each replica, shape (nreplica, 3, 3).
+        atomic_numbers: atomic numbers of each replica, shape (nreplica, natom).
+        positions: xyz coordinates in angstroms of each replica, shape (nreplica, natom, 3).
+        with_stress: to return stress, if True.
+    Returns:
+        results (list): energy, forces and stress (or None) of each replica.
+    """
+
+    global myReplicas
+
+    systems = {}
+
+    for ireplica in range(len(cells)):
+        myReplicas.setdefault(ireplica, {name: None for name in _CLIENT_STATE})
+
+        systems[ireplica] = (
+            np.asarray(cells[ireplica], dtype = np.float64).reshape(3, 3),
+            np.asarray(atomic_numbers[ireplica]),
+            np.asarray(positions[ireplica], dtype = np.float64).reshape(-1, 3),
+            None
+        )
+
+    results = _compute_batch(myReplicas, systems, with_stress)
+
+    _profile_call()
+
+    return [results[ireplica] for ireplica in range(len(cells))]
+
+def _compute_batch(states, systems, with_stress):
+    """
+    Predict total energy, atomic forces and stress of several systems,
+    as one batch of graphs if GNNP can take graphs (orb), or one by one otherwise.
+    Args:
+        states (dict): state of driver for each system, keyed as systems.
+        systems (dict): cell, atomic numbers, positions and edges (or None) of each system.
+        with_stress (bool): to calculate stress, or not.
+    Returns:
+        results (dict): energy, forces and stress (or None) of each system.
+    """
+
+    global myGraphModel
+
+    results = {}
+    graphs  = []
+
+    for key, (cell, atomic_numbers, positions, edges) in systems.items():
+        _swap_client_state(states, key, True)
+
+        _update_atoms(cell, atomic_numbers, positions)
+
+        # graphs are built by the driver to be batched, even w/o skin (the Verlet list is rebuilt then)
+        if myGraphModel is not None and myGraphPath is not False:
+            if edges is None:
+                edges = _verlet_edges()
+
+            graphs.append((key, _build_graph(edges)))
+
+        else:
+            results[key] = _compute_energy_forces_stress(with_stress, edges)
+
+        _swap_client_state(states, key, False)
+
+    if graphs:
+        predicted = _predict_graphs([graph for _, graph in graphs], with_stress)
+        precision = myPrecision["precision"] if myPrecision is not None else None
+
+        for index, ((key, _), (energy, forces, stress)) in enumerate(zip(graphs, predicted)):
+            _swap_client_state(states, key, True)
+
+            if myGraphPath is None:
+                _check_graph_path(forces)
+
+            # the rest of batch is evaluated again, if its precision has been refused
+            refused = myPrecision is not None and myPrecision["precision"] != precision
+
+            if myGraphPath and not refused:
+                result = _add_dispersion(energy, forces, stress, with_stress)
+
+                # precision is checked on the first system of batch, as on a call of gnnp_get_energy_forces_stress
+                if index == 0 and myPrecision is not None and myPrecision["passed"] < myPrecision["frames"]:
+                    result = _check_precision(with_stress, None, result)
+
+                results[key] = result
+
+            else:
+                results[key] = _compute_energy_forces_stress(with_stress)
+
+            _swap_client_state(states, key, False)
+
+    return results
+
+def _swap_client_state(clients, key, swap_in):
+    """
+    Swap the state of a client (or a replica) into or out of the globals of driver.
+    Args:
+        clients (dict): state of each client, keyed by connection (or index of replica).
+        key: connection of the client, or index of replica.
+        swap_in (bool): to swap in, or out.
+    """
+
+    state = clients[key]
+
+    if swap_in:
+        globals().update(state)
+    else:
+        for name in _CLIENT_STATE:
+            state[name] = globals()[name]
+
+def _initialize_threads(threads, gnnp_type, model_name):
+    """
+    Set threads of torch on CPU, or register this driver to tune them on the first call.
+    Inter-op threads are always 1, because a graph is evaluated as a sequence of operations,
+    and they cannot be changed after the model has run.
+    Args:
+        threads (str): number of intra-op threads, or "auto".
+        gnnp_type (str): type of GNNP.
+        model_name (str): name of model for GNNP.
+    Returns:
+        state (dict): state of tuning, or None if not tuned.
+    """
+
+    import socket
+
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # already set in this process, e.g. by the previous initialization
+        pass
+
+    if str(threads).lower() != "auto":
+        torch.set_num_threads(int(threads))
+        return None
+
+    # drivers running on the host share its cores, as many as declared by $GNNP_DRIVERS
+    host    = socket.gethostname()
+    slot    = _claim_slot(host)
+    ndriver = max(int(os.environ.get("GNNP_DRIVERS", 1)), 1)
+
+    if slot >= ndriver:
+        warnings.warn("driver " + str(slot + 1) + " is running on " + host + ", but $GNNP_DRIVERS is "
+                      + str(ndriver) + ", so cores are shared with another driver.")
+
+    return {
+        "host":    host,
+        "model":   gnnp_type + "-" + str(model_name),
+        "slot":    slot % ndriver,
+        "ndriver": ndriver,
+        "tuned":   False,
+        "setting": None
+    }
+
+def _claim_slot(host):
+    """
+    Claim the lowest free slot among the drivers on the host, by an exclusive lock of its file.
+    The lock is held until this process exits or is killed, so no two running drivers claim the same slot,
+    and the slot is kept if GNNP is initialized again.
+    Args:
+        host (str): name of host.
+    Returns:
+        slot (int): index of this driver among the drivers on the host.
+    """
+
+    import fcntl
+
+    if host in _THREADS_SLOT:
+        return _THREADS_SLOT[host][0]
+
+    registry = os.path.join(os.path.expanduser(_THREADS_CACHE_DIR), "running")
+    os.makedirs(registry, exist_ok = True)
+
+    slot = 0
+
+    while True:
+        lock = open(os.path.join(registry, host + "-" + str(slot)), "a")
+
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            slot += 1
+            continue
+
+        _THREADS_SLOT[host] = (slot, lock)
+
+        return slot
+
+def _autotune_threads():
+    """
+    Tune threads of torch on CPU for myAtoms, or read the setting from cache, and apply it.
+    The cores of the host are divided equally among the drivers declared by $GNNP_DRIVERS (1 if not given),
+    each of which takes the cores of the slot claimed by _claim_slot,
+    and the drivers benchmark one by one, while the others wait for the cached setting.
+    """
+
+    from minimize_cache import claim_or_wait
+
+    global myThreads
+
+    myThreads["tuned"] = True
+
+    ndriver = myThreads["ndriver"]
+    slot    = myThreads["slot"]
+    cores   = sorted(os.sched_getaffinity(0))
+    budget  = max(len(cores) // ndriver, 1)
+
+    name = "-".join([myThreads["host"], myThreads["model"], str(len(myAtoms)), str(ndriver)])
+    path = os.path.join(os.path.expanduser(_THREADS_CACHE_DIR), name.replace(os.sep, "_") + ".json")
+
+    claim_or_wait(path)
+
+    if os.path.isfile(path):
+        with open(path) as f:
+            setting = json.load(f)
+
+    else:
+        try:
+            setting = _benchmark_threads(cores, budget, slot, ndriver)
+
+            with open(path + ".tmp", "w") as f:
+                json.dump(setting, f, indent = 2)
+
+            os.replace(path + ".tmp", path)
+
+        finally:
+            os.remove(path + ".lock")
+
+    _apply_threads(setting["threads"], _layout_cores(cores, setting["layout"], budget, slot, ndriver))
+
+    myThreads["setting"] = setting
+
+def _benchmark_threads(cores, budget, slot, ndriver):
+    """
+    Benchmark numbers of intra-op threads and affinity layouts on myAtoms.
+    Args:
+        cores (list): cores available to this process.
+        budget (int): number of cores of this driver.
+        slot (int): index of this driver among the drivers on the host.
+        ndriver (int): number of drivers on the host.
+    Returns:
+        setting (dict): the best number of threads and layout, with time per call of all settings.
+    """
+
+    global myProfile
+
+    counts  = sorted({n for n in (1, 2, 4, 8, 16, 32, 64) if n < budget} | {budget})
+    layouts = ("compact", "spread", "none") if ndriver > 1 else ("compact", "none")
+
+    # benchmark is not profiled
+    profile, myProfile = myProfile, None
+
+    timings = []
+
+    try:
+        for layout in layouts:
+            for nthread in counts:
+                _apply_threads(nthread, _layout_cores(cores, layout, budget, slot, ndriver))
+
+                # first call is to warm up
+                for call in range(_THREADS_BENCHMARK_CALLS + 1):
+                    if call == 1:
+                        start = time.perf_counter()
+
+                    _reset_calculators()
+                    _compute_uncached(False, None)
+
+                elapsed = (time.perf_counter() - start) / _THREADS_BENCHMARK_CALLS
+
+                timings.append({"threads": nthread, "layout": layout, "time_ms": elapsed * 1.0e3})
+
+    finally:
+        myProfile = profile
+
+    best = min(timings, key = lambda timing: timing["time_ms"])
+
+    return {
+        "threads": best["threads"],
+        "layout":  best["layout"],
+        "time_ms": best["time_ms"],
+        "timings": timings
+    }
+
+def _reset_calculators():
+    """
+    Reset the results of calculators, so that they are calculated again on the same atoms.
+    """
+
+    for calculator in (myComponents or [myCalculator]):
+        calculator.reset()
+
+def _layout_cores(cores, layout, budget, slot, ndriver):
+    """
+    Get the cores to pin this driver to.
+    Args:
+        cores (list): cores available to this process.
+        layout (str): layout of affinity. -> {compact|spread|none}
+        budget (int): number of cores of this driver.
+        slot (int): index of this driver among the drivers on the host.
+        ndriver (int): number of drivers on the host.
+    Returns:
+        cores (list): cores of this driver.
+    """
+
+    if layout == "compact":
+        return cores[slot * budget:(slot + 1) * budget] or cores
+
+    if layout == "spread":
+        return cores[slot::ndriver][:budget] or cores
+
+    return cores
+
+def _apply_threads(nthread, cores):
+    """
+    Set the number of intra-op threads, and pin all threads of this process to cores.
+    Args:
+        nthread (int): number of intra-op threads.
+        cores (list): cores to pin threads to.
+    """
+
+    # threads of OpenMP that already exist are pinned one by one
+    for task in os.listdir("/proc/self/task"):
+        try:
+            os.sched_setaffinity(int(task), cores)
+        except OSError:
+            pass
+
+    torch.set_num_threads(nthread)
+
+def _compile_cache_dir(cache_root, gnnp_type, model_name, precision, device):
+    """
+    Get the directory of cache of model, keyed by backend, model, precision, versions of torch and orb_models, and device.
+    A model given by path is keyed by the hash of its file, so that checkpoints of the same file name differ.
+    Args:
+        cache_root (str): root directory of cache, or None if not cached.
+        gnnp_type (str): type of GNNP.
+        model_name (str): name or path of model.
+        precision (str): precision of model.
+        device (str): device of model.
+    Returns:
+        cache_dir (str): directory of cache, or None if not cached.
+    """
+
+    if not cache_root:
+        return None
+
+    if model_name is not None and os.path.isfile(str(model_name)):
+        digest = hashlib.sha256()
+
+        with open(model_name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        model_key = os.path.basename(str(model_name)) + "-" + digest.hexdigest()[:16]
+
+    else:
+        model_key = str(model_name).replace(os.sep, "_")
+
+    versions = ["torch" + torch.__version__]
+
+    # architecture of a pretrained model may change w/ the version of orb_models
+    if gnnp_type.startswith("orb"):
+        import orb_models
+
+        versions.append("orb" + orb_models.__version__)
+
+    cache_key = "_".join([gnnp_type, model_key, precision] + versions + [device])
+
+    cache_dir = os.path.join(os.path.expanduser(cache_root), cache_key)
+    os.makedirs(cache_dir, exist_ok = True)
+
+    return cache_dir
+
+def _compile_model(cache_dir, model):
+    """
+    Compile the model in place w/ torch.compile, reusing the compiled artifacts in cache.
+    Compiled kernels are kept in cache_dir by Inductor, and the artifacts of torch.compiler
+    are saved after the first call of model (see _save_compile_artifacts).
+    Args:
+        cache_dir (str): directory of cache, or None not to compile.
+        model (Module): model.
+    """
+
+    global myCompileCache
+
+    if cache_dir is None or not hasattr(model, "compile"):
+        return
+
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(cache_dir, "inductor")
+
+    artifacts_path = os.path.join(cache_dir, "artifacts.bin")
+
+    saved = False
+
+    if os.path.isfile(artifacts_path) and hasattr(torch.compiler, "load_cache_artifacts"):
+        with open(artifacts_path, "rb") as f:
+            torch.compiler.load_cache_artifacts(f.read())
+
+        saved = True
+
+    # number of edges changes on every step, so shapes are dynamic
+    model.compile(dynamic = True)
+
+    # the graph of the driver calls the backbone of conservative ORB by itself (see _conservative_energies)
+    backbone = getattr(model, "model", None)
+
+    if hasattr(backbone, "compile"):
+        backbone.compile(dynamic = True)
+
+    myCompileCache = {"dir": cache_dir, "saved": saved}
+
+def _save_compile_artifacts():
+    """
+    Save the artifacts of torch.compiler into cache, after the first call of model.
+    """
 
+    global myCompileCache
+
+    myCompileCache["saved"] = True
+
+    cache_dir = myCompileCache["dir"]
+
+    if hasattr(torch.compiler, "save_cache_artifacts"):
+        artifacts = torch.compiler.save_cache_artifacts()
+
+        if artifacts is not None:
+            artifacts_path = os.path.join(cache_dir, "artifacts.bin")
+
+            with open(artifacts_path + ".tmp" + str(os.getpid()), "wb") as f:
+                f.write(artifacts[0])
+
+            os.replace(artifacts_path + ".tmp" + str(os.getpid()), artifacts_path)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Serve GNNP to concurrent LAMMPS runs (set GNNP_SERVER=<socket> for them).")
+    parser.add_argument("gnnp_type", help = "type of GNNP, e.g. orb.")
+    parser.add_argument("model_name", nargs = "?", default = None, help = "name of model, e.g. orb-v3-conservative-inf-omat.")
+    parser.add_argument("--socket", default = "gnnp.sock", help = "path of Unix socket.")
+    parser.add_argument("--as-path", action = "store_true", help = "model_name is path of model file.")
+    parser.add_argument("--dftd3", action = "store_true", help = "to add correction of DFT-D3.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    parser.add_argument("--skin", type = float, default = None, help = "skin of the Verlet list for graph (default $GNNP_SKIN or 0).")
+    parser.add_argument("--batch-window", type = float, default = 2.0, help = "time in ms to wait for batching.")
+    parser.add_argument("--precision", default = None, help = "precision of GNNP, e.g. float32-high or auto.")
+    args = parser.parse_args()
+
+    gnnp_serve(
+        args.socket,
+        args.gnnp_type,
+        model_name   = args.model_name,
+        as_path      = args.as_path,
+        dftd3        = args.dftd3,
+        gpu          = not args.cpu,
+        skin         = args.skin,
+        batch_window = args.batch_window * 1.0e-3,
+        precision    = args.precision
+    )
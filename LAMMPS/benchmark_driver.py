@@ -0,0 +1,327 @@
+"""
+Replay benchmark of gnnp_driver.py on CPU, across backends and sizes of cell.
+
+Frames are replayed through gnnp_initialize / gnnp_get_energy_forces_stress, from a dump file of LAMMPS,
+or from perturbed copies of cubic-LLZO.data replicated to 1x1x1 ... 4x4x4.
+Each case (backend, size, with or without stress and DFT-D3) runs in its own process,
+and calls/s, atom-steps/s, ns/day (at 1 fs), peak RSS and the split of time per phase are reported.
+
+The backend "toy" is a small pair model of torch with random weights, that stands in for GNNP
+without downloading weights, so that the numbers are reproducible anywhere.
+
+Usage (from LAMMPS):
+    python benchmark_driver.py                                   # toy, 1x1x1 ... 4x4x4
+    python benchmark_driver.py --backends toy orb --sizes 1 2 --json bench.json
+    python benchmark_driver.py --dump 1000/dump.lammpstrj --backends orb
+    python benchmark_driver.py --dump 1000/trajectory --backends orb       # binary trajectory
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from ase.calculators.calculator import Calculator, all_changes
+
+from replica_md import load_driver, read_data
+
+_TOY_CUTOFF = 6.0
+
+_DEFAULT_MODELS = {
+    "toy": None,
+    "orb": "orb-v3-conservative-inf-omat"
+}
+
+class ToyCalculator(Calculator):
+    """
+    Small pair model of torch with random weights, standing in for GNNP in the benchmark.
+    The energy is a sum over pairs of an MLP of radial basis and elements,
+    and forces and stress are given by autograd, as conservative GNNPs do.
+    """
+
+    implemented_properties = ["energy", "forces", "stress"]
+
+    def __init__(self, cutoff = _TOY_CUTOFF, hidden = 64, seed = 0, **kwargs):
+        import torch
+
+        Calculator.__init__(self, **kwargs)
+
+        generator = torch.Generator().manual_seed(seed)
+
+        self.cutoff    = cutoff
+        self.centers   = torch.linspace(0.5, cutoff, hidden, dtype = torch.float64)
+        self.embedding = torch.randn(119, hidden, generator = generator, dtype = torch.float64)
+        self.weight1   = torch.randn(hidden, hidden, generator = generator, dtype = torch.float64) / hidden ** 0.5
+        self.weight2   = torch.randn(hidden, 1, generator = generator, dtype = torch.float64) / hidden ** 0.5
+
+    def calculate(self, atoms = None, properties = ["energy"], system_changes = all_changes):
+        import torch
+        from ase.neighborlist import primitive_neighbor_list
+
+        Calculator.calculate(self, atoms, properties, system_changes)
+
+        positions = self.atoms.get_positions(wrap = True)
+        cell      = self.atoms.cell.array
+
+        ilist, jlist, shifts = primitive_neighbor_list(
+            "ijS", self.atoms.pbc, cell, positions, self.cutoff, self_interaction = False)
+
+        positions = torch.tensor(positions, requires_grad = True)
+        strain    = torch.zeros((3, 3), dtype = torch.float64, requires_grad = True)
+        deform    = torch.eye(3, dtype = torch.float64) + strain
+
+        cell_      = torch.tensor(cell) @ deform
+        positions_ = positions @ deform
+        shifts     = torch.tensor(shifts, dtype = torch.float64)
+
+        ilist   = torch.as_tensor(ilist)
+        jlist   = torch.as_tensor(jlist)
+        numbers = torch.as_tensor(self.atoms.numbers)
+
+        vectors  = positions_[jlist] + shifts @ cell_ - positions_[ilist]
+        distance = vectors.norm(dim = 1)
+
+        smooth = 0.5 * (torch.cos(np.pi * distance / self.cutoff) + 1.0)
+        basis  = torch.exp(-(distance[:, None] - self.centers) ** 2) * smooth[:, None]
+
+        hidden = torch.tanh((basis * self.embedding[numbers[ilist]] * self.embedding[numbers[jlist]]) @ self.weight1)
+        energy = 0.5 * (hidden @ self.weight2).sum()
+
+        grad_positions, grad_strain = torch.autograd.grad(energy, [positions, strain])
+
+        stress = (grad_strain / self.atoms.get_volume()).detach().numpy()
+        stress = 0.5 * (stress + stress.T)
+
+        self.results = {
+            "energy": float(energy),
+            "forces": -grad_positions.detach().numpy(),
+            "stress": stress[[0, 1, 2, 1, 0, 0], [0, 1, 2, 2, 2, 1]]
+        }
+
+def _register_toy():
+    """
+    Register the backend "toy" into the registry of gnnp_backends.py, that is shared by the driver.
+    """
+
+    from gnnp_backends import GNNPBackend, register_backend
+
+    @register_backend("toy")
+    def _load_toy(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+        return GNNPBackend(ToyCalculator(), _TOY_CUTOFF, dftd3 = dftd3)
+
+def make_frames(data_file, size, nframe, sigma = 0.05, seed = 0):
+    """
+    Make frames of the data file replicated to size x size x size, whose atoms are displaced randomly.
+    Args:
+        data_file (str): LAMMPS data file.
+        size (int): number of replicas along each lattice vector.
+        nframe (int): number of frames.
+        sigma (float): standard deviation of displacements in angstroms.
+        seed (int): seed of random numbers.
+    Returns:
+        frames (list): Atoms of frames.
+    """
+
+    atoms = read_data(data_file).repeat((size, size, size))
+    rng   = np.random.default_rng(seed)
+
+    frames = []
+
+    for _ in range(nframe):
+        frame = atoms.copy()
+        frame.positions += rng.normal(scale = sigma, size = frame.positions.shape)
+        frames.append(frame)
+
+    return frames
+
+def read_dump_frames(path, nframe):
+    """
+    Read the first frames of a dump file of LAMMPS (id type xu yu zu),
+    or of a binary trajectory of gnnp_trajectory.py if path is its directory.
+    Args:
+        path (str): path of dump file, or directory of trajectory.
+        nframe (int): number of frames.
+    Returns:
+        frames (list): Atoms of frames.
+    """
+
+    if os.path.isdir(path):
+        from gnnp_trajectory import read_atoms
+
+        return read_atoms(path)[:nframe]
+
+    from ase.io import read
+
+    return read(path, index = ":" + str(nframe), format = "lammps-dump-text", specorder = ["Li", "La", "Zr", "O"])
+
+def run_case(case):
+    """
+    Run a case of benchmark in this process.
+    Args:
+        case (dict): backend, model, size (or dump), stress, dftd3, calls, warmup, and paths.
+    Returns:
+        result (dict): throughput, peak RSS and split of time per phase.
+    """
+
+    profile_path = os.path.join(tempfile.mkdtemp(prefix = "gnnp-bench-"), "profile.json")
+
+    # profile is written only at the end, and results are not cached
+    os.environ["GNNP_PROFILE"]       = profile_path
+    os.environ["GNNP_PROFILE_EVERY"] = str(10 ** 9)
+    os.environ.pop("GNNP_RESULT_CACHE", None)
+    os.environ.pop("GNNP_SERVER", None)
+
+    _register_toy()
+
+    if case["dump"]:
+        frames = read_dump_frames(case["dump"], case["frames"])
+    else:
+        frames = make_frames(case["data"], case["size"], case["frames"])
+
+    natom = len(frames[0])
+
+    driver = load_driver(case["driver"])
+
+    try:
+        driver.gnnp_initialize(case["backend"], case["model"], dftd3 = case["dftd3"], gpu = False)
+    except ImportError as exception:
+        return {"skipped": repr(exception)}
+
+    def call(iframe):
+        atoms = frames[iframe % len(frames)]
+        driver.gnnp_get_energy_forces_stress(atoms.cell.array, atoms.numbers, atoms.positions, case["stress"])
+
+    for icall in range(case["warmup"]):
+        call(icall)
+
+    warmup = _read_phases(driver, profile_path)
+
+    start = time.perf_counter()
+
+    for icall in range(case["calls"]):
+        call(icall)
+
+    elapsed = time.perf_counter() - start
+
+    phases = _read_phases(driver, profile_path)
+
+    # totals of phases are of the whole run, so those of warm-up are subtracted
+    split = {}
+
+    for phase, stats in phases.items():
+        total = stats["total_s"] - warmup.get(phase, {}).get("total_s", 0.0)
+        split[phase] = total / elapsed
+
+    split["other"] = max(1.0 - sum(split.values()), 0.0)
+
+    calls_per_s = case["calls"] / elapsed
+
+    return {
+        "natom":            natom,
+        "calls_per_s":      calls_per_s,
+        "atom_steps_per_s": calls_per_s * natom,
+        "ns_per_day":       calls_per_s * 1.0e-6 * 86400.0,
+        "peak_rss_mb":      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "split":            split
+    }
+
+def _read_phases(driver, profile_path):
+    """
+    Write the profile of driver, and read the phases of it.
+    Args:
+        driver (module): gnnp_driver, that is profiled.
+        profile_path (str): path of JSON file of profile.
+    Returns:
+        phases (dict): statistics of each phase, or empty if nothing is called yet.
+    """
+
+    driver._write_profile()
+
+    if not os.path.isfile(profile_path):
+        return {}
+
+    with open(profile_path) as f:
+        return json.load(f)["phases"]
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Replay benchmark of gnnp_driver.py on CPU.")
+    parser.add_argument("--backends", nargs = "+", default = ["toy"], help = "types of GNNP, e.g. toy orb.")
+    parser.add_argument("--model", default = None, help = "name of model, instead of the default of each backend.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [1, 2, 3, 4], help = "replicas of cell along each axis.")
+    parser.add_argument("--data", default = os.path.join(base_dir, "1000", "cubic-LLZO.data"), help = "LAMMPS data file.")
+    parser.add_argument("--dump", default = None, help = "dump file of LAMMPS (or directory of binary trajectory) to replay, instead of the data file.")
+    parser.add_argument("--frames", type = int, default = 10, help = "number of frames to replay.")
+    parser.add_argument("--calls", type = int, default = 50, help = "number of calls to measure.")
+    parser.add_argument("--warmup", type = int, default = 5, help = "number of calls to warm up.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--json", default = None, help = "path of JSON file to write results into.")
+    parser.add_argument("--case", default = None, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # a case in the child process
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    sizes   = [None] if args.dump else args.sizes
+    results = []
+
+    print("%-8s %5s %6s %6s %5s %10s %14s %9s %8s  %s" % (
+        "backend", "size", "natom", "stress", "d3", "calls/s", "atom-steps/s", "ns/day", "RSS(MB)", "split"))
+
+    for backend in args.backends:
+        for size in sizes:
+            for stress in (False, True):
+                for dftd3 in (False, True):
+                    case = {
+                        "backend": backend,
+                        "model":   args.model or _DEFAULT_MODELS.get(backend),
+                        "size":    size,
+                        "data":    args.data,
+                        "dump":    args.dump,
+                        "frames":  args.frames,
+                        "calls":   args.calls,
+                        "warmup":  args.warmup,
+                        "stress":  stress,
+                        "dftd3":   dftd3,
+                        "driver":  args.driver
+                    }
+
+                    # each case in its own process, for its own peak RSS and state of driver
+                    process = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+                        capture_output = True, text = True, env = dict(os.environ, CUDA_VISIBLE_DEVICES = "")
+                    )
+
+                    if process.returncode != 0:
+                        result = {"skipped": process.stderr.strip().splitlines()[-1:]}
+                    else:
+                        result = json.loads(process.stdout.strip().splitlines()[-1])
+
+                    results.append({"case": case, "result": result})
+
+                    label = "%-8s %5s" % (backend, size if size is not None else "dump")
+
+                    if "skipped" in result:
+                        print("%s %6s %6s %5s  skipped: %s" % (label, "", stress, dftd3, result["skipped"]))
+                        continue
+
+                    split = " ".join("%s=%.0f%%" % (phase, 100.0 * value) for phase, value in sorted(result["split"].items()))
+
+                    print("%s %6d %6s %5s %10.2f %14.1f %9.4f %8.1f  %s" % (
+                        label, result["natom"], stress, dftd3, result["calls_per_s"], result["atom_steps_per_s"],
+                        result["ns_per_day"], result["peak_rss_mb"], split))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+Classical potential of LLZO, i.e. Buckingham + damped shifted force (DSF) Coulomb, evaluated w/ NumPy.
+
+The potential is the same as born/coul/dsf of LAMMPS (sigma = D = 0), with formal charges scaled by a factor.
+Its parameters are fitted to the forces of GNNP, that are sampled by gnnp_driver.py:
+the short-range A and C of each pair of elements and the square of the charge scale enter the forces linearly,
+so they are fitted by non-negative least squares for a fixed rho.
+
+Usage (from LAMMPS/<T>, see ../in_respa):
+    python ../classical_llzo.py fit respa_params.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from scipy.optimize import nnls
+from scipy.special import erfc
+
+FORMAL_CHARGES = {"Li": 1.0, "La": 3.0, "Zr": 4.0, "O": -2.0}
+
+_QQR2E = 14.399645  # Coulomb constant of LAMMPS for metal units, in eV*A/e^2
+
+_DEFAULT_RHO    = 0.3
+_DEFAULT_ALPHA  = 0.2
+_DEFAULT_CUTOFF = 10.0
+
+def samples_path(params_path):
+    """
+    Get the path of the samples of GNNP, that are written by gnnp_driver.py for params_path.
+    Args:
+        params_path (str): path of JSON file of parameters.
+    Returns:
+        path (str): path of file of samples, i.e. a sequence of .npy records (see append_sample).
+    """
+
+    return os.path.splitext(params_path)[0] + "_samples.npy"
+
+def start_samples(path, numbers):
+    """
+    Start the file of samples of GNNP, with the atomic numbers of the sampled atoms and no frames.
+    Args:
+        path (str): path of file of samples.
+        numbers (ndarray): atomic numbers.
+    """
+
+    with open(path, "wb") as f:
+        np.save(f, np.asarray(numbers, dtype = np.int64))
+
+def append_sample(path, cell, positions, forces):
+    """
+    Append a frame of samples of GNNP to the file, as one more .npy record w/o rewriting the previous ones.
+    Args:
+        path (str): path of file of samples.
+        cell (ndarray): lattice vectors in angstroms.
+        positions (ndarray): xyz coordinates in angstroms.
+        forces (ndarray): forces of GNNP in eV/A.
+    """
+
+    frame = np.concatenate([np.ravel(cell), np.ravel(positions), np.ravel(forces)]).astype(np.float64)
+
+    with open(path, "ab") as f:
+        np.save(f, frame)
+
+def load_samples(path):
+    """
+    Load the samples of GNNP, written by start_samples and append_sample.
+    Args:
+        path (str): path of file of samples.
+    Returns:
+        numbers (ndarray): atomic numbers, shape (natom,).
+        cells (ndarray): lattice vectors, shape (nframe, 3, 3).
+        positions (ndarray): xyz coordinates, shape (nframe, natom, 3).
+        forces (ndarray): forces, shape (nframe, natom, 3).
+    """
+
+    frames = []
+
+    with open(path, "rb") as f:
+        numbers = np.load(f)
+
+        while True:
+            # the last record can be incomplete, while the file is written
+            try:
+                frames.append(np.load(f))
+            except (EOFError, ValueError):
+                break
+
+    natom  = len(numbers)
+    frames = np.array(frames).reshape(-1, 9 + 6 * natom)
+
+    cells     = frames[:, :9].reshape(-1, 3, 3)
+    positions = frames[:, 9:9 + 3 * natom].reshape(-1, natom, 3)
+    forces    = frames[:, 9 + 3 * natom:].reshape(-1, natom, 3)
+
+    return numbers, cells, positions, forces
+
+def coeff_path(params_path):
+    """
+    Get the path of the LAMMPS commands of the potential, that are written by fit for params_path.
+    Args:
+        params_path (str): path of JSON file of parameters.
+    Returns:
+        path (str): path of the file to be included by LAMMPS.
+    """
+
+    return os.path.splitext(params_path)[0] + ".lammps"
+
+def pair_key(symbol1, symbol2):
+    """
+    Get the key of a pair of elements, e.g. "La-O".
+    """
+
+    return "-".join(sorted([symbol1, symbol2]))
+
+def load_params(path):
+    """
+    Load parameters of the potential.
+    Args:
+        path (str): path of JSON file.
+    Returns:
+        params (dict): parameters.
+    """
+
+    with open(path) as f:
+        return json.load(f)
+
+def save_params(params, path):
+    """
+    Save parameters of the potential.
+    Args:
+        params (dict): parameters.
+        path (str): path of JSON file.
+    """
+
+    with open(path, "w") as f:
+        json.dump(params, f, indent = 2)
+
+def neighbor_list(cell, positions, cutoff):
+    """
+    Get the full neighbor list, i.e. each pair is listed twice as (i, j) and (j, i).
+    Args:
+        cell (ndarray): lattice vectors in angstroms.
+        positions (ndarray): xyz coordinates in angstroms.
+        cutoff (float): cutoff radius.
+    Returns:
+        ilist (ndarray): indexes of central atoms.
+        jlist (ndarray): indexes of neighbor atoms.
+        vectors (ndarray): vectors from central atoms to neighbor atoms.
+        distances (ndarray): lengths of vectors.
+    """
+
+    from ase.neighborlist import primitive_neighbor_list
+
+    ilist, jlist, distances, vectors = primitive_neighbor_list(
+        "ijdD",
+        pbc              = [True, True, True],
+        cell             = cell,
+        positions        = positions,
+        cutoff           = cutoff,
+        self_interaction = False
+    )
+
+    return ilist, jlist, vectors, distances
+
+def _symbols(numbers):
+    from ase.data import chemical_symbols
+
+    return [chemical_symbols[number] for number in numbers]
+
+def _coulomb_terms(distances, alpha, cutoff):
+    """
+    Get energy and its derivative of the DSF Coulomb per unit charges, as born/coul/dsf of LAMMPS.
+    Returns:
+        energy (ndarray): energy of each pair.
+        denergy (ndarray): derivative of energy w.r.t. distance.
+    """
+
+    e_shift = erfc(alpha * cutoff) / cutoff
+    f_shift = -(e_shift + 2.0 * alpha / np.sqrt(np.pi) * np.exp(-alpha * alpha * cutoff * cutoff)) / cutoff
+
+    erfc_r = erfc(alpha * distances)
+    gauss  = np.exp(-alpha * alpha * distances * distances)
+
+    energy  = _QQR2E * (erfc_r / distances - e_shift - distances * f_shift)
+    denergy = -_QQR2E * (erfc_r / distances ** 2 + 2.0 * alpha / np.sqrt(np.pi) * gauss / distances + f_shift)
+
+    return energy, denergy
+
+def _pair_forces(natom, ilist, vectors, distances, denergy):
+    """
+    Get atomic forces from the derivatives of pair energies on the full neighbor list.
+    """
+
+    weights = (denergy / distances)[:, None] * vectors
+
+    forces = np.zeros((natom, 3))
+    for k in range(3):
+        forces[:, k] = np.bincount(ilist, weights = weights[:, k], minlength = natom)
+
+    return forces
+
+def _pair_stress(volume, vectors, distances, denergy):
+    """
+    Get stress tensor (Voigt order of ASE) from the derivatives of pair energies on the full neighbor list.
+    """
+
+    weights = denergy / distances
+    stress  = 0.5 * np.einsum("p,pa,pb->ab", weights, vectors, vectors) / volume
+
+    return np.array([stress[0, 0], stress[1, 1], stress[2, 2], stress[1, 2], stress[0, 2], stress[0, 1]])
+
+def evaluate(params, numbers, cell, positions, with_stress = True, neighbors = None):
+    """
+    Calculate energy, forces and stress of the classical potential.
+    Args:
+        params (dict): parameters of the potential.
+        numbers (ndarray): atomic numbers.
+        cell (ndarray): lattice vectors in angstroms.
+        positions (ndarray): xyz coordinates in angstroms.
+        with_stress (bool): to calculate stress, or not.
+        neighbors (tuple): full neighbor list within params["cutoff"] from neighbor_list, or None to build it.
+    Returns:
+        energy (float): total energy in eV.
+        forces (ndarray): atomic forces in eV/A.
+        stress (ndarray): stress tensor (Voigt order) in eV/A^3, or None if not with_stress.
+    """
+
+    cell      = np.asarray(cell, dtype = np.float64)
+    positions = np.asarray(positions, dtype = np.float64)
+    symbols   = _symbols(numbers)
+    natom     = len(symbols)
+
+    alpha  = params["alpha"]
+    cutoff = params["cutoff"]
+
+    if neighbors is None:
+        neighbors = neighbor_list(cell, positions, cutoff)
+
+    ilist, jlist, vectors, distances = neighbors
+
+    # parameters of each pair, looked up by the pair of elements
+    elements = sorted(set(symbols))
+    index    = {symbol: k for k, symbol in enumerate(elements)}
+    types    = np.array([index[symbol] for symbol in symbols])
+
+    table_A   = np.zeros((len(elements), len(elements)))
+    table_rho = np.ones ((len(elements), len(elements)))
+    table_C   = np.zeros((len(elements), len(elements)))
+
+    for symbol1 in elements:
+        for symbol2 in elements:
+            key = pair_key(symbol1, symbol2)
+            table_A  [index[symbol1], index[symbol2]] = params["A"]  .get(key, 0.0)
+            table_rho[index[symbol1], index[symbol2]] = params["rho"].get(key, _DEFAULT_RHO)
+            table_C  [index[symbol1], index[symbol2]] = params["C"]  .get(key, 0.0)
+
+    ti = types[ilist]
+    tj = types[jlist]
+
+    A   = table_A  [ti, tj]
+    rho = table_rho[ti, tj]
+    C   = table_C  [ti, tj]
+
+    # Buckingham
+    rexp = np.exp(-distances / rho)
+    r6   = distances ** -6
+
+    energy_pair  = A * rexp - C * r6
+    denergy_pair = -A / rho * rexp + 6.0 * C * r6 / distances
+
+    # DSF Coulomb of scaled formal charges
+    charges = params["charge_scale"] * np.array([FORMAL_CHARGES[symbol] for symbol in symbols])
+    qq      = charges[ilist] * charges[jlist]
+
+    energy_coul, denergy_coul = _coulomb_terms(distances, alpha, cutoff)
+
+    energy_pair  = energy_pair  + qq * energy_coul
+    denergy_pair = denergy_pair + qq * denergy_coul
+
+    e_shift     = erfc(alpha * cutoff) / cutoff
+    energy_self = -(0.5 * e_shift + alpha / np.sqrt(np.pi)) * _QQR2E * np.sum(charges * charges)
+
+    energy = 0.5 * float(np.sum(energy_pair)) + energy_self
+    forces = _pair_forces(natom, ilist, vectors, distances, denergy_pair)
+
+    stress = None
+    if with_stress:
+        stress = _pair_stress(abs(np.linalg.det(cell)), vectors, distances, denergy_pair)
+
+    return energy, forces, stress
+
+def fit(numbers, cells, positions, forces, rho = _DEFAULT_RHO, alpha = _DEFAULT_ALPHA, cutoff = _DEFAULT_CUTOFF):
+    """
+    Fit parameters of the potential to forces of GNNP.
+    Args:
+        numbers (ndarray): atomic numbers, shape (natom,).
+        cells (ndarray): lattice vectors of frames, shape (nframe, 3, 3).
+        positions (ndarray): xyz coordinates of frames, shape (nframe, natom, 3).
+        forces (ndarray): atomic forces of GNNP, shape (nframe, natom, 3).
+        rho (float): rho of Buckingham for all pairs, in angstroms.
+        alpha (float): damping parameter of DSF Coulomb, in 1/A.
+        cutoff (float): cutoff radius.
+    Returns:
+        params (dict): parameters, with RMSE of forces in eV/A.
+    """
+
+    symbols  = _symbols(numbers)
+    natom    = len(symbols)
+    elements = sorted(set(symbols))
+    keys     = sorted(set(pair_key(s1, s2) for s1 in elements for s2 in elements))
+
+    formal = np.array([FORMAL_CHARGES[symbol] for symbol in symbols])
+    key_of = np.array([[pair_key(s1, s2) for s2 in symbols] for s1 in symbols])
+
+    # columns: A and C of each pair, and square of charge scale
+    columns = []
+    targets = []
+
+    for cell, positions_, forces_ in zip(cells, positions, forces):
+        ilist, jlist, vectors, distances = neighbor_list(cell, positions_, cutoff)
+
+        pair_keys = key_of[ilist, jlist]
+
+        frame_columns = []
+
+        for key in keys:
+            mask = (pair_keys == key).astype(np.float64)
+
+            dA = -mask / rho * np.exp(-distances / rho)
+            dC =  mask * 6.0 * distances ** -7
+
+            frame_columns.append(_pair_forces(natom, ilist, vectors, distances, dA).reshape(-1))
+            frame_columns.append(_pair_forces(natom, ilist, vectors, distances, dC).reshape(-1))
+
+        _, dcoul = _coulomb_terms(distances, alpha, cutoff)
+        dcoul    = formal[ilist] * formal[jlist] * dcoul
+
+        frame_columns.append(_pair_forces(natom, ilist, vectors, distances, dcoul).reshape(-1))
+
+        columns.append(np.stack(frame_columns, axis = 1))
+        targets.append(np.asarray(forces_, dtype = np.float64).reshape(-1))
+
+    matrix = np.concatenate(columns)
+    target = np.concatenate(targets)
+
+    # scale columns, since A and C differ by orders of magnitude
+    scale = np.linalg.norm(matrix, axis = 0)
+    scale[scale == 0.0] = 1.0
+
+    solution, _ = nnls(matrix / scale, target)
+    solution    = solution / scale
+
+    rmse = float(np.sqrt(np.mean((matrix @ solution - target) ** 2)))
+
+    params = {
+        "elements":     elements,
+        "alpha":        alpha,
+        "cutoff":       cutoff,
+        "rho":          {key: rho for key in keys},
+        "A":            {key: float(solution[2 * k])     for k, key in enumerate(keys)},
+        "C":            {key: float(solution[2 * k + 1]) for k, key in enumerate(keys)},
+        "charge_scale": float(np.sqrt(solution[-1])),
+        "rmse":         rmse,
+        "nframe":       len(cells)
+    }
+
+    return params
+
+def write_lammps_coeff(params, path, elements = ("Li", "La", "Zr", "O"),
+                       gnnp_style = "gnnp/gpu", driver = "gnnp_driver.py"):
+    """
+    Write LAMMPS commands of the potential, as the inner level of r-RESPA overlaid with GNNP.
+    Args:
+        params (dict): parameters of the potential.
+        path (str): path of the file to be included by LAMMPS.
+        elements (tuple): elements of atom types 1, 2, ...
+        gnnp_style (str): pair style of GNNP.
+        driver (str): driver of GNNP.
+    """
+
+    lines = [
+        "# Buckingham + DSF Coulomb fitted to GNNP by classical_llzo.py (force RMSE {:.4f} eV/A)".format(params["rmse"]),
+        "pair_style  hybrid/overlay born/coul/dsf {} {} {} {}".format(params["alpha"], params["cutoff"], gnnp_style, driver)
+    ]
+
+    for itype, symbol in enumerate(elements, start = 1):
+        charge = params["charge_scale"] * FORMAL_CHARGES[symbol]
+        lines.append("set         type {} charge {:.8f}".format(itype, charge))
+
+    for itype, symbol1 in enumerate(elements, start = 1):
+        for jtype, symbol2 in enumerate(elements, start = 1):
+            if jtype < itype:
+                continue
+
+            key = pair_key(symbol1, symbol2)
+            lines.append("pair_coeff  {} {} born/coul/dsf {:.10g} {:.10g} 0.0 {:.10g} 0.0".format(
+                itype, jtype, params["A"].get(key, 0.0), params["rho"].get(key, _DEFAULT_RHO), params["C"].get(key, 0.0)))
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description = "Fit the classical potential of LLZO to forces of GNNP sampled by gnnp_driver.py.")
+    parser.add_argument("command", choices = ["fit"], help = "command.")
+    parser.add_argument("params", help = "JSON file of parameters to be written, e.g. respa_params.json.")
+    parser.add_argument("--rho", type = float, default = _DEFAULT_RHO, help = "rho of Buckingham in A.")
+    parser.add_argument("--alpha", type = float, default = _DEFAULT_ALPHA, help = "damping of DSF Coulomb in 1/A.")
+    parser.add_argument("--cutoff", type = float, default = _DEFAULT_CUTOFF, help = "cutoff radius in A.")
+    parser.add_argument("--elements", nargs = "+", default = ["Li", "La", "Zr", "O"], help = "elements of atom types.")
+    args = parser.parse_args()
+
+    samples = samples_path(args.params)
+
+    if not os.path.isfile(samples):
+        print(f"[ERROR] Samples of GNNP not found: {samples}", file = sys.stderr)
+        sys.exit(1)
+
+    numbers, cells, positions, forces = load_samples(samples)
+
+    params = fit(
+        numbers,
+        cells,
+        positions,
+        forces,
+        rho    = args.rho,
+        alpha  = args.alpha,
+        cutoff = args.cutoff
+    )
+
+    save_params(params, args.params)
+    write_lammps_coeff(params, coeff_path(args.params), elements = args.elements)
+
+    print(f"[SUCCESS] Fitted to {params['nframe']} frames, force RMSE = {params['rmse']:.4f} eV/A")
+    print(f"[SUCCESS] Wrote {args.params} and {coeff_path(args.params)}")
+
+if __name__ == "__main__":
+    main()
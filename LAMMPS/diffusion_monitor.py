@@ -0,0 +1,182 @@
+"""
+Convergence of the diffusion coefficient of Li, monitored while msd_ngp_Li.txt is written.
+
+The diffusive regime (after the first --skip fraction of time) is split into --blocks blocks,
+MSD is fitted linearly in each block, and D = slope / 6 is averaged over blocks,
+with the standard error of the mean as its error (block averaging).
+
+in_LLZO evaluates gnnp_check_convergence through fix halt with -var converge <target>:
+the run stops as soon as the relative error of D is below the target (but not before t_run / 5),
+and is extended beyond t_run (up to t_extend * t_run) while it is not.
+The files STOP and EXTEND record these decisions, and touching STOP stops the run from outside.
+The batched engine (replica_md.py --converge) uses estimate_diffusion in the same way.
+
+Usage (from LAMMPS/<T>):
+    lmp -in in_LLZO -var converge 0.05
+    python ../diffusion_monitor.py msd_ngp_Li.txt --follow 60
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+_SKIP   = 0.2     # fraction of time excluded as the ballistic and caged regime
+_BLOCKS = 5       # number of blocks
+
+_MIN_POINTS = 4   # points of MSD per block to be fitted
+
+def read_msd(path):
+    """
+    Read MSD of Li written by fix ave/time of in_LLZO, gnnp_analysis.py or replica_md.py.
+    Args:
+        path (str): path of msd_ngp_Li.txt.
+    Returns:
+        times (ndarray): times (or lag times) in ps.
+        msd (ndarray): MSD in A^2.
+    """
+
+    rows = []
+
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+
+            # the last line can be incomplete, while the file is written
+            if not values or values[0].startswith("#") or len(values) < 4:
+                continue
+
+            try:
+                rows.append([float(values[1]), float(values[2])])
+            except ValueError:
+                continue
+
+    rows = np.array(rows).reshape(-1, 2)
+
+    return rows[:, 0], rows[:, 1]
+
+def estimate_diffusion(times, msd, skip = _SKIP, nblock = _BLOCKS):
+    """
+    Estimate the diffusion coefficient by block averaging of the slope of MSD.
+    Args:
+        times (ndarray): times in ps.
+        msd (ndarray): MSD in A^2.
+        skip (float): fraction of time excluded from the fit.
+        nblock (int): number of blocks.
+    Returns:
+        diffusion (float): diffusion coefficient in cm^2/s, or None if there are not enough points.
+        error (float): standard error of diffusion in cm^2/s, or None.
+    """
+
+    if len(times) == 0:
+        return None, None
+
+    window = times >= skip * times[-1]
+
+    times = times[window]
+    msd   = msd[window]
+
+    if len(times) < nblock * _MIN_POINTS:
+        return None, None
+
+    diffusions = []
+
+    for block_times, block_msd in zip(np.array_split(times, nblock), np.array_split(msd, nblock)):
+        slope = np.polyfit(block_times, block_msd, 1)[0]
+
+        # A^2/ps -> cm^2/s, as get_diffusion.py
+        diffusions.append(slope / 6.0 * 1.0e-4)
+
+    diffusions = np.array(diffusions)
+
+    return float(diffusions.mean()), float(diffusions.std(ddof = 1) / np.sqrt(nblock))
+
+def relative_error(diffusion, error):
+    """
+    Get the relative error of the diffusion coefficient.
+    Args:
+        diffusion (float): diffusion coefficient, or None.
+        error (float): standard error, or None.
+    Returns:
+        relative (float): relative error, or inf if it is not estimated.
+    """
+
+    if diffusion is None or diffusion <= 0.0:
+        return float("inf")
+
+    return error / diffusion
+
+def gnnp_check_convergence(step, target, t_run):
+    """
+    Decide whether the run of LAMMPS stops, as a python-style variable of fix halt:
+        variable  halt_run python gnnp_check_convergence
+        python    gnnp_check_convergence input 3 v_step_now ${converge} ${t_run} return v_halt_run format ifii &
+                  here "from diffusion_monitor import gnnp_check_convergence"
+        fix       5 all halt 1000 v_halt_run == 1 error continue
+    MSD is read from $GNNP_MSD_FILE (default msd_ngp_Li.txt).
+    Args:
+        step (int): current timestep.
+        target (float): target of the relative error of D.
+        t_run (int): planned number of timesteps.
+    Returns:
+        halt (int): 1 to stop the run, or 0 to go on.
+    """
+
+    if os.path.isfile("STOP"):
+        return 1
+
+    path = os.environ.get("GNNP_MSD_FILE", "msd_ngp_Li.txt")
+
+    if not os.path.isfile(path):
+        return 0
+
+    diffusion, error = estimate_diffusion(*read_msd(path))
+    relative         = relative_error(diffusion, error)
+
+    if relative < target and step >= t_run // 5:
+        _write_flag("STOP", step, diffusion, error)
+        return 1
+
+    if step >= t_run and not os.path.isfile("EXTEND"):
+        _write_flag("EXTEND", step, diffusion, error)
+
+    return 0
+
+def _write_flag(path, step, diffusion, error):
+    """
+    Write a file of flag, with the estimate of D at the decision.
+    Args:
+        path (str): path of flag file.
+        step (int): timestep.
+        diffusion (float): diffusion coefficient, or None.
+        error (float): standard error, or None.
+    """
+
+    with open(path, "w") as f:
+        f.write("step %d D %s error %s\n" % (step, diffusion, error))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Block-averaged estimate of D of Li, from msd_ngp_Li.txt.")
+    parser.add_argument("msd", help = "MSD file, e.g. msd_ngp_Li.txt.")
+    parser.add_argument("--skip", type = float, default = _SKIP, help = "fraction of time excluded from the fit.")
+    parser.add_argument("--blocks", type = int, default = _BLOCKS, help = "number of blocks.")
+    parser.add_argument("--follow", type = float, default = 0.0, help = "interval in seconds to read the file again, while it is written.")
+    args = parser.parse_args()
+
+    while True:
+        times, msd       = read_msd(args.msd)
+        diffusion, error = estimate_diffusion(times, msd, args.skip, args.blocks)
+
+        if diffusion is None:
+            print("t = %.3f ps: not enough points" % (times[-1] if len(times) > 0 else 0.0))
+        else:
+            print("t = %.3f ps: D = %.3e +/- %.3e cm^2/s (%.1f%%)" % (
+                times[-1], diffusion, error, 100.0 * relative_error(diffusion, error)))
+
+        if args.follow <= 0.0 or os.path.isfile("STOP"):
+            break
+
+        time.sleep(args.follow)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Copyright (c) 2025, AdvanceSoft Corp.
+
+This source code is licensed under the GNU General Public License Version 2
+found in the LICENSE file in the root directory of this source tree.
+"""
+
+# In-situ analysis of in_LLZO, instead of post-processing the trajectory.
+# Frames are given by fix python/invoke, in the same Python interpreter of LAMMPS as gnnp_driver.py,
+# and accumulated into
+#     msd_ngp_Li.txt   MSD and NGP of Li over multiple time origins, as a function of lag time,
+#                      in the format of fix ave/time of in_LLZO (TimeStep is the lag in timesteps)
+#     rdf_1-<t>.dat    partial RDF of Li and atom type t, in the format of ../RDF/<T>/rdf_1-<t>.dat
+# that are rewritten every $GNNP_ANALYSIS_WRITE_EVERY timesteps and at exit.
+
+import atexit
+import os
+import numpy as np
+
+_ELEMENTS = ("Li", "La", "Zr", "O")
+
+_EVERY        = 10       # timesteps between frames, as fix python/invoke of in_LLZO
+_ORIGIN_EVERY = 100      # timesteps between time origins of MSD
+_MAX_LAG      = 50000    # max lag of MSD in timesteps
+_RDF_EVERY    = 100      # timesteps between frames of RDF
+_RDF_CUTOFF   = 10.1     # in angstroms
+_RDF_BIN      = 0.1      # in angstroms
+_WRITE_EVERY  = 1000     # timesteps between writing of results
+
+myAnalysis = None
+
+class InSituAnalysis:
+    """
+    Accumulators of multiple-time-origin MSD / NGP of Li, and partial RDF of Li and each atom type.
+    Attributes:
+        types (ndarray): atom types, ordered by atom IDs.
+        li_type (int): atom type of Li.
+        lithium (ndarray): mask of Li.
+        timestep (float): timestep in ps.
+        every (int): timesteps between frames of MSD.
+        origin_every (int): timesteps between time origins.
+        max_lag (int): max lag in timesteps.
+        rdf_every (int): timesteps between frames of RDF.
+        edges (ndarray): edges of bins of RDF.
+        out_dir (str): directory of outputs.
+        first_step (int): timestep of the first frame, or None.
+        last_step (int): timestep of the last frame, or None.
+        origins (list): timesteps and positions of Li at time origins.
+        msd2, msd4, count (ndarray): sums of squared and quartic displacements, and counts, per lag.
+        rdf_counts (ndarray): counts of pairs per atom type and bin.
+        rdf_frames (int): number of frames of RDF.
+        rdf_volume (float): sum of volumes of frames of RDF.
+    """
+
+    def __init__(self, types, timestep, elements = _ELEMENTS, every = _EVERY, origin_every = _ORIGIN_EVERY,
+                 max_lag = _MAX_LAG, rdf_every = _RDF_EVERY, rdf_cutoff = _RDF_CUTOFF, rdf_bin = _RDF_BIN, out_dir = "."):
+        self.types        = np.asarray(types)
+        self.timestep     = timestep
+        self.li_type      = elements.index("Li") + 1
+        self.lithium      = self.types == self.li_type
+        self.ntype        = len(elements)
+        self.every        = every
+        self.origin_every = origin_every
+        self.max_lag      = max_lag
+        self.rdf_every    = rdf_every
+        self.edges        = np.arange(0.0, rdf_cutoff + 0.5 * rdf_bin, rdf_bin)
+        self.out_dir      = out_dir
+
+        self.first_step = None
+        self.last_step  = None
+        self.origins    = []
+
+        nlag = max_lag // every + 1
+
+        self.msd2  = np.zeros(nlag)
+        self.msd4  = np.zeros(nlag)
+        self.count = np.zeros(nlag)
+
+        self.rdf_counts = np.zeros((self.ntype, len(self.edges) - 1))
+        self.rdf_frames = 0
+        self.rdf_volume = 0.0
+
+    def update(self, step, cell, positions):
+        """
+        Accumulate a frame.
+        Args:
+            step (int): timestep.
+            cell (ndarray): lattice vectors in angstroms.
+            positions (ndarray): unwrapped xyz coordinates in angstroms, ordered by atom IDs.
+        """
+
+        if self.first_step is None:
+            self.first_step = step
+
+        self.last_step = step
+
+        elapsed = step - self.first_step
+
+        if elapsed % self.every == 0:
+            self._update_msd(step, positions[self.lithium])
+
+        if elapsed % self.rdf_every == 0:
+            self._update_rdf(cell, positions)
+
+    def _update_msd(self, step, lithium):
+        if (step - self.first_step) % self.origin_every == 0:
+            self.origins.append((step, lithium.copy()))
+
+        # origins older than max lag do not contribute anymore
+        self.origins = [(origin, ref) for origin, ref in self.origins if step - origin <= self.max_lag]
+
+        lags  = np.array([(step - origin) // self.every for origin, _ in self.origins])
+        refs  = np.array([ref for _, ref in self.origins])
+        disp2 = ((lithium[None] - refs) ** 2).sum(axis = 2)
+
+        np.add.at(self.msd2,  lags, disp2.sum(axis = 1))
+        np.add.at(self.msd4,  lags, (disp2 ** 2).sum(axis = 1))
+        np.add.at(self.count, lags, disp2.shape[1])
+
+    def _update_rdf(self, cell, positions):
+        from ase.neighborlist import primitive_neighbor_list
+
+        # wrapped into the cell, since positions are unwrapped
+        scaled    = positions @ np.linalg.inv(cell)
+        positions = (scaled - np.floor(scaled)) @ cell
+
+        ilist, jlist, distances = primitive_neighbor_list(
+            "ijd",
+            pbc              = [True, True, True],
+            cell             = cell,
+            positions        = positions,
+            cutoff           = self.edges[-1],
+            self_interaction = False
+        )
+
+        center    = self.lithium[ilist]
+        jtypes    = self.types[jlist[center]]
+        distances = distances[center]
+
+        for itype in range(self.ntype):
+            self.rdf_counts[itype] += np.histogram(distances[jtypes == itype + 1], bins = self.edges)[0]
+
+        self.rdf_frames += 1
+        self.rdf_volume += abs(np.linalg.det(cell))
+
+    def write(self):
+        """
+        Write MSD / NGP and RDF into the output files.
+        """
+
+        if self.first_step is None:
+            return
+
+        lines = ["# Time-averaged data for fix 2\n", "# TimeStep v_simtime c_msd_type1[1] c_msd_type1[3]\n"]
+
+        for lag in np.nonzero(self.count)[0]:
+            if lag == 0:
+                continue
+
+            msd2 = self.msd2[lag] / self.count[lag]
+            msd4 = self.msd4[lag] / self.count[lag]
+            ngp  = 3.0 * msd4 / (5.0 * msd2 ** 2) - 1.0 if msd2 > 0.0 else 0.0
+
+            steps = lag * self.every
+            lines.append("%d %g %g %g\n" % (steps, steps * self.timestep, msd2, ngp))
+
+        _write_lines(os.path.join(self.out_dir, "msd_ngp_Li.txt"), lines)
+
+        if self.rdf_frames == 0:
+            return
+
+        centers = 0.5 * (self.edges[1:] + self.edges[:-1])
+        shells  = 4.0 / 3.0 * np.pi * (self.edges[1:] ** 3 - self.edges[:-1] ** 3)
+        volume  = self.rdf_volume / self.rdf_frames
+        nli     = np.count_nonzero(self.lithium)
+
+        for itype in range(self.ntype):
+            nother = np.count_nonzero(self.types == itype + 1) - (1 if itype + 1 == self.li_type else 0)
+            pairs  = self.rdf_counts[itype] / self.rdf_frames
+            ideal  = nli * nother / volume * shells
+            rdf    = np.divide(pairs, ideal, out = np.zeros_like(pairs), where = ideal > 0.0)
+
+            lines = ["# r  g(r)  NumPairs  ShellVolume\n"]
+
+            for values in zip(centers, rdf, pairs, shells):
+                lines.append(" ".join(str(float(value)) for value in values) + "\n")
+
+            _write_lines(os.path.join(self.out_dir, "rdf_1-%d.dat" % (itype + 1)), lines)
+
+def _write_lines(path, lines):
+    """
+    Write lines into a file atomically, so that it can be read while the run goes on.
+    Args:
+        path (str): path of file.
+        lines (list): lines.
+    """
+
+    with open(path + ".tmp", "w") as f:
+        f.writelines(lines)
+
+    os.replace(path + ".tmp", path)
+
+def gnnp_analyze(lmpptr):
+    """
+    Accumulate the current frame of LAMMPS, as the callback of fix python/invoke:
+        python  gnnp_analyze input 1 SELF format p file ../gnnp_analysis.py
+        fix     4 all python/invoke 10 end_of_step gnnp_analyze
+    The interval of fix python/invoke must be $GNNP_ANALYSIS_EVERY (default 10) timesteps.
+    The accumulators are restarted, if the timestep goes back (e.g. reset_timestep).
+    Args:
+        lmpptr: pointer of the LAMMPS instance.
+    """
+
+    global myAnalysis
+
+    from lammps import lammps
+
+    # the directory of this file is on sys.path, since gnnp_driver.py is loaded by pair_style before
+    from gnnp_trajectory import gather_frame
+
+    lmp   = lammps(ptr = lmpptr)
+    frame = gather_frame(lmp)
+
+    # accumulated only by rank 0
+    if frame is None:
+        return
+
+    step, cell, types, positions = frame
+
+    if myAnalysis is not None and myAnalysis.last_step is not None and step <= myAnalysis.last_step:
+        if step == myAnalysis.last_step:
+            return
+
+        myAnalysis = None
+
+    if myAnalysis is None:
+        myAnalysis = InSituAnalysis(
+            types,
+            lmp.extract_global("dt"),
+            every        = int(os.environ.get("GNNP_ANALYSIS_EVERY", _EVERY)),
+            origin_every = int(os.environ.get("GNNP_ANALYSIS_ORIGIN_EVERY", _ORIGIN_EVERY)),
+            max_lag      = int(os.environ.get("GNNP_ANALYSIS_MAX_LAG", _MAX_LAG)),
+            rdf_every    = int(os.environ.get("GNNP_ANALYSIS_RDF_EVERY", _RDF_EVERY))
+        )
+
+    myAnalysis.update(step, cell, positions)
+
+    if (step - myAnalysis.first_step) % int(os.environ.get("GNNP_ANALYSIS_WRITE_EVERY", _WRITE_EVERY)) == 0:
+        myAnalysis.write()
+
+def _write_analysis():
+    """
+    Write the results of the current analysis, at exit.
+    """
+
+    if myAnalysis is not None:
+        myAnalysis.write()
+
+atexit.register(_write_analysis)
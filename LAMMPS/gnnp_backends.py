@@ -0,0 +1,410 @@
+"""
+Copyright (c) 2025, AdvanceSoft Corp.
+
+This source code is licensed under the GNU General Public License Version 2
+found in the LICENSE file in the root directory of this source tree.
+"""
+
+# Registry of GNNP backends, that is shared by gnnp_driver.py of all temperatures.
+# Each backend is registered by name with a loader, and dependencies of a backend
+# are imported only inside its loader, i.e. only when that backend is selected.
+
+import os
+
+_BACKENDS = {}
+
+class GNNPBackend:
+    """
+    Loaded backend of GNNP.
+    Attributes:
+        calculator (Calculator): ASE calculator of GNNP.
+        cutoff (float): cutoff radius.
+        graph_model (Module): model that can be evaluated on a given graph, or None.
+        dftd3 (bool): DFT-D3 has still to be added by driver, or not.
+    """
+
+    def __init__(self, calculator, cutoff, graph_model = None, dftd3 = False):
+        self.calculator  = calculator
+        self.cutoff      = cutoff
+        self.graph_model = graph_model
+        self.dftd3       = dftd3
+
+    @property
+    def with_stress(self):
+        """
+        Stress is supported, or not.
+        """
+
+        return "stress" in self.calculator.implemented_properties
+
+    @property
+    def batching(self):
+        """
+        Graphs of several systems can be evaluated as one batch, or not.
+        """
+
+        return self.graph_model is not None
+
+def register_backend(name):
+    """
+    Register a loader of backend, as decorator.
+    The loader is called as loader(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision),
+    and returns GNNPBackend.
+    Args:
+        name (str): name of backend, i.e. gnnp_type.
+    """
+
+    def register(loader):
+        _BACKENDS[name] = loader
+        return loader
+
+    return register
+
+def available_backends():
+    """
+    Get names of registered backends.
+    Returns:
+        names (list): names of backends.
+    """
+
+    return sorted(_BACKENDS)
+
+def load_backend(gnnp_type, model_name = None, as_path = False, dftd3 = False, gpu = True,
+                 device = "cpu", base_path = None, cache_dir = None, precision = None):
+    """
+    Load a backend of GNNP.
+    Args:
+        gnnp_type (str): type of GNNP.
+        model_name (str): name of model for GNNP.
+        as_path (bool): if true, model_name is path of model file.
+        dftd3 (bool): to add correction of DFT-D3.
+        gpu (bool): using GPU.
+        device (str): device of model.
+        base_path (str): directory of driver, where local models are placed.
+        cache_dir (str): directory of cache of serialized model, or None.
+        precision (str): precision of model (only for orb), or None for the default.
+                         "int8-dynamic" is the float32 model whose linear layers are quantized to int8.
+    Returns:
+        backend (GNNPBackend): loaded backend.
+    """
+
+    loader = _BACKENDS.get(gnnp_type)
+
+    if loader is None:
+        raise ValueError("gnnp_type is incorrect: " + gnnp_type)
+
+    if precision is not None and gnnp_type not in ("orb", "orb-onnx"):
+        raise ValueError("precision is only for orb: " + gnnp_type)
+
+    if base_path is None:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+
+    return loader(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision)
+
+@register_backend("matgl")
+def _load_matgl(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # MatGL
+    import matgl
+    import torch
+    from matgl.ext.ase import PESCalculator
+
+    torch.set_default_device(device)
+
+    if model_name is not None:
+        myPotential = matgl.load_model(model_name)
+    else:
+        myPotential = matgl.load_model("M3GNet-MP-2021.2.8-PES")
+
+    myPotential.to(device)
+
+    myCalculator = PESCalculator(
+        potential      = myPotential,
+        compute_stress = True,
+        stress_unit    = "eV/A3",
+        stress_weight  = 1.0
+    )
+
+    cutoff = myPotential.model.cutoff
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+@register_backend("chgnet")
+def _load_chgnet(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # CHGNet
+    from chgnet.model import CHGNet, CHGNetCalculator
+
+    if model_name is None:
+        myCHGNet = CHGNet.load(use_device = device)
+    elif not as_path:
+        myCHGNet = CHGNet.load(use_device = device, model_name = model_name)
+    else:
+        myCHGNet = CHGNet.from_file(model_name)
+
+    myCalculator = CHGNetCalculator(
+        model      = myCHGNet,
+        use_device = device
+    )
+
+    ratom  = float(myCHGNet.graph_converter.atom_graph_cutoff)
+    rbond  = float(myCHGNet.graph_converter.bond_graph_cutoff)
+    cutoff = max(ratom, rbond)
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+@register_backend("sevennet")
+def _load_sevennet(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    from sevenn.calculator import SevenNetD3Calculator
+
+    if model_name is None:
+        model_name = "7net-0"
+
+    # Build args depending on model
+    calc_kwargs = {"model": model_name, "device": device}
+
+    if model_name == "7net-mf-ompa":
+        # This model requires modal argument
+        calc_kwargs["modal"] = "mpa"  # or "omat24", depending on what you want
+
+    myCalculator = SevenNetD3Calculator(**calc_kwargs)
+
+    cutoff = myCalculator.cutoff if hasattr(myCalculator, "cutoff") else 4.0
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+@register_backend("mace")
+def _load_mace(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # MACE
+    from ase.calculators.mixing import SumCalculator
+    from mace.calculators import mace_mp
+
+    if model_name is None:
+        model = None
+
+    elif model_name.startswith("mace-osaka24"):
+        model_dir  = os.path.normpath(os.path.join(base_path, "mace-osaka24"))
+        model_path = os.path.normpath(os.path.join(model_dir, model_name))
+
+        if not model_path.endswith(".model"):
+            model_path += ".model"
+
+        model = model_path
+
+    else:
+        model = model_name
+
+    myCalculator = mace_mp(
+        model         = model,
+        device        = device,
+        dispersion    = dftd3,
+        damping       = "zero",
+        dispersion_xc = "pbe"
+    )
+
+    if isinstance(myCalculator, SumCalculator):
+        cutoff = myCalculator.mixer.calcs[0].r_max
+    else:
+        cutoff = myCalculator.r_max
+
+    # DFT-D3 is already included
+    return GNNPBackend(myCalculator, cutoff, dftd3 = False)
+
+@register_backend("mace-off")
+def _load_mace_off(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # MACE-OFF
+    from mace.calculators import mace_off
+
+    myCalculator = mace_off(
+        model  = model_name,
+        device = device
+    )
+
+    cutoff = myCalculator.r_max
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+@register_backend("orb")
+def _load_orb(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # Orbital Materials
+    from orb_models.forcefield import pretrained
+    from orb_models.forcefield.calculator import ORBCalculator
+
+    if not as_path and model_name is not None and "d3" in model_name:
+        dftd3 = False
+
+    # int8 is of the linear layers of float32 model, that is quantized after loading
+    quantize = (precision == "int8-dynamic")
+
+    if quantize:
+        if device != "cpu":
+            raise ValueError("int8-dynamic is only on CPU.")
+
+        precision = "float32-highest"
+
+    # precision is given only if specified, to keep the default of each model
+    kwargs = {"device": device}
+
+    if precision is not None:
+        kwargs["precision"] = precision
+
+    if as_path:
+        # fine-tuned model is only for orb_v2
+        model_func = pretrained.orb_v2
+        kwargs["weights_path"] = model_name
+
+    elif model_name is not None and model_name in pretrained.ORB_PRETRAINED_MODELS:
+        model_func = pretrained.ORB_PRETRAINED_MODELS[model_name]
+
+    else:
+        model_func = pretrained.orb_v2
+
+    # weights are cached on disk if cache_dir is given, and loaded by ORB w/ weights_only
+    weights_path = _cached_weights_path(cache_dir)
+
+    if weights_path is not None:
+        orbff = model_func(**dict(kwargs, weights_path = weights_path))
+
+    else:
+        orbff = model_func(**kwargs)
+
+        _save_cached_weights(cache_dir, orbff)
+
+    if quantize:
+        from gnnp_quantize import quantize_dynamic_int8
+
+        orbff = quantize_dynamic_int8(orbff)
+
+    myCalculator = ORBCalculator(orbff, device=device)
+
+    cutoff = 6.0
+
+    # ORB can be evaluated on a given graph, e.g. LAMMPS's neighbor list
+    return GNNPBackend(myCalculator, cutoff, graph_model = orbff, dftd3 = dftd3)
+
+@register_backend("orb-onnx")
+def _load_orb_onnx(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # Orbital Materials on ONNX Runtime (CPU), only for direct-force models
+    # ONNX Runtime is imported first, so that a missing one fails here instead of running on torch
+    import onnxruntime
+    from gnnp_onnx import ONNXCalculator, ONNXGraphModel, is_exportable
+
+    backend = _load_orb(model_name, as_path, dftd3, False, "cpu", base_path, cache_dir, precision)
+
+    # forces and stress of conservative ORB are taken by autograd, that torch.onnx.export cannot trace
+    if not is_exportable(backend.graph_model):
+        raise ValueError("orb-onnx is only for direct-force models of ORB, use orb for " + str(model_name) + ".")
+
+    onnx_dir = os.path.join(cache_dir, "onnx") if cache_dir is not None else None
+
+    graph_model = ONNXGraphModel(backend.graph_model, cache_dir = onnx_dir, model_name = model_name, precision = precision)
+
+    myCalculator = ONNXCalculator(graph_model)
+
+    # graphs of the driver (Verlet list) are also evaluated by ONNX Runtime
+    return GNNPBackend(myCalculator, backend.cutoff, graph_model = graph_model, dftd3 = backend.dftd3)
+
+@register_backend("mattersim")
+def _load_mattersim(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # MatterSim
+    from mattersim.forcefield import MatterSimCalculator
+
+    myCalculator = MatterSimCalculator(
+        load_path      = model_name,
+        compute_stress = True,
+        device         = device
+    )
+
+    cutoff = myCalculator.potential.model.model_args.get("cutoff", 5.0)
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+@register_backend("fairchem")
+def _load_fairchem(model_name, as_path, dftd3, gpu, device, base_path, cache_dir, precision):
+    # FAIR-Chem
+    from fairchem.core.common.relaxation.ase_utils import OCPCalculator
+
+    if as_path:
+        myCalculator = OCPCalculator(
+            checkpoint_path = model_name,
+            cpu             = not gpu
+        )
+
+    else:
+        OMAT_CHECKPTS = {
+            "EquiformerV2-31M-OMat"          : "eqV2_31M_omat.pt",
+            "EquiformerV2-86M-OMat"          : "eqV2_86M_omat.pt",
+            "EquiformerV2-153M-OMat"         : "eqV2_153M_omat.pt",
+            "EquiformerV2-31M-MP"            : "eqV2_31M_mp.pt",
+            "EquiformerV2-31M-DeNS-MP"       : "eqV2_dens_31M_mp.pt",
+            "EquiformerV2-86M-DeNS-MP"       : "eqV2_dens_86M_mp.pt",
+            "EquiformerV2-153M-DeNS-MP"      : "eqV2_dens_153M_mp.pt",
+            "EquiformerV2-31M-OMat-Alex-MP"  : "eqV2_31M_omat_mp_salex.pt",
+            "EquiformerV2-86M-OMat-Alex-MP"  : "eqV2_86M_omat_mp_salex.pt",
+            "EquiformerV2-153M-OMat-Alex-MP" : "eqV2_153M_omat_mp_salex.pt",
+        }
+
+        if model_name is not None:
+            checkpt_name = OMAT_CHECKPTS.get(model_name);
+        else:
+            checkpt_name = OMAT_CHECKPTS.get("EquiformerV2-31M-OMat");
+
+        if checkpt_name is not None:
+            checkpt_dir = os.path.normpath(os.path.join(base_path, "fairchem-omat24"))
+            model_path  = os.path.normpath(os.path.join(checkpt_dir, checkpt_name))
+
+            myCalculator = OCPCalculator(
+                checkpoint_path = model_path,
+                cpu             = not gpu
+            )
+
+        else:
+            #base_path   = os.path.dirname (os.path.abspath(__file__))
+            base_path   = os.path.expanduser("~")
+            checkpt_dir = os.path.normpath(os.path.join(base_path, ".fairchem"))
+
+            myCalculator = OCPCalculator(
+                model_name  = model_name,
+                local_cache = checkpt_dir,
+                cpu         = not gpu
+            )
+
+    cutoff = myCalculator.config["model"].get("max_radius", 8.0)
+
+    return GNNPBackend(myCalculator, cutoff, dftd3 = dftd3)
+
+def _cached_weights_path(cache_dir):
+    """
+    Get the path of the weights (state_dict) in cache, to skip downloading and converting them.
+    Args:
+        cache_dir (str): directory of cache, or None.
+    Returns:
+        weights_path (str): path of weights, or None if not cached.
+    """
+
+    if cache_dir is None:
+        return None
+
+    weights_path = os.path.join(cache_dir, "weights.pt")
+
+    if not os.path.isfile(weights_path):
+        return None
+
+    return weights_path
+
+def _save_cached_weights(cache_dir, model):
+    """
+    Save the weights (state_dict) of model into cache, that is loaded w/o unpickling any object but tensors.
+    Args:
+        cache_dir (str): directory of cache, or None.
+        model (Module): model.
+    """
+
+    import torch
+
+    if cache_dir is None:
+        return
+
+    weights_path = os.path.join(cache_dir, "weights.pt")
+
+    # concurrent runs may write the same file, so replace it at once
+    torch.save(model.state_dict(), weights_path + ".tmp" + str(os.getpid()))
+    os.replace(weights_path + ".tmp" + str(os.getpid()), weights_path)
@@ -0,0 +1,407 @@
+"""
+Copyright (c) 2025, AdvanceSoft Corp.
+
+This source code is licensed under the GNU General Public License Version 2
+found in the LICENSE file in the root directory of this source tree.
+"""
+
+# ONNX Runtime execution of ORB on CPU, that is used by the backend "orb-onnx" of gnnp_backends.py.
+# The model is exported to ONNX with its direct heads of energy, forces and stress on the first call,
+# for the atomic numbers of that call, and evaluated by the CPU execution provider with all graph optimizations.
+# Only direct-force models (e.g. orb-v3-direct-inf-omat) are exported: conservative models
+# (e.g. orb-v3-conservative-inf-omat of in_LLZO) give forces and stress by torch.autograd.grad,
+# that torch.onnx.export cannot trace, so "orb-onnx" refuses them (use "orb").
+# ONNXGraphModel takes graphs as ORB does, so gnnp_driver.py evaluates the graphs of its Verlet list
+# ($GNNP_SKIN) by ONNX Runtime, and ONNXCalculator builds the graph by ORB otherwise.
+# RMSNorm of the MLPs and index_add of ZBL are exported by the symbolics of this module.
+# If the export fails (e.g. an operator is not supported), or the result of ONNX Runtime differs from
+# that of torch, the model falls back to ORB on torch.
+#
+# Parity with ORBCalculator on a data file of LAMMPS (also checked by tests/test_onnx.py on a small model):
+#     python gnnp_onnx.py 1000/cubic-LLZO.data orb-v3-direct-inf-omat
+
+import hashlib
+import inspect
+import os
+import sys
+import warnings
+import numpy as np
+import torch
+
+from ase.calculators.calculator import Calculator, all_changes
+
+_DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "gnnp-onnx")
+
+_PARITY_TOLERANCE = 1.0e-3
+
+_OPSET_VERSION = 17
+
+# the exporter of torch.export (default since torch 2.9) cannot trace the data-dependent branches of ORB,
+# so the TorchScript exporter is used, where torch has both
+_EXPORT_OPTIONS = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+def _rms_norm(g, input, normalized_shape, weight, eps):
+    """
+    Symbolic of aten::rms_norm (nn.RMSNorm of the MLPs of orb-v3) for the TorchScript exporter,
+    that has none for any opset, as input / sqrt(mean(input^2) + eps) * weight.
+    """
+
+    from torch.onnx import symbolic_helper
+
+    shape = symbolic_helper._get_const(normalized_shape, "is", "normalized_shape")
+    dtype = torch.float64 if input.type().scalarType() == "Double" else torch.float32
+
+    # eps of nn.RMSNorm is that of the dtype by default
+    eps = torch.finfo(dtype).eps if symbolic_helper._is_none(eps) else symbolic_helper._get_const(eps, "f", "eps")
+
+    square = g.op("Mul", input, input)
+    mean   = g.op("ReduceMean", square, axes_i = list(range(-len(shape), 0)), keepdims_i = 1)
+    rms    = g.op("Sqrt", g.op("Add", mean, g.op("Constant", value_t = torch.tensor(eps, dtype = dtype))))
+    output = g.op("Div", input, rms)
+
+    return output if symbolic_helper._is_none(weight) else g.op("Mul", output, weight)
+
+def _index_add(g, input, dim, index, source, alpha):
+    """
+    Symbolic of aten::index_add (forces of ZBL of orb-v3) for the TorchScript exporter,
+    whose own one drops the sums of duplicated indexes, as ScatterElements with reduction add.
+    """
+
+    from torch.onnx import symbolic_helper
+
+    dim  = symbolic_helper._get_const(dim, "i", "dim")
+    rank = symbolic_helper._get_tensor_rank(source)
+
+    if not symbolic_helper._is_none(alpha) and symbolic_helper._maybe_get_const(alpha, "f") != 1:
+        source = g.op("Mul", source, g.op("CastLike", alpha, source))
+
+    # index along dim, broadcast to the shape of source
+    shape = [1] * rank
+    shape[dim] = -1
+
+    index = g.op("Reshape", index, g.op("Constant", value_t = torch.tensor(shape, dtype = torch.int64)))
+    index = g.op("Expand",  index, g.op("Shape", source))
+
+    return g.op("ScatterElements", input, index, source, axis_i = dim, reduction_s = "add")
+
+torch.onnx.register_custom_op_symbolic("aten::rms_norm",  _rms_norm,  _OPSET_VERSION)
+torch.onnx.register_custom_op_symbolic("aten::index_add", _index_add, _OPSET_VERSION)
+
+class _EnergyForcesStress(torch.nn.Module):
+    """
+    Direct-force ORB as a function of tensors, to be exported to ONNX.
+    Features of atoms are taken from a graph of the atoms to be exported, as constants.
+    """
+
+    def __init__(self, model, template):
+        super().__init__()
+
+        self.model    = model
+        self.template = template
+
+    def forward(self, positions, cell, senders, receivers, unit_shifts):
+        vectors = positions[receivers] + unit_shifts @ cell - positions[senders]
+
+        node_features   = dict(self.template.node_features)
+        system_features = dict(self.template.system_features)
+
+        node_features  ["positions"] = positions
+        system_features["cell"]      = cell.unsqueeze(0)
+
+        graph = self.template._replace(
+            senders         = senders,
+            receivers       = receivers,
+            n_edge          = senders.new_full((1,), senders.shape[0]),
+            node_features   = node_features,
+            edge_features   = {"vectors": vectors, "unit_shifts": unit_shifts},
+            system_features = system_features
+        )
+
+        out = self.model.predict(graph, split = False)
+
+        return out["energy"], out["forces"], out["stress"]
+
+def is_exportable(model):
+    """
+    Check if ORB can be exported to ONNX, i.e. its forces are not gradients of energy.
+    Args:
+        model (Module): ORB model.
+    Returns:
+        exportable (bool): true for direct-force models.
+    """
+
+    return not hasattr(model, "grad_forces_name")
+
+class ONNXGraphModel:
+    """
+    Direct-force ORB evaluated by ONNX Runtime on CPU, taking graphs of ORB as the model of ORB does,
+    so that it is used as the graph model of gnnp_driver.py.
+    A graph of one system is evaluated by ONNX Runtime, and a batch of several systems by ORB on torch,
+    since the exported model takes the features of atoms of one system as constants.
+    Attributes:
+        regressor (Module): ORB model on CPU, to be exported.
+        model (Module): backbone of ORB, e.g. for the number of message passings.
+        system_config (SystemConfig): config of graph of ORB.
+        cache_dir (str): directory of exported ONNX files.
+        model_key (str): hash of model name, precision and weights, to key the exported files.
+        session (InferenceSession): session of ONNX Runtime, or None before the first call.
+        numbers (Tensor): atomic numbers of the exported model.
+        fallback (bool): ORB on torch is used, since ONNX Runtime cannot be used.
+    """
+
+    def __init__(self, regressor, cache_dir = None, model_name = None, precision = None):
+        if not is_exportable(regressor):
+            raise ValueError("conservative ORB (forces by autograd) cannot be exported to ONNX.")
+
+        self.regressor     = regressor
+        self.model         = regressor.model
+        self.system_config = regressor.system_config
+        self.cache_dir     = os.path.expanduser(cache_dir or _DEFAULT_CACHE_DIR)
+        self.model_key     = _model_key(regressor, model_name, precision)
+        self.session       = None
+        self.numbers       = None
+        self.fallback      = False
+
+    def parameters(self):
+        return self.regressor.parameters()
+
+    def predict(self, graph, split = False):
+        """
+        Predict energy, forces and stress of a graph.
+        Args:
+            graph (AtomGraphs): graph of ORB.
+            split (bool): to split the outputs by systems, as ORB.
+        Returns:
+            out (dict): energy, forces and stress, as tensors.
+        """
+
+        if self.fallback or split or len(graph.n_node) > 1:
+            return self.regressor.predict(graph, split = split)
+
+        numbers = graph.node_features["atomic_numbers"]
+
+        # exported for the atomic numbers of the first call, so exported again if they change
+        if self.session is None or not torch.equal(self.numbers, numbers):
+            try:
+                self._prepare(graph)
+
+            except Exception as exception:
+                warnings.warn("ONNX Runtime is not used, falling back to ORB on torch: " + repr(exception))
+
+                self.fallback = True
+
+                return self.regressor.predict(graph, split = split)
+
+        energy, forces, stress = self._run(graph)
+
+        return {
+            "energy": torch.from_numpy(energy).reshape(1),
+            "forces": torch.from_numpy(forces).reshape(-1, 3),
+            "stress": torch.from_numpy(stress).reshape(1, 6)
+        }
+
+    def _prepare(self, graph):
+        """
+        Export the model for the atoms of graph (or load the exported file), create the session of ONNX Runtime,
+        and check that its result is the same as that of torch.
+        Args:
+            graph (AtomGraphs): graph of ORB.
+        """
+
+        import onnxruntime
+
+        numbers = graph.node_features["atomic_numbers"].detach().cpu()
+
+        key = hashlib.sha256(self.model_key.encode())
+        key.update(numbers.numpy().astype(np.int64).tobytes())
+
+        name = type(self.regressor).__name__ + "-" + key.hexdigest()[:16] + "-torch" + torch.__version__
+        path = os.path.join(self.cache_dir, name + ".onnx")
+
+        os.makedirs(self.cache_dir, exist_ok = True)
+
+        module = _EnergyForcesStress(self.regressor, graph).eval()
+        inputs = _graph_inputs(graph)
+
+        if not os.path.isfile(path):
+            # number of edges changes on every step, so it is a dynamic axis
+            torch.onnx.export(
+                module,
+                tuple(torch.from_numpy(value) for value in inputs.values()),
+                path + ".tmp" + str(os.getpid()),
+                input_names   = list(inputs),
+                output_names  = ["energy", "forces", "stress"],
+                dynamic_axes  = {name: {0: "edges"} for name in ("senders", "receivers", "unit_shifts")},
+                opset_version = _OPSET_VERSION,
+                **_EXPORT_OPTIONS
+            )
+
+            os.replace(path + ".tmp" + str(os.getpid()), path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads     = torch.get_num_threads()
+
+        self.session = onnxruntime.InferenceSession(path, options, providers = ["CPUExecutionProvider"])
+        self.numbers = numbers.to(graph.node_features["atomic_numbers"].device)
+
+        # parity with torch on this graph
+        _, forces, _ = self._run(graph)
+
+        with torch.no_grad():
+            forces_ref = module(*(torch.from_numpy(value) for value in inputs.values()))[1]
+
+        forces_ref = forces_ref.detach().numpy().reshape(-1, 3)
+
+        error = float(np.abs(forces - forces_ref).max())
+
+        if error > _PARITY_TOLERANCE:
+            self.session = None
+            raise RuntimeError("forces of ONNX Runtime differ from torch by " + str(error) + " eV/A.")
+
+    def _run(self, graph):
+        """
+        Evaluate the graph by ONNX Runtime.
+        Args:
+            graph (AtomGraphs): graph of ORB.
+        Returns:
+            energy, forces, stress (ndarray): outputs of model.
+        """
+
+        return self.session.run(["energy", "forces", "stress"], _graph_inputs(graph))
+
+class ONNXCalculator(Calculator):
+    """
+    ASE calculator of ORB, that is evaluated by ONNX Runtime on CPU, building the graph by ORB on every call.
+    Attributes:
+        graph_model (ONNXGraphModel): model on ONNX Runtime.
+    """
+
+    implemented_properties = ["energy", "forces", "stress"]
+
+    def __init__(self, graph_model, **kwargs):
+        Calculator.__init__(self, **kwargs)
+
+        self.graph_model = graph_model
+
+    def calculate(self, atoms = None, properties = None, system_changes = all_changes):
+        from orb_models.forcefield.atomic_system import ase_atoms_to_atom_graphs
+
+        Calculator.calculate(self, atoms, properties, system_changes)
+
+        graph = ase_atoms_to_atom_graphs(self.atoms, system_config = self.graph_model.system_config, device = "cpu")
+
+        with torch.no_grad():
+            out = self.graph_model.predict(graph)
+
+        self.results = {
+            "energy": float(out["energy"].detach().numpy().reshape(-1)[0]),
+            "forces": out["forces"].detach().numpy().astype(np.float64).reshape(-1, 3),
+            "stress": out["stress"].detach().numpy().astype(np.float64).reshape(6)
+        }
+
+def _model_key(model, model_name, precision):
+    """
+    Get the key of model for the exported files, from its name, precision and weights,
+    so that checkpoints and precisions of ORB never share a file.
+    Args:
+        model (Module): ORB model.
+        model_name (str): name or path of model.
+        precision (str): precision of model, or None.
+    Returns:
+        key (str): hex digest.
+    """
+
+    digest = hashlib.sha256()
+    digest.update((str(model_name) + "\n" + str(precision) + "\n").encode())
+
+    for name, value in model.state_dict().items():
+        # packed parameters of quantized layers are not tensors, and are keyed by precision
+        if not torch.is_tensor(value) or value.is_quantized:
+            continue
+
+        digest.update((name + str(value.dtype)).encode())
+        digest.update(value.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+
+    return digest.hexdigest()
+
+def _graph_inputs(graph):
+    """
+    Get the inputs of the exported model from a graph of ORB.
+    Args:
+        graph (AtomGraphs): graph of ORB.
+    Returns:
+        inputs (dict): NumPy arrays of positions, cell, senders, receivers and unit shifts.
+    """
+
+    return {
+        "positions":   graph.node_features["positions"].detach().cpu().numpy(),
+        "cell":        graph.system_features["cell"][0].detach().cpu().numpy(),
+        "senders":     graph.senders.detach().cpu().numpy(),
+        "receivers":   graph.receivers.detach().cpu().numpy(),
+        "unit_shifts": graph.edge_features["unit_shifts"].detach().cpu().numpy()
+    }
+
+def check_parity(data_file, model_name = None, elements = ("Li", "La", "Zr", "O")):
+    """
+    Compare energy, forces and stress of ONNXCalculator with ORBCalculator, on a data file of LAMMPS.
+    Args:
+        data_file (str): LAMMPS data file (atom_style charge).
+        model_name (str): name of model of ORB, that must be a direct-force one.
+        elements (tuple): elements of atom types, as pair_coeff.
+    Returns:
+        errors (dict): max absolute errors of energy, forces and stress, and the calculator that was used.
+    """
+
+    from ase.io import read
+    from gnnp_backends import load_backend
+
+    z_of_type = {itype + 1: number for itype, number in enumerate(_atomic_numbers(elements))}
+
+    atoms = read(data_file, format = "lammps-data", atom_style = "charge", units = "metal", Z_of_type = z_of_type)
+
+    reference = load_backend("orb", model_name, gpu = False, device = "cpu").calculator
+    onnx      = load_backend("orb-onnx", model_name, gpu = False, device = "cpu").calculator
+
+    results = {}
+
+    for name, calculator in (("torch", reference), ("onnx", onnx)):
+        atoms_ = atoms.copy()
+        atoms_.calc = calculator
+
+        results[name] = (atoms_.get_potential_energy(), atoms_.get_forces(), atoms_.get_stress())
+
+    return {
+        "energy":     abs(results["onnx"][0] - results["torch"][0]),
+        "forces":     float(np.abs(results["onnx"][1] - results["torch"][1]).max()),
+        "stress":     float(np.abs(results["onnx"][2] - results["torch"][2]).max()),
+        "calculator": "ONNXCalculator" if isinstance(onnx, ONNXCalculator) and not onnx.graph_model.fallback else "ORBCalculator"
+    }
+
+def _atomic_numbers(elements):
+    """
+    Get atomic numbers of elements.
+    Args:
+        elements (tuple): symbols of elements.
+    Returns:
+        numbers (list): atomic numbers.
+    """
+
+    from ase.data import atomic_numbers
+
+    return [atomic_numbers[element] for element in elements]
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description = "Parity of ONNX Runtime with ORBCalculator, on a LAMMPS data file.")
+    parser.add_argument("data_file", help = "LAMMPS data file, e.g. 1000/cubic-LLZO.data.")
+    parser.add_argument("model_name", nargs = "?", default = None, help = "name of direct-force model, e.g. orb-v3-direct-inf-omat.")
+    args = parser.parse_args()
+
+    errors = check_parity(args.data_file, args.model_name)
+
+    for name, value in errors.items():
+        print(name + ": " + str(value))
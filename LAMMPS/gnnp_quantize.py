@@ -0,0 +1,69 @@
+"""
+Copyright (c) 2025, AdvanceSoft Corp.
+
+This source code is licensed under the GNU General Public License Version 2
+found in the LICENSE file in the root directory of this source tree.
+"""
+
+# Dynamic int8 quantization of the linear layers of GNNP on CPU, that is used by gnnp_backends.py.
+# Weights are quantized to int8 once, and activations are quantized on every call (fbgemm / qnnpack).
+# Quantized linear layers of torch have no backward, so the gradient w.r.t. input is given
+# by the dequantized weights, for conservative models whose forces are gradients of energy.
+
+import torch
+from torch.ao.nn.quantized import dynamic as nnqd
+from torch.ao.quantization import default_dynamic_qconfig
+
+class _Int8LinearFunction(torch.autograd.Function):
+    """
+    Linear layer of int8, whose gradient is passed through the quantization of activations.
+    """
+
+    @staticmethod
+    def forward(ctx, input, quantized, weight):
+        ctx.save_for_backward(weight)
+
+        return quantized(input)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        weight, = ctx.saved_tensors
+
+        return grad_output @ weight, None, None
+
+class DynamicInt8Linear(torch.nn.Module):
+    """
+    Linear layer with int8 weights and dynamically quantized activations.
+    Attributes:
+        quantized (Module): dynamic quantized linear layer of torch.
+        weight_dequantized (Tensor): dequantized weights, for the gradient w.r.t. input.
+    """
+
+    def __init__(self, linear):
+        super().__init__()
+
+        linear.qconfig = default_dynamic_qconfig
+
+        self.quantized = nnqd.Linear.from_float(linear)
+
+        self.register_buffer("weight_dequantized", self.quantized.weight().dequantize())
+
+    def forward(self, input):
+        return _Int8LinearFunction.apply(input, self.quantized, self.weight_dequantized)
+
+def quantize_dynamic_int8(model):
+    """
+    Replace the linear layers of model with dynamic int8 ones, in place.
+    Args:
+        model (Module): model on CPU in float32.
+    Returns:
+        model (Module): quantized model.
+    """
+
+    for name, child in model.named_children():
+        if isinstance(child, torch.nn.Linear):
+            setattr(model, name, DynamicInt8Linear(child))
+        else:
+            quantize_dynamic_int8(child)
+
+    return model
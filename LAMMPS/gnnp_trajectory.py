@@ -0,0 +1,296 @@
+"""
+Copyright (c) 2025, AdvanceSoft Corp.
+
+This source code is licensed under the GNU General Public License Version 2
+found in the LICENSE file in the root directory of this source tree.
+"""
+
+# Binary trajectory of in_LLZO, instead of the text dump (dump custom ... xu yu zu).
+# Frames are appended by fix python/invoke, in the same Python interpreter of LAMMPS as gnnp_driver.py,
+# into chunks of memory-mapped .npy files, that are preallocated for a fixed number of frames:
+#     <trajectory>/header.json       number of atoms, atom types, elements, timestep, frames per chunk
+#     <trajectory>/frames.00000.npy  records of (step, cell, positions), positions are unwrapped in float32
+# The step of a record is written last, and is -1 until the record is written,
+# so that the trajectory can be read while it is written.
+#
+# Reading w/o copy:
+#     header, chunks = open_trajectory("trajectory")
+#     positions = chunks[0]["positions"]   # (nframe, natom, 3), memory-mapped
+
+import atexit
+import json
+import os
+import numpy as np
+
+_DEFAULT_PATH = "trajectory"
+
+_CHUNK_FRAMES = 1000
+
+_ELEMENTS = ("Li", "La", "Zr", "O")
+
+# packed image flags of LAMMPS (imageint of 32 bits)
+_IMGMASK = 1023
+_IMGBITS = 10
+_IMGMAX  = 512
+
+myTrajectory = None
+
+def frame_dtype(natom):
+    """
+    Get the dtype of a record of frame.
+    Args:
+        natom (int): number of atoms.
+    Returns:
+        dtype (dtype): structured dtype of step, cell and positions.
+    """
+
+    return np.dtype([
+        ("step",      np.int64),
+        ("cell",      np.float64, (3, 3)),
+        ("positions", np.float32, (natom, 3))
+    ])
+
+def chunk_path(path, ichunk):
+    """
+    Get the path of a chunk of trajectory.
+    Args:
+        path (str): directory of trajectory.
+        ichunk (int): index of chunk.
+    Returns:
+        path (str): path of .npy file.
+    """
+
+    return os.path.join(path, "frames.%05d.npy" % ichunk)
+
+class TrajectoryWriter:
+    """
+    Writer of binary trajectory, that appends frames into preallocated chunks of memory-mapped .npy.
+    Attributes:
+        path (str): directory of trajectory.
+        natom (int): number of atoms.
+        chunk (int): number of frames per chunk.
+        nframe (int): number of frames written.
+        last_step (int): step of the last frame, or None.
+        frames (memmap): current chunk, or None.
+    """
+
+    def __init__(self, path, types, elements = _ELEMENTS, timestep = None, chunk = _CHUNK_FRAMES):
+        self.path      = path
+        self.natom     = len(types)
+        self.chunk     = chunk
+        self.nframe    = 0
+        self.last_step = None
+        self.frames    = None
+
+        os.makedirs(path, exist_ok = True)
+
+        # chunks of a previous trajectory would be read as a continuation of this one
+        for name in os.listdir(path):
+            if name.startswith("frames.") and name.endswith(".npy"):
+                os.remove(os.path.join(path, name))
+
+        header = {
+            "natom":    self.natom,
+            "types":    [int(itype) for itype in types],
+            "elements": list(elements),
+            "timestep": timestep,
+            "chunk":    chunk
+        }
+
+        with open(os.path.join(path, "header.json.tmp"), "w") as f:
+            json.dump(header, f, indent = 2)
+
+        os.replace(os.path.join(path, "header.json.tmp"), os.path.join(path, "header.json"))
+
+    def append(self, step, cell, positions):
+        """
+        Append a frame.
+        Args:
+            step (int): timestep.
+            cell (ndarray): lattice vectors in angstroms.
+            positions (ndarray): unwrapped xyz coordinates in angstroms, ordered by atom IDs.
+        """
+
+        iframe = self.nframe % self.chunk
+
+        if iframe == 0:
+            self._open_chunk(self.nframe // self.chunk)
+
+        self.frames["cell"]     [iframe] = cell
+        self.frames["positions"][iframe] = positions
+        self.frames["step"]     [iframe] = step
+
+        self.nframe   += 1
+        self.last_step = step
+
+    def close(self):
+        """
+        Flush the current chunk.
+        """
+
+        if self.frames is not None:
+            self.frames.flush()
+            self.frames = None
+
+    def _open_chunk(self, ichunk):
+        self.close()
+
+        self.frames = np.lib.format.open_memmap(
+            chunk_path(self.path, ichunk), mode = "w+", dtype = frame_dtype(self.natom), shape = (self.chunk,))
+
+        self.frames["step"] = -1
+
+def open_trajectory(path):
+    """
+    Open the binary trajectory w/o copy.
+    Args:
+        path (str): directory of trajectory.
+    Returns:
+        header (dict): number of atoms, atom types, elements, timestep and frames per chunk.
+        chunks (list): memory-mapped records of the written frames of each chunk.
+    """
+
+    with open(os.path.join(path, "header.json")) as f:
+        header = json.load(f)
+
+    chunks = []
+    ichunk = 0
+
+    while os.path.isfile(chunk_path(path, ichunk)):
+        frames  = np.load(chunk_path(path, ichunk), mmap_mode = "r")
+        nframe  = int(np.count_nonzero(frames["step"] >= 0))
+        ichunk += 1
+
+        if nframe > 0:
+            chunks.append(frames[:nframe])
+
+    return header, chunks
+
+def read_trajectory(path, stride = 1):
+    """
+    Read all frames of the binary trajectory into arrays.
+    Args:
+        path (str): directory of trajectory.
+        stride (int): interval of frames.
+    Returns:
+        header (dict): header of trajectory.
+        steps (ndarray): timesteps, shape (nframe,).
+        cells (ndarray): lattice vectors, shape (nframe, 3, 3).
+        positions (ndarray): unwrapped positions, shape (nframe, natom, 3).
+    """
+
+    header, chunks = open_trajectory(path)
+
+    if not chunks:
+        natom = header["natom"]
+        return header, np.zeros(0, dtype = np.int64), np.zeros((0, 3, 3)), np.zeros((0, natom, 3), dtype = np.float32)
+
+    frames = np.concatenate(chunks)[::stride]
+
+    return header, frames["step"], frames["cell"], frames["positions"]
+
+def read_atoms(path, stride = 1):
+    """
+    Read frames of the binary trajectory as Atoms of ASE, as the dump file is read by ase.io.read.
+    Args:
+        path (str): directory of trajectory.
+        stride (int): interval of frames.
+    Returns:
+        frames (list): Atoms of frames.
+    """
+
+    from ase import Atoms
+    from ase.data import atomic_numbers
+
+    header, _, cells, positions = read_trajectory(path, stride)
+
+    numbers = [atomic_numbers[header["elements"][itype - 1]] for itype in header["types"]]
+
+    return [
+        Atoms(numbers = numbers, positions = positions[iframe], cell = cells[iframe], pbc = True)
+        for iframe in range(len(positions))
+    ]
+
+def gather_frame(lmp):
+    """
+    Gather the current frame of LAMMPS by atom IDs over all ranks.
+    Args:
+        lmp (lammps): LAMMPS instance.
+    Returns:
+        step (int): timestep.
+        cell (ndarray): lattice vectors in angstroms.
+        types (ndarray): atom types.
+        positions (ndarray): unwrapped xyz coordinates in angstroms.
+        or None on ranks other than 0.
+    """
+
+    natom = lmp.get_natoms()
+    x     = np.ctypeslib.as_array(lmp.gather_atoms("x", 1, 3)).reshape(natom, 3)
+    image = np.ctypeslib.as_array(lmp.gather_atoms("image", 0, 1)).astype(np.int64)
+    types = np.ctypeslib.as_array(lmp.gather_atoms("type", 0, 1))
+
+    if lmp.extract_setting("world_rank") != 0:
+        return None
+
+    boxlo, boxhi, xy, yz, xz, _, _ = lmp.extract_box()
+
+    cell = np.array([
+        [boxhi[0] - boxlo[0], 0.0,                 0.0                ],
+        [xy,                  boxhi[1] - boxlo[1], 0.0                ],
+        [xz,                  yz,                  boxhi[2] - boxlo[2]]
+    ])
+
+    shifts = np.stack([
+        (image & _IMGMASK) - _IMGMAX,
+        (image >> _IMGBITS & _IMGMASK) - _IMGMAX,
+        (image >> 2 * _IMGBITS) - _IMGMAX
+    ], axis = 1)
+
+    return lmp.extract_global("ntimestep"), cell, types, x + shifts @ cell
+
+def gnnp_dump_trajectory(lmpptr):
+    """
+    Append the current frame of LAMMPS to the binary trajectory, as the callback of fix python/invoke:
+        python  gnnp_dump_trajectory input 1 SELF format p file ../gnnp_trajectory.py
+        fix     3 all python/invoke 100 end_of_step gnnp_dump_trajectory
+    The directory of trajectory is $GNNP_TRAJECTORY (default "trajectory").
+    The trajectory is restarted, if the timestep goes back (e.g. reset_timestep).
+    Args:
+        lmpptr: pointer of the LAMMPS instance.
+    """
+
+    global myTrajectory
+
+    from lammps import lammps
+
+    lmp   = lammps(ptr = lmpptr)
+    frame = gather_frame(lmp)
+
+    # written only by rank 0
+    if frame is None:
+        return
+
+    step, cell, types, positions = frame
+
+    if myTrajectory is not None and myTrajectory.last_step is not None and step <= myTrajectory.last_step:
+        if step == myTrajectory.last_step:
+            return
+
+        myTrajectory.close()
+        myTrajectory = None
+
+    if myTrajectory is None:
+        myTrajectory = TrajectoryWriter(
+            os.environ.get("GNNP_TRAJECTORY", _DEFAULT_PATH), types, timestep = lmp.extract_global("dt"))
+
+    myTrajectory.append(step, cell, positions)
+
+def _close_trajectory():
+    """
+    Close the current trajectory, at exit.
+    """
+
+    if myTrajectory is not None:
+        myTrajectory.close()
+
+atexit.register(_close_trajectory)
@@ -0,0 +1,171 @@
+"""
+Cache of the minimized starting structure, that is shared by the runs of all temperatures.
+
+All temperatures read the same data file with the same model, and minimize it with the same settings.
+The minimized structure is written by the first run (write_data in in_LLZO, then renamed into place),
+and is read by the other runs instead of minimizing again.
+The first run records its host and PID in the lock (gnnp_claim_minimize), so that the waiting runs
+take over the lock if that run has died.
+
+Usage (from LAMMPS/<T>):
+    lmp -in in_LLZO -var min_data $(python ../minimize_cache.py cubic-LLZO.data orb-v3-conservative-inf-omat)
+"""
+
+import argparse
+import hashlib
+import os
+import socket
+import sys
+import time
+
+_DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "gnnp-minimized")
+
+_CLAIM_TIMEOUT = 600.0     # seconds for LAMMPS to start and record its PID in the lock
+_TIMEOUT       = 7200.0    # seconds to wait for a run on another host, whose PID cannot be checked
+
+def minimized_data_path(data_file, model_name, etol = 1e-10, ftol = 1e-10, maxiter = 10000, maxeval = 10000,
+                        min_style = "cg", cache_dir = _DEFAULT_CACHE_DIR):
+    """
+    Get the path of the minimized structure in cache.
+    Args:
+        data_file (str): LAMMPS data file, that is minimized.
+        model_name (str): name of model of GNNP.
+        etol (float): stopping tolerance for energy of minimize.
+        ftol (float): stopping tolerance for force of minimize.
+        maxiter (int): max iterations of minimize.
+        maxeval (int): max number of force evaluations of minimize.
+        min_style (str): min_style of LAMMPS.
+        cache_dir (str): directory of cache.
+    Returns:
+        path (str): path of the minimized data file, keyed by the content of data file, model and settings.
+    """
+
+    digest = hashlib.sha256()
+
+    with open(data_file, "rb") as f:
+        digest.update(f.read())
+
+    settings = [model_name, min_style, repr(float(etol)), repr(float(ftol)), str(int(maxiter)), str(int(maxeval))]
+    digest.update("\n".join(settings).encode())
+
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok = True)
+
+    return os.path.join(cache_dir, digest.hexdigest()[:32] + ".data")
+
+def claim_or_wait(path, poll = 5.0, timeout = _TIMEOUT, claim_timeout = _CLAIM_TIMEOUT):
+    """
+    Decide which run minimizes the structure, when the runs are launched together.
+    The first run takes the lock and minimizes (in_LLZO removes the lock after renaming the data file into place),
+    and the others wait until the minimized structure is written.
+    Args:
+        path (str): path of the minimized data file.
+        poll (float): interval to check the lock, in seconds.
+        timeout (float): time to wait, in seconds. the lock is taken over after it.
+        claim_timeout (float): time in seconds for the run to record its PID in the lock.
+                               the lock is taken over after it, if no PID is recorded.
+    """
+
+    lock  = path + ".lock"
+    start = time.time()
+
+    while not os.path.isfile(path):
+        try:
+            # creating the lock file is atomic, so only one run takes it
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+
+        except FileExistsError:
+            if _is_stale(lock, claim_timeout) or time.time() - start > timeout:
+                try:
+                    os.remove(lock)
+                except FileNotFoundError:
+                    pass
+
+                continue
+
+            time.sleep(poll)
+
+def _is_stale(lock, claim_timeout):
+    """
+    Check if the lock is left by a run that has died.
+    Args:
+        lock (str): path of the lock file.
+        claim_timeout (float): time in seconds for the run to record its PID in the lock.
+    Returns:
+        stale (bool): true if the owner is dead, or no owner has been recorded in time.
+    """
+
+    try:
+        with open(lock) as f:
+            owner = f.read().split()
+
+        age = time.time() - os.path.getmtime(lock)
+
+    except OSError:
+        return False
+
+    if not owner:
+        return age > claim_timeout
+
+    # PID can be checked only on the same host
+    if len(owner) != 2 or owner[0] != socket.gethostname():
+        return False
+
+    try:
+        os.kill(int(owner[1]), 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        return False
+
+    return False
+
+def gnnp_claim_minimize(path):
+    """
+    Record the host and PID of this LAMMPS process in the lock, as a python function of in_LLZO:
+        python  gnnp_claim_minimize input 1 ${min_data} format s here "from minimize_cache import gnnp_claim_minimize"
+        python  gnnp_claim_minimize invoke
+    Args:
+        path (str): path of the minimized data file.
+    """
+
+    with open(path + ".lock", "w") as f:
+        f.write("%s %d\n" % (socket.gethostname(), os.getpid()))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Print the path of the cached minimized structure, for -var min_data of in_LLZO.")
+    parser.add_argument("data_file", help = "LAMMPS data file, e.g. cubic-LLZO.data.")
+    parser.add_argument("model_name", help = "name of model of GNNP, as pair_coeff.")
+    parser.add_argument("--etol", type = float, default = 1e-10, help = "stopping tolerance for energy.")
+    parser.add_argument("--ftol", type = float, default = 1e-10, help = "stopping tolerance for force.")
+    parser.add_argument("--maxiter", type = int, default = 10000, help = "max iterations.")
+    parser.add_argument("--maxeval", type = int, default = 10000, help = "max number of force evaluations.")
+    parser.add_argument("--min-style", default = "cg", help = "min_style of LAMMPS.")
+    parser.add_argument("--cache-dir", default = _DEFAULT_CACHE_DIR, help = "directory of cache.")
+    parser.add_argument("--no-wait", action = "store_true", help = "not to wait for a run that is minimizing.")
+    parser.add_argument("--timeout", type = float, default = _TIMEOUT, help = "time in seconds to wait for a run on another host.")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.data_file):
+        print(f"[ERROR] File not found: {args.data_file}", file = sys.stderr)
+        sys.exit(1)
+
+    path = minimized_data_path(
+        args.data_file,
+        args.model_name,
+        etol      = args.etol,
+        ftol      = args.ftol,
+        maxiter   = args.maxiter,
+        maxeval   = args.maxeval,
+        min_style = args.min_style,
+        cache_dir = args.cache_dir
+    )
+
+    if not args.no_wait:
+        claim_or_wait(path, timeout = args.timeout)
+
+    print(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Error of forces of GNNP in a reduced precision (e.g. int8-dynamic), against float64, on a reference trajectory.
+
+Frames of the trajectory (trajectory/ or dump.lammpstrj of in_LLZO) are evaluated by two drivers,
+one in the precision to be checked and one in float64, and RMSE and max error of forces are reported
+for all atoms and for Li, with the time per call of each.
+
+Usage (from LAMMPS):
+    python precision_check.py 1000/trajectory --precision int8-dynamic --stride 10
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from replica_md import load_driver
+
+_ELEMENTS = ("Li", "La", "Zr", "O")
+
+def read_frames(path, stride = 1, elements = _ELEMENTS):
+    """
+    Read frames of the dump file of LAMMPS, or of the binary trajectory of gnnp_trajectory.py.
+    Args:
+        path (str): path of dump file (id type xu yu zu), or directory of binary trajectory.
+        stride (int): interval of frames.
+        elements (tuple): elements of atom types, as pair_coeff.
+    Returns:
+        frames (list): Atoms of frames.
+    """
+
+    if os.path.isdir(path):
+        from gnnp_trajectory import read_atoms
+
+        return read_atoms(path, stride)
+
+    from ase.io import read
+
+    return read(path, index = "::" + str(stride), format = "lammps-dump-text", specorder = list(elements))
+
+def compare(driver, reference, frames):
+    """
+    Compare forces of two drivers on frames.
+    Args:
+        driver (module): gnnp_driver in the precision to be checked.
+        reference (module): gnnp_driver in float64.
+        frames (list): Atoms of frames.
+    Returns:
+        report (dict): errors of forces and time per call.
+    """
+
+    errors  = []
+    lithium = []
+    times   = {"checked": 0.0, "float64": 0.0}
+
+    for atoms in frames:
+        args = (atoms.cell.array, atoms.numbers, atoms.positions)
+
+        forces     = np.zeros((len(atoms), 3))
+        forces_ref = np.zeros((len(atoms), 3))
+
+        start = time.perf_counter()
+        driver.gnnp_compute_into(*args, forces, eflag = 0, vflag = 0)
+        times["checked"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        reference.gnnp_compute_into(*args, forces_ref, eflag = 0, vflag = 0)
+        times["float64"] += time.perf_counter() - start
+
+        error = forces - forces_ref
+
+        errors.append(error)
+        lithium.append(error[atoms.numbers == 3])
+
+    errors  = np.concatenate(errors)
+    lithium = np.concatenate(lithium)
+
+    return {
+        "frames":          len(frames),
+        "rmse":            float(np.sqrt(np.mean(errors ** 2))),
+        "max":             float(np.abs(errors).max()),
+        "rmse_li":         float(np.sqrt(np.mean(lithium ** 2))),
+        "max_li":          float(np.abs(lithium).max()),
+        "ms_per_call":     times["checked"] / len(frames) * 1.0e3,
+        "ms_per_call_f64": times["float64"] / len(frames) * 1.0e3
+    }
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Error of forces of GNNP in a precision against float64, on a trajectory.")
+    parser.add_argument("trajectory", help = "binary trajectory or dump file of LAMMPS (id type xu yu zu).")
+    parser.add_argument("--precision", default = "int8-dynamic", help = "precision to be checked.")
+    parser.add_argument("--stride", type = int, default = 10, help = "interval of frames.")
+    parser.add_argument("--gnnp-type", default = "orb", help = "type of GNNP.")
+    parser.add_argument("--model", default = "orb-v3-conservative-inf-omat", help = "name of model.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    args = parser.parse_args()
+
+    # errors are reported here, not refused by the driver
+    os.environ["GNNP_PRECISION_CHECK_FRAMES"] = "0"
+
+    driver    = load_driver(args.driver)
+    reference = load_driver(args.driver)
+
+    driver   .gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu, precision = args.precision)
+    reference.gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu, precision = "float64")
+
+    report = compare(driver, reference, read_frames(args.trajectory, args.stride))
+    report["precision"] = args.precision
+
+    print(json.dumps(report, indent = 2))
+
+if __name__ == "__main__":
+    main()
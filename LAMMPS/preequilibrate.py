@@ -0,0 +1,324 @@
+"""
+Classical pre-equilibration of LLZO, before the production run of in_LLZO w/ GNNP.
+
+The structure is thermalised at T by NVT (velocity Verlet + Nose-Hoover chains, as fix nvt of LAMMPS)
+on the classical potential of classical_llzo.py, whose forces are evaluated w/ NumPy on a Verlet list
+of cell lists (ase.neighborlist), that is rebuilt only when an atom moves more than half of the skin.
+The parameters of the potential are fitted to GNNP forces of a few randomly displaced copies of the structure,
+so that the framework relaxes around the same local minima as those of GNNP.
+With --relax-volume, the cell is first scaled isotropically to zero pressure of GNNP (see relax_volume),
+and the potential is fitted and the NVT run in the scaled cell, so that the framework strain is also relaxed.
+
+The final positions and velocities are written as a LAMMPS data file (atom_style charge, with Velocities),
+that in_LLZO reads instead of the minimization and velocity create, if given by -var preeq_data.
+The cell is not changed w/o --relax-volume, and the production run is NVT in the cell of the written data file.
+
+Usage (from LAMMPS/<T>):
+    python ../preequilibrate.py cubic-LLZO.data --temperature 1000 --out preeq.data [--relax-volume]
+    lmp -in in_LLZO -var preeq_data preeq.data
+The minimized structure of minimize_cache.py can be given instead of cubic-LLZO.data.
+"""
+
+import argparse
+import os
+import warnings
+import numpy as np
+
+import classical_llzo
+from replica_md import NoseHooverChains, create_velocities, kinetic_energies, load_driver, read_data
+
+_BOLTZ = 8.617343e-5        # eV/K, as units metal of LAMMPS
+_FTM2V = 1.0 / 1.0364269e-4 # eV/A/amu -> A/ps^2
+
+_ELEMENTS = ("Li", "La", "Zr", "O")
+
+class VerletList:
+    """
+    Neighbor list of the classical potential, built within cutoff + skin and reused until an atom moves skin / 2.
+    Attributes:
+        cutoff (float): cutoff radius of the potential.
+        skin (float): skin distance.
+        ilist, jlist (ndarray): indexes of pairs within cutoff + skin.
+        shifts (ndarray): shifts of cell of pairs, for unwrapped positions.
+        reference (ndarray): positions at the last build.
+        nbuild (int): number of builds.
+    """
+
+    def __init__(self, cutoff, skin = 1.0):
+        self.cutoff    = cutoff
+        self.skin      = skin
+        self.reference = None
+        self.nbuild    = 0
+
+    def get(self, cell, positions):
+        """
+        Get the full neighbor list within cutoff, as classical_llzo.neighbor_list.
+        Args:
+            cell (ndarray): lattice vectors in angstroms.
+            positions (ndarray): unwrapped xyz coordinates in angstroms.
+        Returns:
+            neighbors (tuple): ilist, jlist, vectors and distances.
+        """
+
+        if self.reference is None or \
+           np.sqrt(((positions - self.reference) ** 2).sum(axis = 1).max()) > 0.5 * self.skin:
+            self._build(cell, positions)
+
+        vectors   = positions[self.jlist] + self.shifts @ cell - positions[self.ilist]
+        distances = np.sqrt((vectors ** 2).sum(axis = 1))
+        within    = distances < self.cutoff
+
+        return self.ilist[within], self.jlist[within], vectors[within], distances[within]
+
+    def _build(self, cell, positions):
+        from ase.neighborlist import primitive_neighbor_list
+
+        # the list is built on wrapped positions, and its shifts are corrected for unwrapped ones
+        wrap = np.floor(positions @ np.linalg.inv(cell))
+
+        ilist, jlist, shifts = primitive_neighbor_list(
+            "ijS",
+            pbc              = [True, True, True],
+            cell             = cell,
+            positions        = positions - wrap @ cell,
+            cutoff           = self.cutoff + self.skin,
+            self_interaction = False
+        )
+
+        self.ilist     = ilist
+        self.jlist     = jlist
+        self.shifts    = shifts + wrap[ilist] - wrap[jlist]
+        self.reference = positions.copy()
+        self.nbuild   += 1
+
+def relax_volume(driver, atoms, strains = np.linspace(-0.02, 0.02, 5), max_strain = 0.05):
+    """
+    Scale the cell and positions isotropically to zero pressure of GNNP, at 0 K.
+    The pressure is evaluated on the scaled copies of strains, and its root is taken by a linear fit,
+    which is enough near the minimum. The thermal expansion at T is not included.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): structure, that is scaled in place.
+        strains (ndarray): linear strains of the scaled copies.
+        max_strain (float): bound of the linear strain, that is applied.
+    Returns:
+        strain (float): linear strain, that is applied.
+    """
+
+    pressures = []
+
+    for strain in strains:
+        cell      = atoms.cell.array * (1.0 + strain)
+        positions = atoms.positions  * (1.0 + strain)
+
+        _, _, stress = driver.gnnp_get_energy_forces_stress(cell, atoms.numbers, positions, with_stress = True)
+
+        # stress is in eV/A^3 (Voigt order), positive if tensile, as ASE
+        pressures.append(-np.mean(stress[:3]))
+
+    slope, intercept = np.polyfit(strains, pressures, 1)
+
+    strain = -intercept / slope
+
+    if not abs(strain) <= max_strain:
+        warnings.warn("strain of zero pressure (%.4f) is bound to %.4f" % (strain, max_strain))
+        strain = np.clip(np.nan_to_num(strain), -max_strain, max_strain)
+
+    atoms.set_cell(atoms.cell.array * (1.0 + strain), scale_atoms = True)
+
+    return strain
+
+def fit_params(driver, atoms, nframe = 10, sigma = 0.1, seed = 0):
+    """
+    Fit the classical potential to GNNP forces of randomly displaced copies of the structure.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): structure.
+        nframe (int): number of displaced copies.
+        sigma (float): standard deviation of displacements in angstroms, about the thermal ones.
+        seed (int): seed of random numbers.
+    Returns:
+        params (dict): parameters of classical_llzo.py.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    cells     = []
+    positions = []
+    forces    = []
+
+    for _ in range(nframe):
+        frame        = atoms.positions + rng.normal(scale = sigma, size = atoms.positions.shape)
+        frame_forces = np.zeros_like(frame)
+
+        driver.gnnp_compute_into(atoms.cell.array, atoms.numbers, frame, frame_forces, eflag = 0, vflag = 0)
+
+        cells    .append(atoms.cell.array)
+        positions.append(frame)
+        forces   .append(frame_forces)
+
+    return classical_llzo.fit(atoms.numbers, np.array(cells), np.array(positions), np.array(forces))
+
+def run(params, atoms, temperature, steps, seed = 12345, timestep = 0.001, tdamp = 0.05, skin = 1.0, thermo = 1000):
+    """
+    Run NVT of the classical potential.
+    Args:
+        params (dict): parameters of classical_llzo.py.
+        atoms (Atoms): starting structure.
+        temperature (float): temperature in K.
+        steps (int): number of timesteps.
+        seed (int): seed of velocities.
+        timestep (float): timestep in ps.
+        tdamp (float): damping time of thermostat in ps.
+        skin (float): skin distance of the Verlet list.
+        thermo (int): interval of log.
+    Returns:
+        positions (ndarray): final unwrapped positions in angstroms.
+        velocities (ndarray): final velocities in A/ps.
+    """
+
+    natom = len(atoms)
+    tdof  = 3 * natom - 3
+
+    cell    = atoms.cell.array
+    numbers = atoms.numbers
+    masses  = atoms.get_masses()
+
+    positions  = atoms.positions.copy()
+    velocities = create_velocities(masses, temperature, seed)[None]
+
+    thermostat = NoseHooverChains([temperature], tdof, tdamp)
+    neighbors  = VerletList(params["cutoff"], skin)
+
+    def compute_forces():
+        energy, forces, _ = classical_llzo.evaluate(
+            params, numbers, cell, positions, with_stress = False, neighbors = neighbors.get(cell, positions))
+
+        return energy, forces
+
+    energy, forces = compute_forces()
+
+    accel = _FTM2V / masses[:, None]
+
+    print("%8s %10s %14s" % ("Step", "Temp", "PotEng"))
+
+    for step in range(1, steps + 1):
+        velocities *= thermostat.half_step(kinetic_energies(masses, velocities), timestep)[:, None, None]
+
+        velocities[0] += 0.5 * timestep * forces * accel
+        positions     += timestep * velocities[0]
+
+        energy, forces = compute_forces()
+
+        velocities[0] += 0.5 * timestep * forces * accel
+
+        velocities *= thermostat.half_step(kinetic_energies(masses, velocities), timestep)[:, None, None]
+
+        if step % thermo == 0 or step == steps:
+            temp = 2.0 * kinetic_energies(masses, velocities)[0] / (tdof * _BOLTZ)
+            print("%8d %10.2f %14.6f" % (step, temp, energy))
+
+    print("[INFO] Verlet list was built %d times in %d steps" % (neighbors.nbuild, steps))
+
+    return positions, velocities[0]
+
+def write_data(path, atoms, positions, velocities, elements = _ELEMENTS):
+    """
+    Write a LAMMPS data file (atom_style charge) with velocities, as write_data of LAMMPS.
+    Args:
+        path (str): path of data file.
+        atoms (Atoms): structure, for cell, atom types and masses.
+        positions (ndarray): positions in angstroms, that are wrapped into the cell.
+        velocities (ndarray): velocities in A/ps.
+        elements (tuple): elements of atom types, as pair_coeff.
+    """
+
+    cell    = atoms.cell.array
+    symbols = atoms.get_chemical_symbols()
+    masses  = atoms.get_masses()
+    types   = np.array([elements.index(symbol) + 1 for symbol in symbols])
+
+    # the cell of LAMMPS is lower triangular, so wrapping is done in fractional coordinates
+    scaled    = positions @ np.linalg.inv(cell)
+    positions = (scaled - np.floor(scaled)) @ cell
+
+    with open(path + ".tmp", "w") as f:
+        f.write("LAMMPS data file written by preequilibrate.py\n\n")
+        f.write("%d atoms\n" % len(positions))
+        f.write("%d atom types\n\n" % len(elements))
+
+        f.write("0.0 %.16f xlo xhi\n" % cell[0, 0])
+        f.write("0.0 %.16f ylo yhi\n" % cell[1, 1])
+        f.write("0.0 %.16f zlo zhi\n" % cell[2, 2])
+        f.write("%.16f %.16f %.16f xy xz yz\n\n" % (cell[1, 0], cell[2, 0], cell[2, 1]))
+
+        f.write("Masses\n\n")
+
+        for itype, element in enumerate(elements):
+            f.write("%d %.8f\n" % (itype + 1, masses[symbols.index(element)] if element in symbols else 1.0))
+
+        f.write("\nAtoms # charge\n\n")
+
+        for iatom in range(len(positions)):
+            x, y, z = positions[iatom]
+            f.write("%d %d 0.0 %.16f %.16f %.16f\n" % (iatom + 1, types[iatom], x, y, z))
+
+        f.write("\nVelocities\n\n")
+
+        for iatom in range(len(velocities)):
+            vx, vy, vz = velocities[iatom]
+            f.write("%d %.16f %.16f %.16f\n" % (iatom + 1, vx, vy, vz))
+
+    os.replace(path + ".tmp", path)
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Classical pre-equilibration of LLZO, before the production run w/ GNNP.")
+    parser.add_argument("data", help = "LAMMPS data file, e.g. cubic-LLZO.data or the minimized structure.")
+    parser.add_argument("--temperature", type = float, default = 1000.0, help = "temperature in K.")
+    parser.add_argument("--steps", type = int, default = 20000, help = "number of timesteps.")
+    parser.add_argument("--seed", type = int, default = 12345, help = "seed of velocities, as velocity create of in_LLZO.")
+    parser.add_argument("--timestep", type = float, default = 0.001, help = "timestep in ps.")
+    parser.add_argument("--tdamp", type = float, default = 0.05, help = "damping time of thermostat in ps.")
+    parser.add_argument("--skin", type = float, default = 1.0, help = "skin distance of the Verlet list in A.")
+    parser.add_argument("--params", default = "preeq_params.json", help = "JSON file of parameters, fitted to GNNP if it does not exist.")
+    parser.add_argument("--frames", type = int, default = 10, help = "number of displaced copies to fit to.")
+    parser.add_argument("--gnnp-type", default = "orb", help = "type of GNNP.")
+    parser.add_argument("--model", default = "orb-v3-conservative-inf-omat", help = "name of model.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    parser.add_argument("--relax-volume", action = "store_true", help = "to scale the cell to zero pressure of GNNP first.")
+    parser.add_argument("--out", default = "preeq.data", help = "LAMMPS data file to be written.")
+    args = parser.parse_args()
+
+    atoms = read_data(args.data)
+
+    if args.relax_volume or not os.path.isfile(args.params):
+        driver = load_driver(args.driver)
+        driver.gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu)
+
+    if args.relax_volume:
+        strain = relax_volume(driver, atoms)
+
+        print(f"[SUCCESS] Scaled the cell by {1.0 + strain:.5f} to zero pressure of GNNP")
+
+    # parameters fitted in another cell are reused as they are
+    if os.path.isfile(args.params):
+        params = classical_llzo.load_params(args.params)
+    else:
+        params = fit_params(driver, atoms, nframe = args.frames)
+        classical_llzo.save_params(params, args.params)
+
+        print(f"[SUCCESS] Fitted to {params['nframe']} frames, force RMSE = {params['rmse']:.4f} eV/A")
+
+    positions, velocities = run(
+        params, atoms, args.temperature, args.steps,
+        seed = args.seed, timestep = args.timestep, tdamp = args.tdamp, skin = args.skin)
+
+    write_data(args.out, atoms, positions, velocities)
+
+    print(f"[SUCCESS] Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
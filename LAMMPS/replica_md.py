@@ -0,0 +1,389 @@
+"""
+Batched-replica MD of LLZO, that follows the protocol of in_LLZO without LAMMPS.
+
+Replicas of different temperatures and seeds are advanced together with velocity Verlet
+and Nose-Hoover chains (as fix nvt of LAMMPS), and GNNP is evaluated on all of them
+as one batch per step, through gnnp_compute_batch of gnnp_driver.py.
+
+Each replica writes into <out>/T<T>_seed<seed>/:
+    log.txt          step temp pe ke etotal, every --thermo steps (as thermo_style of in_LLZO)
+    dump.lammpstrj   id type xu yu zu, every --dump steps
+    msd_ngp_Li.txt   step simtime MSD NGP of Li, every 10 steps (as fix ave/time of in_LLZO)
+
+Usage (from LAMMPS):
+    python replica_md.py --data 1000/cubic-LLZO.data --temperatures 500 600 700 800 900 1000 --seeds 12345 23456
+The minimized structure of minimize_cache.py can be given as --data.
+"""
+
+import argparse
+import importlib.util
+import os
+import numpy as np
+
+from diffusion_monitor import estimate_diffusion, relative_error
+
+_BOLTZ  = 8.617343e-5       # eV/K, as units metal of LAMMPS
+_MVV2E  = 1.0364269e-4      # amu * (A/ps)^2 -> eV
+_FTM2V  = 1.0 / _MVV2E      # eV/A/amu -> A/ps^2
+
+_ELEMENTS = ("Li", "La", "Zr", "O")
+_NUMBERS  = {"Li": 3, "La": 57, "Zr": 40, "O": 8}
+
+_MSD_EVERY = 10
+
+def load_driver(path):
+    """
+    Load gnnp_driver.py as a module.
+    Args:
+        path (str): path of gnnp_driver.py.
+    Returns:
+        driver (module): module of driver.
+    """
+
+    spec   = importlib.util.spec_from_file_location("gnnp_driver", path)
+    driver = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(driver)
+
+    return driver
+
+def read_data(path, elements = _ELEMENTS):
+    """
+    Read the LAMMPS data file of LLZO (atom_style charge).
+    Args:
+        path (str): path of data file.
+        elements (tuple): elements of atom types, as pair_coeff.
+    Returns:
+        atoms (Atoms): structure, with masses of data file.
+    """
+
+    from ase.io import read
+
+    z_of_type = {itype + 1: _NUMBERS[element] for itype, element in enumerate(elements)}
+
+    return read(path, format = "lammps-data", atom_style = "charge", Z_of_type = z_of_type, units = "metal")
+
+class NoseHooverChains:
+    """
+    Nose-Hoover chains of replicas, integrated as fix nvt of LAMMPS (tchain 3, tloop 1).
+    Attributes:
+        temperatures (ndarray): target temperatures in K, shape (nreplica,).
+        tdof (int): degrees of freedom of each replica.
+        eta_dot (ndarray): velocities of thermostats, shape (nreplica, tchain).
+        eta_mass (ndarray): masses of thermostats, shape (nreplica, tchain).
+    """
+
+    def __init__(self, temperatures, tdof, tdamp, tchain = 3):
+        self.temperatures = np.asarray(temperatures, dtype = np.float64)
+        self.tdof         = tdof
+
+        nreplica = len(self.temperatures)
+        kt       = _BOLTZ * self.temperatures
+        freq2    = (1.0 / tdamp) ** 2
+
+        self.eta_mass        = np.empty((nreplica, tchain))
+        self.eta_mass[:, 0]  = tdof * kt / freq2
+        self.eta_mass[:, 1:] = (kt / freq2)[:, None]
+
+        # the last one is always zero, as the end of chain
+        self.eta_dot    = np.zeros((nreplica, tchain + 1))
+        self.eta_dotdot = np.zeros((nreplica, tchain))
+
+        self.eta_dotdot[:, 1:] = -kt[:, None] / self.eta_mass[:, 1:]
+
+    def half_step(self, ke, dt):
+        """
+        Advance the thermostats by dt/2, and get the factors to scale velocities.
+        Args:
+            ke (ndarray): kinetic energies of replicas in eV, shape (nreplica,).
+            dt (float): timestep in ps.
+        Returns:
+            factor (ndarray): factors of velocities, shape (nreplica,).
+        """
+
+        eta_dot    = self.eta_dot
+        eta_dotdot = self.eta_dotdot
+        eta_mass   = self.eta_mass
+        tchain     = eta_mass.shape[1]
+
+        kt        = _BOLTZ * self.temperatures
+        ke_target = self.tdof * kt
+
+        dt4 = 0.25  * dt
+        dt8 = 0.125 * dt
+
+        eta_dotdot[:, 0] = (2.0 * ke - ke_target) / eta_mass[:, 0]
+
+        for ich in range(tchain - 1, -1, -1):
+            expfac = np.exp(-dt8 * eta_dot[:, ich + 1])
+            eta_dot[:, ich] *= expfac
+            eta_dot[:, ich] += eta_dotdot[:, ich] * dt4
+            eta_dot[:, ich] *= expfac
+
+        factor = np.exp(-0.5 * dt * eta_dot[:, 0])
+
+        eta_dotdot[:, 0] = (2.0 * ke * factor ** 2 - ke_target) / eta_mass[:, 0]
+
+        for ich in range(tchain):
+            expfac = np.exp(-dt8 * eta_dot[:, ich + 1])
+            eta_dot[:, ich] *= expfac
+
+            if ich > 0:
+                eta_dotdot[:, ich] = (eta_mass[:, ich - 1] * eta_dot[:, ich - 1] ** 2 - kt) / eta_mass[:, ich]
+
+            eta_dot[:, ich] += eta_dotdot[:, ich] * dt4
+            eta_dot[:, ich] *= expfac
+
+        return factor
+
+def create_velocities(masses, temperature, seed):
+    """
+    Create velocities of Gaussian distribution, w/o momentum of center of mass,
+    scaled to the temperature, as velocity create of LAMMPS (mom yes, dist gaussian).
+    Args:
+        masses (ndarray): masses in amu, shape (natom,).
+        temperature (float): temperature in K.
+        seed (int): seed of random numbers.
+    Returns:
+        velocities (ndarray): velocities in A/ps, shape (natom, 3).
+    """
+
+    rng = np.random.default_rng(seed)
+
+    velocities  = rng.normal(size = (len(masses), 3)) / np.sqrt(masses)[:, None]
+    velocities -= (masses[:, None] * velocities).sum(axis = 0) / masses.sum()
+
+    tdof    = 3 * len(masses) - 3
+    current = _MVV2E * (masses[:, None] * velocities ** 2).sum() / (tdof * _BOLTZ)
+
+    return velocities * np.sqrt(temperature / current)
+
+def kinetic_energies(masses, velocities):
+    """
+    Get kinetic energies of replicas.
+    Args:
+        masses (ndarray): masses in amu, shape (natom,).
+        velocities (ndarray): velocities in A/ps, shape (nreplica, natom, 3).
+    Returns:
+        ke (ndarray): kinetic energies in eV, shape (nreplica,).
+    """
+
+    return 0.5 * _MVV2E * np.einsum("i,rij,rij->r", masses, velocities, velocities)
+
+def integrate(driver, atoms, positions, velocities, thermostat, timestep):
+    """
+    Advance replicas by velocity Verlet and Nose-Hoover chains, evaluating GNNP on all of them as one batch.
+    The generator goes on until the caller stops it.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): structure, for cell, atomic numbers and masses.
+        positions (ndarray): unwrapped positions, shape (nreplica, natom, 3), that are updated in place.
+        velocities (ndarray): velocities in A/ps, shape (nreplica, natom, 3), that are updated in place.
+        thermostat (NoseHooverChains): thermostats of replicas.
+        timestep (float): timestep in ps.
+    Yields:
+        step (int): timestep, from 0.
+        energies (ndarray): potential energies of replicas in eV, shape (nreplica,).
+    """
+
+    nreplica = len(positions)
+
+    masses  = atoms.get_masses()
+    numbers = np.repeat(atoms.numbers[None], nreplica, axis = 0)
+    cells   = np.repeat(atoms.cell.array[None], nreplica, axis = 0)
+    accel   = _FTM2V / masses[None, :, None]
+
+    def compute_forces():
+        results = driver.gnnp_compute_batch(cells, numbers, positions)
+
+        energies = np.array([energy for energy, _, _ in results])
+        forces   = np.array([forces for _, forces, _ in results])
+
+        return energies, forces
+
+    energies, forces = compute_forces()
+
+    yield 0, energies
+
+    step = 0
+
+    while True:
+        step += 1
+
+        factor = thermostat.half_step(kinetic_energies(masses, velocities), timestep)
+        velocities *= factor[:, None, None]
+
+        velocities += 0.5 * timestep * forces * accel
+        positions  += timestep * velocities
+
+        energies, forces = compute_forces()
+
+        velocities += 0.5 * timestep * forces * accel
+
+        factor = thermostat.half_step(kinetic_energies(masses, velocities), timestep)
+        velocities *= factor[:, None, None]
+
+        yield step, energies
+
+def run(driver, atoms, temperatures, seeds, steps, out_dir, timestep = 0.001, tdamp = 0.1,
+        thermo = 10, dump = 100, converge = None, max_steps = None, check_every = 1000):
+    """
+    Run MD of replicas, as NVT of in_LLZO.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): starting structure.
+        temperatures (list): temperatures in K of replicas.
+        seeds (list): seeds of velocities of replicas.
+        steps (int): number of timesteps.
+        out_dir (str): directory of outputs.
+        timestep (float): timestep in ps.
+        tdamp (float): damping time of thermostat in ps.
+        thermo (int): interval of log.
+        dump (int): interval of trajectory.
+        converge (float): target of the relative error of D of Li (see diffusion_monitor.py).
+                          the run stops as soon as all replicas reach it (but not before steps / 5),
+                          and is extended up to max_steps while some do not. if None, steps are run.
+        max_steps (int): max number of timesteps, when extended.
+        check_every (int): interval of checks of convergence.
+    Returns:
+        steps (int): number of timesteps that are run.
+    """
+
+    nreplica = len(temperatures)
+    natom    = len(atoms)
+    tdof     = 3 * natom - 3
+
+    masses  = atoms.get_masses()
+    lithium = atoms.numbers == _NUMBERS["Li"]
+
+    positions  = np.repeat(atoms.positions[None], nreplica, axis = 0)
+    velocities = np.array([create_velocities(masses, t, seed) for t, seed in zip(temperatures, seeds)])
+
+    thermostat = NoseHooverChains(temperatures, tdof, tdamp)
+
+    # positions are kept unwrapped, for MSD and the dump
+    origin = positions[:, lithium].copy()
+
+    files   = []
+    history = [[] for _ in temperatures]
+
+    for temperature, seed in zip(temperatures, seeds):
+        replica_dir = os.path.join(out_dir, "T" + str(temperature) + "_seed" + str(seed))
+        os.makedirs(replica_dir, exist_ok = True)
+
+        log  = open(os.path.join(replica_dir, "log.txt"), "w")
+        traj = open(os.path.join(replica_dir, "dump.lammpstrj"), "w")
+        msd  = open(os.path.join(replica_dir, "msd_ngp_Li.txt"), "w")
+
+        log.write("Step Temp PotEng KinEng TotEng\n")
+        msd.write("# Time-averaged data for fix 2\n")
+        msd.write("# TimeStep v_simtime c_msd_type1[1] c_msd_type1[3]\n")
+
+        files.append((log, traj, msd))
+
+    def write_outputs(step, energies):
+        ke = kinetic_energies(masses, velocities)
+
+        for ireplica, (log, traj, msd) in enumerate(files):
+            if step % thermo == 0:
+                temp = 2.0 * ke[ireplica] / (tdof * _BOLTZ)
+                log.write("%d %.6f %.8f %.8f %.8f\n" % (
+                    step, temp, energies[ireplica], ke[ireplica], energies[ireplica] + ke[ireplica]))
+
+            if step % dump == 0:
+                _write_dump(traj, step, atoms, positions[ireplica])
+
+            if step % _MSD_EVERY == 0:
+                disp2 = ((positions[ireplica, lithium] - origin[ireplica]) ** 2).sum(axis = 1)
+                msd2  = disp2.mean()
+                msd4  = (disp2 ** 2).mean()
+                ngp   = 3.0 * msd4 / (5.0 * msd2 ** 2) - 1.0 if msd2 > 0.0 else 0.0
+
+                msd.write("%d %g %g %g\n" % (step, step * timestep, msd2, ngp))
+                history[ireplica].append((step * timestep, msd2))
+
+    limit = steps
+
+    for step, energies in integrate(driver, atoms, positions, velocities, thermostat, timestep):
+        write_outputs(step, energies)
+
+        if converge is not None and step > 0 and step % check_every == 0:
+            relative = max(relative_error(*estimate_diffusion(*np.array(h).T)) for h in history)
+
+            if relative < converge and step >= steps // 5:
+                print("[INFO] D of all replicas converged at step %d (relative error %.3f)" % (step, relative))
+                break
+
+            if step >= steps and limit == steps:
+                print("[INFO] run is extended at step %d (relative error %.3f)" % (step, relative))
+                limit = max_steps or steps
+
+        if step >= limit:
+            break
+
+    for handles in files:
+        for handle in handles:
+            handle.close()
+
+    return step
+
+def _write_dump(traj, step, atoms, positions):
+    """
+    Write a frame of dump custom (id type xu yu zu) of LAMMPS.
+    Args:
+        traj (file): file of trajectory.
+        step (int): timestep.
+        atoms (Atoms): structure, for cell and atom types.
+        positions (ndarray): unwrapped positions.
+    """
+
+    cell  = atoms.cell.array
+    types = np.array([_ELEMENTS.index(symbol) + 1 for symbol in atoms.get_chemical_symbols()])
+
+    xlo, ylo, zlo = 0.0, 0.0, 0.0
+    xhi, yhi, zhi = cell[0, 0], cell[1, 1], cell[2, 2]
+    xy,  xz,  yz  = cell[1, 0], cell[2, 0], cell[2, 1]
+
+    traj.write("ITEM: TIMESTEP\n%d\n" % step)
+    traj.write("ITEM: NUMBER OF ATOMS\n%d\n" % len(positions))
+    traj.write("ITEM: BOX BOUNDS xy xz yz pp pp pp\n")
+    traj.write("%f %f %f\n" % (xlo + min(0.0, xy, xz, xy + xz), xhi + max(0.0, xy, xz, xy + xz), xy))
+    traj.write("%f %f %f\n" % (ylo + min(0.0, yz), yhi + max(0.0, yz), xz))
+    traj.write("%f %f %f\n" % (zlo, zhi, yz))
+    traj.write("ITEM: ATOMS id type xu yu zu\n")
+
+    for iatom in range(len(positions)):
+        x, y, z = positions[iatom]
+        traj.write("%d %d %f %f %f\n" % (iatom + 1, types[iatom], x, y, z))
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Batched-replica MD of LLZO w/ GNNP, as the protocol of in_LLZO.")
+    parser.add_argument("--data", default = os.path.join(base_dir, "1000", "cubic-LLZO.data"), help = "LAMMPS data file.")
+    parser.add_argument("--temperatures", type = int, nargs = "+", default = [500, 600, 700, 800, 900, 1000], help = "temperatures in K.")
+    parser.add_argument("--seeds", type = int, nargs = "+", default = [12345], help = "seeds of velocities, for each temperature.")
+    parser.add_argument("--steps", type = int, default = 100000, help = "number of timesteps.")
+    parser.add_argument("--timestep", type = float, default = 0.001, help = "timestep in ps.")
+    parser.add_argument("--tdamp", type = float, default = 0.1, help = "damping time of thermostat in ps.")
+    parser.add_argument("--gnnp-type", default = "orb", help = "type of GNNP.")
+    parser.add_argument("--model", default = "orb-v3-conservative-inf-omat", help = "name of model.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    parser.add_argument("--out", default = "replicas", help = "directory of outputs.")
+    parser.add_argument("--converge", type = float, default = None, help = "target of the relative error of D, to stop or extend the run.")
+    parser.add_argument("--max-steps", type = int, default = None, help = "max number of timesteps, when extended.")
+    args = parser.parse_args()
+
+    temperatures = [t for t in args.temperatures for _ in args.seeds]
+    seeds        = [seed for _ in args.temperatures for seed in args.seeds]
+
+    driver = load_driver(args.driver)
+    driver.gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu)
+
+    atoms = read_data(args.data)
+
+    run(driver, atoms, temperatures, seeds, args.steps, args.out, timestep = args.timestep, tdamp = args.tdamp,
+        converge = args.converge, max_steps = args.max_steps)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Temperature-accelerated estimate of Li diffusion at a low temperature, from hops of Li detected at a high one.
+
+Replicas are run by NVT at --high with GNNP (as one batch, see replica_md.py), and a hop of Li is detected
+when it stays farther than --threshold from its last site for --persistence samples.
+Barriers of a sample of hops are given by NEB (climbing image) w/ GNNP between the quenched states
+before and after the hop, and other hops take the mean barrier of hops of similar length.
+By harmonic TST, whose prefactor does not depend on temperature, the dwell time of each hop
+is extrapolated to --low as t_low = t_high * exp(Ea * (1/kT_low - 1/kT_high)), and
+    D_low = f * sum(l^2 * t_high / t_low) / (6 * N_Li * t_total)
+where f is the correlation factor D_MSD / D_hop at --high.
+
+Writes tad_events.txt (one line per hop) and prints D at --low in cm^2/s, as the values of ../MSD_NGP/plot_arrhenius.py.
+
+Usage (from LAMMPS):
+    python tad_li.py --data 1000/cubic-LLZO.data --high 1000 --low 500 --seeds 1 2 3 4 --steps 50000
+"""
+
+import argparse
+import os
+import numpy as np
+
+from ase.calculators.calculator import Calculator, all_changes
+
+from replica_md import NoseHooverChains, create_velocities, integrate, load_driver, read_data
+
+_BOLTZ = 8.617343e-5        # eV/K, as units metal of LAMMPS
+
+_THRESHOLD    = 1.2         # A, from the last site
+_PERSISTENCE  = 10          # samples
+_SAMPLE_EVERY = 10          # timesteps
+_CLASS_WIDTH  = 0.25        # A, of lengths of hops sharing a barrier
+
+_NEB_IMAGES = 5
+_NEB_FMAX   = 0.1
+_NEB_STEPS  = 300
+
+class DriverCalculator(Calculator):
+    """
+    ASE calculator of GNNP through gnnp_driver, for quenches and NEB.
+    """
+
+    implemented_properties = ["energy", "forces"]
+
+    def __init__(self, driver, **kwargs):
+        Calculator.__init__(self, **kwargs)
+
+        self.driver = driver
+
+    def calculate(self, atoms = None, properties = ["energy"], system_changes = all_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+
+        forces = np.zeros((len(self.atoms), 3))
+        energy = self.driver.gnnp_compute_into(
+            self.atoms.cell.array, self.atoms.numbers, self.atoms.positions, forces, vflag = 0)
+
+        self.results = {"energy": energy, "forces": forces}
+
+class HopDetector:
+    """
+    Detector of hops of Li, from unwrapped positions of replicas.
+    Attributes:
+        sites (ndarray): last sites of Li, shape (nreplica, nli, 3).
+        since (ndarray): times of arrival at the last sites, shape (nreplica, nli).
+        count (ndarray): numbers of samples farther than threshold, shape (nreplica, nli).
+        crossed (ndarray): times of the first samples farther than threshold, shape (nreplica, nli).
+        before (dict): positions of replica at the sample before the crossing, keyed by (replica, Li).
+        previous (ndarray): positions of replicas at the previous sample.
+        events (list): detected hops.
+    """
+
+    def __init__(self, positions, lithium, time, threshold = _THRESHOLD, persistence = _PERSISTENCE):
+        self.lithium     = lithium
+        self.threshold   = threshold
+        self.persistence = persistence
+
+        self.sites    = positions[:, lithium].copy()
+        self.since    = np.full(self.sites.shape[:2], time)
+        self.count    = np.zeros(self.sites.shape[:2], dtype = int)
+        self.crossed  = np.zeros(self.sites.shape[:2])
+        self.before   = {}
+        self.previous = positions.copy()
+        self.events   = []
+
+    def update(self, positions, time):
+        """
+        Update the detector by a sample.
+        Args:
+            positions (ndarray): unwrapped positions of replicas, shape (nreplica, natom, 3).
+            time (float): time in ps.
+        """
+
+        lithium  = positions[:, self.lithium]
+        distance = np.sqrt(((lithium - self.sites) ** 2).sum(axis = 2))
+        away     = distance > self.threshold
+
+        for ireplica, ili in zip(*np.nonzero(away & (self.count == 0))):
+            self.crossed[ireplica, ili] = time
+            self.before[(ireplica, ili)] = self.previous[ireplica].copy()
+
+        # returning before persistence is a recrossing, not a hop
+        for ireplica, ili in zip(*np.nonzero(~away & (self.count > 0))):
+            self.before.pop((ireplica, ili), None)
+
+        self.count = np.where(away, self.count + 1, 0)
+
+        for ireplica, ili in zip(*np.nonzero(self.count >= self.persistence)):
+            self.events.append({
+                "replica": int(ireplica),
+                "li":      int(ili),
+                "time":    float(self.crossed[ireplica, ili]),
+                "dwell":   float(self.crossed[ireplica, ili] - self.since[ireplica, ili]),
+                "length":  float(distance[ireplica, ili]),
+                "before":  self.before.pop((ireplica, ili)),
+                "after":   positions[ireplica].copy()
+            })
+
+            self.sites[ireplica, ili] = lithium[ireplica, ili]
+            self.since[ireplica, ili] = self.crossed[ireplica, ili]
+            self.count[ireplica, ili] = 0
+
+        self.previous = positions.copy()
+
+def barrier(driver, atoms, before, after, nimage = _NEB_IMAGES, fmax = _NEB_FMAX, steps = _NEB_STEPS):
+    """
+    Get the barrier of a hop by NEB (climbing image) between the quenched states before and after it.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): structure, for cell and atomic numbers.
+        before (ndarray): positions before the hop.
+        after (ndarray): positions after the hop.
+        nimage (int): number of intermediate images.
+        fmax (float): convergence of forces in eV/A.
+        steps (int): max steps of each optimization.
+    Returns:
+        barrier (float): barrier in eV, or None if the states are the same after quenches.
+    """
+
+    from ase.optimize import FIRE
+
+    try:
+        from ase.mep import NEB
+    except ImportError:
+        from ase.neb import NEB
+
+    initial = atoms.copy()
+    final   = atoms.copy()
+
+    initial.positions = before
+    final  .positions = after
+
+    for image in (initial, final):
+        image.calc = DriverCalculator(driver)
+        FIRE(image, logfile = None).run(fmax = fmax, steps = steps)
+
+    # positions are unwrapped, so the path is continuous w/o minimum image
+    if np.abs(final.positions - initial.positions).max() < 0.5 * _THRESHOLD:
+        return None
+
+    images = [initial] + [initial.copy() for _ in range(nimage)] + [final]
+
+    for image in images[1:-1]:
+        image.calc = DriverCalculator(driver)
+
+    neb = NEB(images, climb = True)
+    neb.interpolate()
+
+    FIRE(neb, logfile = None).run(fmax = fmax, steps = steps)
+
+    energies = [image.get_potential_energy() for image in images]
+
+    return max(energies) - energies[0]
+
+def assign_barriers(events, width = _CLASS_WIDTH):
+    """
+    Assign barriers to hops w/o NEB, as the mean barrier of hops of similar length, or of all hops.
+    Args:
+        events (list): hops, some of which have "barrier".
+        width (float): width of classes of lengths in angstroms.
+    """
+
+    known = [event for event in events if event.get("barrier") is not None]
+
+    if not known:
+        raise RuntimeError("no barrier of hops is given, so increase --neb-events or give --barrier.")
+
+    mean    = np.mean([event["barrier"] for event in known])
+    classes = {}
+
+    for event in known:
+        classes.setdefault(int(event["length"] // width), []).append(event["barrier"])
+
+    for event in events:
+        if event.get("barrier") is None:
+            event["barrier"] = float(np.mean(classes.get(int(event["length"] // width), [mean])))
+
+def extrapolate(events, high, low, nli, total_time, msd):
+    """
+    Extrapolate hops at the high temperature to the low one, by harmonic TST.
+    Args:
+        events (list): hops with "barrier".
+        high (float): high temperature in K.
+        low (float): low temperature in K.
+        nli (int): number of Li of all replicas.
+        total_time (float): time of the run at the high temperature in ps.
+        msd (float): MSD of Li at the end of the run at the high temperature in A^2.
+    Returns:
+        report (dict): D at both temperatures in cm^2/s, and the correlation factor.
+    """
+
+    dbeta = 1.0 / (_BOLTZ * low) - 1.0 / (_BOLTZ * high)
+
+    lengths  = np.array([event["length"] for event in events])
+    barriers = np.array([event["barrier"] for event in events])
+    factors  = np.exp(barriers * dbeta)
+
+    for event, factor in zip(events, factors):
+        event["dwell_low"] = event["dwell"] * factor
+
+    # A^2/ps -> cm^2/s
+    d_hop_high = (lengths ** 2).sum() / (6.0 * nli * total_time) * 1.0e-4
+    d_hop_low  = (lengths ** 2 / factors).sum() / (6.0 * nli * total_time) * 1.0e-4
+    d_msd_high = msd / (6.0 * total_time) * 1.0e-4
+
+    correlation = d_msd_high / d_hop_high if d_hop_high > 0.0 else 1.0
+
+    return {
+        "nevent":       len(events),
+        "D_msd_high":   d_msd_high,
+        "D_hop_high":   d_hop_high,
+        "correlation":  correlation,
+        "D_low":        correlation * d_hop_low,
+        "mean_barrier": float(barriers.mean())
+    }
+
+def write_events(path, events):
+    """
+    Write hops into a text file.
+    Args:
+        path (str): path of file.
+        events (list): hops.
+    """
+
+    with open(path, "w") as f:
+        f.write("# replica li time(ps) length(A) barrier(eV) neb dwell_high(ps) dwell_low(ps)\n")
+
+        for event in events:
+            f.write("%d %d %.4f %.4f %.4f %d %.4f %.6e\n" % (
+                event["replica"], event["li"], event["time"], event["length"], event["barrier"],
+                event.get("neb", False), event["dwell"], event["dwell_low"]))
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Temperature-accelerated estimate of D of Li at a low temperature.")
+    parser.add_argument("--data", default = os.path.join(base_dir, "1000", "cubic-LLZO.data"), help = "LAMMPS data file.")
+    parser.add_argument("--high", type = float, default = 1000.0, help = "high temperature of MD in K.")
+    parser.add_argument("--low", type = float, default = 500.0, help = "low temperature to extrapolate to in K.")
+    parser.add_argument("--seeds", type = int, nargs = "+", default = [12345, 23456, 34567, 45678], help = "seeds of replicas.")
+    parser.add_argument("--equil", type = int, default = 5000, help = "timesteps of equilibration before detection.")
+    parser.add_argument("--steps", type = int, default = 50000, help = "timesteps of detection.")
+    parser.add_argument("--timestep", type = float, default = 0.001, help = "timestep in ps.")
+    parser.add_argument("--threshold", type = float, default = _THRESHOLD, help = "distance of hop from the last site in A.")
+    parser.add_argument("--persistence", type = int, default = _PERSISTENCE, help = "samples (every 10 steps) to stay away.")
+    parser.add_argument("--neb-events", type = int, default = 10, help = "number of hops whose barriers are given by NEB.")
+    parser.add_argument("--barrier", type = float, default = None, help = "barrier in eV for all hops, instead of NEB.")
+    parser.add_argument("--gnnp-type", default = "orb", help = "type of GNNP.")
+    parser.add_argument("--model", default = "orb-v3-conservative-inf-omat", help = "name of model.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    parser.add_argument("--out", default = "tad_events.txt", help = "file of hops to be written.")
+    args = parser.parse_args()
+
+    driver = load_driver(args.driver)
+    driver.gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu)
+
+    atoms    = read_data(args.data)
+    lithium  = atoms.numbers == 3
+    nreplica = len(args.seeds)
+
+    masses     = atoms.get_masses()
+    positions  = np.repeat(atoms.positions[None], nreplica, axis = 0)
+    velocities = np.array([create_velocities(masses, args.high, seed) for seed in args.seeds])
+    thermostat = NoseHooverChains([args.high] * nreplica, 3 * len(atoms) - 3, 0.1)
+
+    detector = None
+    origin   = None
+
+    for step, _ in integrate(driver, atoms, positions, velocities, thermostat, args.timestep):
+        if step == args.equil:
+            detector = HopDetector(positions, lithium, 0.0, args.threshold, args.persistence)
+            origin   = positions[:, lithium].copy()
+
+        elif step > args.equil and step % _SAMPLE_EVERY == 0:
+            detector.update(positions, (step - args.equil) * args.timestep)
+
+        if step >= args.equil + args.steps:
+            break
+
+    events = detector.events
+
+    if not events:
+        print("[ERROR] No hop of Li is detected at %g K, so run longer or at a higher temperature." % args.high)
+        return
+
+    total_time = args.steps * args.timestep
+    msd        = ((positions[:, lithium] - origin) ** 2).sum(axis = 2).mean()
+
+    if args.barrier is not None:
+        for event in events:
+            event["barrier"] = args.barrier
+
+    else:
+        rng = np.random.default_rng(0)
+
+        for index in rng.permutation(len(events))[:args.neb_events]:
+            event = events[index]
+            event["barrier"] = barrier(driver, atoms, event["before"], event["after"])
+            event["neb"]     = event["barrier"] is not None
+
+        # hops that are the same state after quenches are recrossings
+        events = [event for event in events if event.get("neb", True)]
+
+        assign_barriers(events)
+
+    report = extrapolate(events, args.high, args.low, int(lithium.sum()) * nreplica, total_time, msd)
+
+    write_events(args.out, events)
+
+    print("[INFO] %d hops of Li in %.1f ps x %d replicas at %g K, mean barrier %.3f eV" % (
+        report["nevent"], total_time, nreplica, args.high, report["mean_barrier"]))
+    print("[INFO] D at %g K: MSD %.3e, hops %.3e cm^2/s (correlation factor %.3f)" % (
+        args.high, report["D_msd_high"], report["D_hop_high"], report["correlation"]))
+    print("[SUCCESS] D at %g K = %.3e cm^2/s (harmonic TST), hops written into %s" % (args.low, report["D_low"], args.out))
+
+if __name__ == "__main__":
+    main()
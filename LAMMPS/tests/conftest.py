@@ -0,0 +1,91 @@
+"""
+Fixtures of the tests of gnnp_driver.py.
+
+GNNP is stood in for by small ORB models with random weights, registered as pretrained models of orb_models,
+so that no weights are downloaded.
+
+Usage (from LAMMPS):
+    python -m pytest tests
+"""
+
+import importlib.util
+import os
+import sys
+import numpy as np
+import pytest
+
+LAMMPS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules shared by the drivers (e.g. gnnp_backends.py) are imported from LAMMPS, as the drivers do
+sys.path.append(LAMMPS_DIR)
+
+# atomic numbers of atom types of cubic-LLZO.data (Li, La, Zr, O), as pair_coeff of in_LLZO
+Z_OF_TYPE = {1: 3, 2: 57, 3: 40, 4: 8}
+
+@pytest.fixture
+def load():
+    """
+    Loader of a fresh gnnp_driver, whose state is not shared with the other tests.
+    """
+
+    def load_driver():
+        spec   = importlib.util.spec_from_file_location("gnnp_driver", os.path.join(LAMMPS_DIR, "1000", "gnnp_driver.py"))
+        driver = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(driver)
+
+        return driver
+
+    return load_driver
+
+@pytest.fixture
+def llzo():
+    """
+    Structure of cubic-LLZO.data, whose atoms are displaced randomly to break its symmetry.
+    """
+
+    from ase.io import read
+
+    atoms = read(os.path.join(LAMMPS_DIR, "1000", "cubic-LLZO.data"), format = "lammps-data",
+                 atom_style = "charge", Z_of_type = Z_OF_TYPE, units = "metal")
+    rng   = np.random.default_rng(0)
+
+    atoms.positions += rng.normal(scale = 0.05, size = atoms.positions.shape)
+
+    return atoms
+
+@pytest.fixture
+def tiny_orb(monkeypatch):
+    """
+    Register a small ORB model with random weights as a pretrained model, and get its name.
+    """
+
+    import torch
+    from orb_models.forcefield import pretrained
+    from orb_models.forcefield.atomic_system import SystemConfig
+
+    def register(direct = False, radius = 6.0, max_num_neighbors = 20):
+        architecture = pretrained.orb_v3_direct_architecture if direct else pretrained.orb_v3_conservative_architecture
+
+        def load(device = "cpu", precision = "float32-high", **kwargs):
+            torch.manual_seed(0)
+
+            model = architecture(
+                latent_dim                = 16,
+                base_mlp_hidden_dim       = 32,
+                head_mlp_hidden_dim       = 16,
+                num_message_passing_steps = 2,
+                system_config             = SystemConfig(radius = radius, max_num_neighbors = max_num_neighbors),
+                device                    = device
+            )
+
+            dtype = torch.float64 if precision == "float64" else torch.float32
+
+            return model.to(dtype).eval()
+
+        name = "tiny-" + ("direct" if direct else "conservative")
+
+        monkeypatch.setitem(pretrained.ORB_PRETRAINED_MODELS, name, load)
+
+        return name
+
+    return register
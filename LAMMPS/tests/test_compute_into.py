@@ -0,0 +1,47 @@
+"""
+Tests of gnnp_compute_into, against gnnp_get_energy_forces_stress on the same frame.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("orb_models")
+
+@pytest.mark.parametrize("skin", [None, 1.0])
+def test_compute_into_matches_lists(load, llzo, tiny_orb, skin):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False, skin = skin)
+
+    args = (llzo.cell.array, llzo.numbers, llzo.positions)
+
+    energy_ref, forces_ref, stress_ref = driver.gnnp_get_energy_forces_stress(
+        *(arg.tolist() for arg in args), with_stress = True)
+
+    # ghost atoms may follow local atoms in the buffers of LAMMPS, and are not touched
+    forces = np.full((len(llzo) + 4, 3), np.nan)
+    stress = np.zeros(6)
+    energy = driver.gnnp_compute_into(*args, forces, stress)
+
+    assert energy == energy_ref
+    np.testing.assert_array_equal(forces[:len(llzo)], forces_ref)
+    np.testing.assert_array_equal(stress, stress_ref)
+    assert np.isnan(forces[len(llzo):]).all()
+
+    # stress is not written w/o vflag, nor energy returned w/o eflag
+    stress[:] = 0.0
+    energy    = driver.gnnp_compute_into(*args, forces, stress, eflag = 0, vflag = 0)
+
+    assert energy == 0.0
+    np.testing.assert_allclose(forces[:len(llzo)], forces_ref, atol = 1.0e-6)
+    assert not stress.any()
+
+def test_compute_into_refuses_read_only_forces(load, llzo, tiny_orb):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False)
+
+    forces = np.zeros((len(llzo), 3))
+    forces.flags.writeable = False
+
+    with pytest.raises(ValueError):
+        driver.gnnp_compute_into(llzo.cell.array, llzo.numbers, llzo.positions, forces)
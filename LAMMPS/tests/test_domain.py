@@ -0,0 +1,101 @@
+"""
+Tests of gnnp_compute_domain, on a box split into two domains of local and ghost atoms as LAMMPS does.
+"""
+
+import itertools
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("orb_models")
+
+def make_domain(atoms, inside, ghost_cutoff):
+    """
+    Make the local atoms of a domain, followed by the images of atoms within ghost_cutoff of them.
+    Args:
+        atoms (Atoms): periodic structure.
+        inside (ndarray): mask of local atoms of the domain.
+        ghost_cutoff (float): cutoff of ghost atoms.
+    Returns:
+        owners (ndarray): indexes of local and ghost atoms in atoms.
+        positions (ndarray): positions of local and ghost atoms.
+        nlocal (int): number of local atoms.
+    """
+
+    local  = np.flatnonzero(inside)
+    owners = [local]
+    images = [atoms.positions[local]]
+
+    for shift in itertools.product((-1, 0, 1), repeat = 3):
+        shifted = atoms.positions + np.array(shift) @ atoms.cell.array
+
+        # local atoms are not ghosts of themselves
+        candidates = np.flatnonzero(~inside) if not any(shift) else np.arange(len(atoms))
+
+        distance = np.linalg.norm(shifted[candidates, None] - atoms.positions[None, local], axis = 2).min(axis = 1)
+        near     = candidates[distance < ghost_cutoff]
+
+        owners.append(near)
+        images.append(shifted[near])
+
+    return np.concatenate(owners), np.concatenate(images), len(local)
+
+class Ranks:
+    """
+    Communicator of the domains, that are evaluated one by one in this process.
+    On the first pass, the values of each domain are recorded and returned as they are,
+    and on the second pass, allreduce returns their sum over domains, as MPI does over ranks.
+    """
+
+    def __init__(self):
+        self.values  = []
+        self.reduced = False
+
+    def allreduce(self, values):
+        if self.reduced:
+            return np.sum(self.values, axis = 0)
+
+        self.values.append(np.array(values))
+
+        return values
+
+def test_domains_reproduce_periodic_forces(load, llzo, tiny_orb):
+    # radius of graph differs from the cutoff of backend (6.0), and the cap of neighbors is reached
+    name = tiny_orb(radius = 4.0, max_num_neighbors = 20)
+
+    reference = load()
+    reference.gnnp_initialize("orb", name, gpu = False)
+
+    forces_ref = np.zeros((len(llzo), 3))
+    energy_ref = reference.gnnp_compute_into(llzo.cell.array, llzo.numbers, llzo.positions, forces_ref, vflag = 0)
+
+    driver = load()
+    driver.gnnp_initialize("orb", name, gpu = False)
+
+    ghost_cutoff = driver.gnnp_get_ghost_cutoff()
+
+    # message passings and the cap of neighbors
+    assert ghost_cutoff == pytest.approx((2 + 1) * 4.0)
+
+    fractions = llzo.get_scaled_positions()[:, 0]
+    domains   = [make_domain(llzo, inside, ghost_cutoff) for inside in (fractions < 0.5, fractions >= 0.5)]
+    ranks     = Ranks()
+
+    for reduced in (False, True):
+        ranks.reduced = reduced
+
+        energy = 0.0
+        forces = np.zeros((len(llzo), 3))
+
+        for owners, positions, nlocal in domains:
+            forces_domain = np.zeros((len(owners), 3))
+
+            energy += driver.gnnp_compute_domain(llzo.cell.array, llzo.numbers[owners], positions, nlocal,
+                                                 forces_domain, comm = ranks)
+
+            # reverse communication of LAMMPS
+            np.add.at(forces, owners, forces_domain)
+
+    assert driver.myGraphCheck["accepted"]
+    assert energy == pytest.approx(energy_ref, rel = 1.0e-5)
+    np.testing.assert_allclose(forces, forces_ref, atol = 1.0e-4)
@@ -0,0 +1,57 @@
+"""
+Tests of gnnp_compute_with_neighbors, on pairs given as the neighbor list of LAMMPS.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("orb_models")
+
+def half_list(atoms, cutoff):
+    """
+    Make a half neighbor list (newton on) as LAMMPS, with ghost atoms mapped onto their owners.
+    Args:
+        atoms (Atoms): periodic structure.
+        cutoff (float): cutoff of list, i.e. cutoff of pair style + skin.
+    Returns:
+        ilist (ndarray): indexes of central atoms.
+        jlist (ndarray): indexes of owners of neighbor atoms.
+        shifts (ndarray): images of neighbor atoms, as integer multiples of lattice vectors.
+    """
+
+    from ase.neighborlist import primitive_neighbor_list
+
+    ilist, jlist, shifts = primitive_neighbor_list("ijS", atoms.pbc, atoms.cell.array, atoms.positions, cutoff)
+
+    # each pair is listed once: by the lower index, or by the positive image for the pairs of an atom and its image
+    sign = np.sign(shifts[np.arange(len(shifts)), np.argmax(shifts != 0, axis = 1)])
+    keep = (ilist < jlist) | ((ilist == jlist) & (sign > 0))
+
+    return ilist[keep], jlist[keep], shifts[keep]
+
+def test_neighbor_list_matches_calculator(load, llzo, tiny_orb):
+    name = tiny_orb()
+
+    reference = load()
+    reference.gnnp_initialize("orb", name, gpu = False)
+
+    forces_ref = np.zeros((len(llzo), 3))
+    energy_ref = reference.gnnp_compute_into(llzo.cell.array, llzo.numbers, llzo.positions, forces_ref, vflag = 0)
+
+    driver = load()
+    driver.gnnp_initialize("orb", name, gpu = False)
+
+    # neighbor 2.0 bin of LAMMPS
+    ilist, jlist, shifts = half_list(llzo, 6.0 + 2.0)
+
+    forces = np.zeros((len(llzo), 3))
+    energy = driver.gnnp_compute_with_neighbors(llzo.cell.array, llzo.numbers, llzo.positions,
+                                                ilist, jlist, shifts, forces, half_list = True, vflag = 0)
+
+    # pairs are used as the graph, only if its forces pass the check against the calculator of GNNP
+    assert driver.myGraphPath
+    assert driver.myGraphCheck["accepted"]
+
+    assert energy == pytest.approx(energy_ref, rel = 1.0e-5)
+    np.testing.assert_allclose(forces, forces_ref, atol = 1.0e-5)
@@ -0,0 +1,31 @@
+"""
+Tests of the backend "orb-onnx", on small ORB models with random weights.
+"""
+
+import os
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("orb_models")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+LAMMPS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_parity_of_direct_model(tiny_orb):
+    from gnnp_onnx import check_parity
+
+    errors = check_parity(os.path.join(LAMMPS_DIR, "1000", "cubic-LLZO.data"), tiny_orb(direct = True))
+
+    # ONNX Runtime is used, not the fallback to torch
+    assert errors["calculator"] == "ONNXCalculator"
+
+    assert errors["energy"] < 1.0e-3
+    assert errors["forces"] < 1.0e-4
+    assert errors["stress"] < 1.0e-5
+
+def test_conservative_model_is_refused(load, tiny_orb):
+    driver = load()
+
+    with pytest.raises(ValueError):
+        driver.gnnp_initialize("orb-onnx", tiny_orb(), gpu = False)
@@ -0,0 +1,79 @@
+"""
+Tests of the cache of results of gnnp_driver, keyed by cell, atomic numbers and quantized positions.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("orb_models")
+
+def compute(driver, atoms, shift = 0.0, with_stress = False):
+    return driver.gnnp_get_energy_forces_stress(atoms.cell.array, atoms.numbers, atoms.positions + shift, with_stress)
+
+def test_repeated_frame_is_hit(load, llzo, tiny_orb):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False, result_cache = 2)
+
+    energy, forces         = compute(driver, llzo)
+    energy_hit, forces_hit = compute(driver, llzo)
+
+    assert energy_hit == energy
+    assert forces_hit == forces
+    assert driver.gnnp_get_cache_stats()["hits"]   == 1
+    assert driver.gnnp_get_cache_stats()["misses"] == 1
+
+def test_result_without_stress_is_missed(load, llzo, tiny_orb):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False, result_cache = 2)
+
+    compute(driver, llzo)
+
+    _, _, stress = compute(driver, llzo, with_stress = True)
+
+    assert len(stress) == 6
+    assert driver.gnnp_get_cache_stats()["misses"] == 2
+
+    # the result with stress replaces the one w/o stress, and serves both
+    compute(driver, llzo)
+    compute(driver, llzo, with_stress = True)
+
+    assert driver.gnnp_get_cache_stats()["hits"] == 2
+    assert driver.gnnp_get_cache_stats()["size"] == 1
+
+def test_least_recently_used_is_evicted(load, llzo, tiny_orb):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False, result_cache = 2)
+
+    compute(driver, llzo, 0.0)
+    compute(driver, llzo, 0.1)
+    compute(driver, llzo, 0.0)   # hit, so that 0.1 is the least recently used
+    compute(driver, llzo, 0.2)   # evicts 0.1
+
+    assert driver.gnnp_get_cache_stats()["size"] == 2
+
+    compute(driver, llzo, 0.0)
+    compute(driver, llzo, 0.2)
+    compute(driver, llzo, 0.1)
+
+    stats = driver.gnnp_get_cache_stats()
+
+    assert stats["hits"]   == 3
+    assert stats["misses"] == 4
+    assert stats["size"]   == 2
+
+def test_fallback_of_precision_clears_cache(load, llzo, tiny_orb):
+    driver = load()
+    driver.gnnp_initialize("orb", tiny_orb(), gpu = False, result_cache = 2, precision = "float32-high")
+
+    compute(driver, llzo)
+
+    # results of the refused precision are not served any more
+    driver._fall_back_precision("float64")
+
+    assert driver.gnnp_get_cache_stats()["size"] == 0
+
+    compute(driver, llzo)
+
+    assert driver.gnnp_get_cache_stats()["hits"] == 0
+    assert driver.myPrecision["precision"] == "float64"
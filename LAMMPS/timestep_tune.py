@@ -0,0 +1,278 @@
+"""
+Timestep of the production run of in_LLZO, tuned by short NVE probes w/ GNNP.
+
+For each temperature, the structure is equilibrated by NVT at 1 fs, and then the same state is run by NVE
+with each of the candidate timesteps. All probes are advanced together as one batch of replicas
+(gnnp_compute_batch of gnnp_driver.py), for the same number of steps. For each probe,
+    drift    linear drift of the total energy, in eV/atom/ps
+    T_Li/T   ratio of the kinetic temperature of Li to that of all atoms (equipartition of the light Li)
+    KS       Kolmogorov-Smirnov distance of velocity components of Li from Maxwell-Boltzmann at T
+are measured, and the largest timestep, whose probe and those of all smaller timesteps are within tolerances
+(T_Li/T and KS relative to the smallest timestep), is recommended as -var dt of in_LLZO.
+
+Usage (from LAMMPS):
+    python timestep_tune.py --data 1000/cubic-LLZO.data --temperatures 500 1000 --timesteps 0.5 1.0 1.5 2.0
+    lmp -in in_LLZO -var dt 0.0015
+"""
+
+import argparse
+import json
+import os
+import numpy as np
+from scipy.special import ndtr
+
+from replica_md import NoseHooverChains, create_velocities, kinetic_energies, load_driver, read_data
+
+_BOLTZ = 8.617343e-5        # eV/K, as units metal of LAMMPS
+_MVV2E = 1.0364269e-4       # amu * (A/ps)^2 -> eV
+_FTM2V = 1.0 / _MVV2E       # eV/A/amu -> A/ps^2
+
+_DRIFT_TOLERANCE = 1.0e-4   # eV/atom/ps
+_RATIO_TOLERANCE = 0.05
+_KS_TOLERANCE    = 0.02
+
+_SAMPLE_EVERY = 10
+
+def equilibrate(driver, atoms, temperatures, steps, seed = 12345, timestep = 0.001, tdamp = 0.1):
+    """
+    Equilibrate the structure by NVT at each temperature, as one batch.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): starting structure.
+        temperatures (list): temperatures in K.
+        steps (int): number of timesteps.
+        seed (int): seed of velocities.
+        timestep (float): timestep in ps.
+        tdamp (float): damping time of thermostat in ps.
+    Returns:
+        positions (ndarray): positions, shape (ntemp, natom, 3).
+        velocities (ndarray): velocities in A/ps, shape (ntemp, natom, 3).
+    """
+
+    ntemp = len(temperatures)
+    tdof  = 3 * len(atoms) - 3
+
+    masses  = atoms.get_masses()
+    numbers = np.repeat(atoms.numbers[None], ntemp, axis = 0)
+    cells   = np.repeat(atoms.cell.array[None], ntemp, axis = 0)
+
+    positions  = np.repeat(atoms.positions[None], ntemp, axis = 0)
+    velocities = np.array([create_velocities(masses, t, seed) for t in temperatures])
+
+    thermostat = NoseHooverChains(temperatures, tdof, tdamp)
+    accel      = _FTM2V / masses[None, :, None]
+
+    _, forces = _compute_forces(driver, cells, numbers, positions)
+
+    for _ in range(steps):
+        velocities *= thermostat.half_step(kinetic_energies(masses, velocities), timestep)[:, None, None]
+
+        velocities += 0.5 * timestep * forces * accel
+        positions  += timestep * velocities
+
+        _, forces = _compute_forces(driver, cells, numbers, positions)
+
+        velocities += 0.5 * timestep * forces * accel
+
+        velocities *= thermostat.half_step(kinetic_energies(masses, velocities), timestep)[:, None, None]
+
+    return positions, velocities
+
+def probe(driver, atoms, positions, velocities, timesteps, steps):
+    """
+    Run NVE probes of all states and timesteps, as one batch.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        atoms (Atoms): structure, for cell, atomic numbers and masses.
+        positions (ndarray): starting positions of probes, shape (nprobe, natom, 3).
+        velocities (ndarray): starting velocities of probes, shape (nprobe, natom, 3).
+        timesteps (ndarray): timesteps of probes in ps, shape (nprobe,).
+        steps (int): number of timesteps of each probe.
+    Returns:
+        results (list): drift, ratio of temperature of Li, and KS distance of each probe.
+    """
+
+    nprobe = len(timesteps)
+    natom  = len(atoms)
+
+    masses  = atoms.get_masses()
+    numbers = np.repeat(atoms.numbers[None], nprobe, axis = 0)
+    cells   = np.repeat(atoms.cell.array[None], nprobe, axis = 0)
+    lithium = atoms.numbers == 3
+
+    positions  = positions.copy()
+    velocities = velocities.copy()
+
+    dt    = np.asarray(timesteps)[:, None, None]
+    accel = _FTM2V / masses[None, :, None]
+
+    times    = []
+    energies = []
+    temps    = []
+    temps_li = []
+    samples  = []
+
+    energy, forces = _compute_forces(driver, cells, numbers, positions)
+
+    for step in range(steps + 1):
+        if step > 0:
+            velocities += 0.5 * dt * forces * accel
+            positions  += dt * velocities
+
+            energy, forces = _compute_forces(driver, cells, numbers, positions)
+
+            velocities += 0.5 * dt * forces * accel
+
+        if step % _SAMPLE_EVERY == 0:
+            ke    = kinetic_energies(masses, velocities)
+            ke_li = kinetic_energies(masses[lithium], velocities[:, lithium])
+
+            times   .append(step * np.asarray(timesteps))
+            energies.append(energy + ke)
+            temps   .append(2.0 * ke / ((3 * natom - 3) * _BOLTZ))
+            temps_li.append(2.0 * ke_li / (3 * np.count_nonzero(lithium) * _BOLTZ))
+            samples .append(velocities[:, lithium].reshape(nprobe, -1))
+
+    times    = np.array(times).T
+    energies = np.array(energies).T
+    temps    = np.array(temps).T
+    temps_li = np.array(temps_li).T
+    samples  = np.concatenate(samples, axis = 1)
+
+    results = []
+
+    for iprobe in range(nprobe):
+        drift       = np.polyfit(times[iprobe], energies[iprobe], 1)[0] / natom
+        temperature = temps[iprobe].mean()
+
+        # velocity components of Li, in units of the width of Maxwell-Boltzmann at the temperature
+        scaled = np.sort(samples[iprobe] * np.sqrt(_MVV2E * masses[lithium][0] / (_BOLTZ * temperature)))
+        ecdf   = np.arange(1, len(scaled) + 1) / len(scaled)
+        ks     = np.max(np.maximum(np.abs(ecdf - ndtr(scaled)), np.abs(ecdf - 1.0 / len(scaled) - ndtr(scaled))))
+
+        results.append({
+            "timestep":    float(timesteps[iprobe]),
+            "drift":       float(drift),
+            "temperature": float(temperature),
+            "ratio_li":    float(temps_li[iprobe].mean() / temperature),
+            "ks_li":       float(ks)
+        })
+
+    return results
+
+def recommend(results, drift_tolerance = _DRIFT_TOLERANCE, ratio_tolerance = _RATIO_TOLERANCE,
+              ks_tolerance = _KS_TOLERANCE):
+    """
+    Recommend the largest safe timestep of probes of a temperature.
+    Args:
+        results (list): results of probes, from probe.
+        drift_tolerance (float): tolerance of |drift| in eV/atom/ps.
+        ratio_tolerance (float): tolerance of T_Li/T, relative to the smallest timestep.
+        ks_tolerance (float): tolerance of KS distance, relative to the smallest timestep.
+    Returns:
+        timestep (float): recommended timestep in ps, or None if even the smallest one fails.
+    """
+
+    results   = sorted(results, key = lambda result: result["timestep"])
+    reference = results[0]
+    timestep  = None
+
+    for result in results:
+        result["safe"] = (
+            abs(result["drift"]) <= drift_tolerance and
+            abs(result["ratio_li"] - reference["ratio_li"]) <= ratio_tolerance and
+            result["ks_li"] - reference["ks_li"] <= ks_tolerance
+        )
+
+        if not result["safe"]:
+            break
+
+        timestep = result["timestep"]
+
+    return timestep
+
+def _compute_forces(driver, cells, numbers, positions):
+    """
+    Compute energies and forces of replicas as one batch.
+    Args:
+        driver (module): gnnp_driver, that is initialized.
+        cells (ndarray): lattice vectors, shape (nreplica, 3, 3).
+        numbers (ndarray): atomic numbers, shape (nreplica, natom).
+        positions (ndarray): positions, shape (nreplica, natom, 3).
+    Returns:
+        energies (ndarray): energies, shape (nreplica,).
+        forces (ndarray): forces, shape (nreplica, natom, 3).
+    """
+
+    results = driver.gnnp_compute_batch(cells, numbers, positions)
+
+    return np.array([energy for energy, _, _ in results]), np.array([forces for _, forces, _ in results])
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description = "Timestep of in_LLZO, tuned by NVE probes of energy drift and Li velocities.")
+    parser.add_argument("--data", default = os.path.join(base_dir, "1000", "cubic-LLZO.data"), help = "LAMMPS data file.")
+    parser.add_argument("--temperatures", type = float, nargs = "+", default = [500, 600, 700, 800, 900, 1000], help = "temperatures in K.")
+    parser.add_argument("--timesteps", type = float, nargs = "+", default = [0.5, 1.0, 1.5, 2.0, 2.5], help = "candidate timesteps in fs.")
+    parser.add_argument("--equil", type = int, default = 2000, help = "timesteps of NVT at 1 fs before probes.")
+    parser.add_argument("--steps", type = int, default = 2000, help = "timesteps of each NVE probe.")
+    parser.add_argument("--drift-tol", type = float, default = _DRIFT_TOLERANCE, help = "tolerance of energy drift in eV/atom/ps.")
+    parser.add_argument("--ratio-tol", type = float, default = _RATIO_TOLERANCE, help = "tolerance of T_Li/T.")
+    parser.add_argument("--ks-tol", type = float, default = _KS_TOLERANCE, help = "tolerance of KS distance of Li velocities.")
+    parser.add_argument("--gnnp-type", default = "orb", help = "type of GNNP.")
+    parser.add_argument("--model", default = "orb-v3-conservative-inf-omat", help = "name of model.")
+    parser.add_argument("--driver", default = os.path.join(base_dir, "1000", "gnnp_driver.py"), help = "path of gnnp_driver.py.")
+    parser.add_argument("--cpu", action = "store_true", help = "not to use GPU.")
+    parser.add_argument("--json", default = None, help = "path of JSON file to write results into.")
+    args = parser.parse_args()
+
+    driver = load_driver(args.driver)
+    driver.gnnp_initialize(args.gnnp_type, args.model, gpu = not args.cpu)
+
+    atoms = read_data(args.data)
+
+    positions, velocities = equilibrate(driver, atoms, args.temperatures, args.equil)
+
+    # probes of all temperatures and timesteps, starting from the equilibrated state of each temperature
+    ntimestep = len(args.timesteps)
+    timesteps = np.tile(np.array(args.timesteps) * 1.0e-3, len(args.temperatures))
+
+    results = probe(
+        driver,
+        atoms,
+        np.repeat(positions, ntimestep, axis = 0),
+        np.repeat(velocities, ntimestep, axis = 0),
+        timesteps,
+        args.steps
+    )
+
+    report = {}
+
+    print("%8s %8s %14s %10s %8s %8s %5s" % ("T(K)", "dt(fs)", "drift(eV/at/ps)", "T(K)", "T_Li/T", "KS_Li", "safe"))
+
+    for itemp, temperature in enumerate(args.temperatures):
+        probes   = results[itemp * ntimestep:(itemp + 1) * ntimestep]
+        timestep = recommend(probes, args.drift_tol, args.ratio_tol, args.ks_tol)
+
+        for result in probes:
+            print("%8.0f %8.2f %14.3e %10.1f %8.3f %8.4f %5s" % (
+                temperature, result["timestep"] * 1.0e3, result["drift"], result["temperature"],
+                result["ratio_li"], result["ks_li"], result.get("safe", False)))
+
+        report[str(int(temperature))] = {"timestep": timestep, "probes": probes}
+
+    print()
+
+    for temperature, entry in report.items():
+        if entry["timestep"] is None:
+            print("# %s K: no candidate timestep is safe" % temperature)
+        else:
+            print("# %s K: lmp -in in_LLZO -var dt %g" % (temperature, entry["timestep"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+    main()